@@ -0,0 +1,310 @@
+"""
+Approximate-nearest-neighbour index selection for LlamaDoc AI
+
+Small PDFs keep an exact flat index. Once an index holds at least
+ANN_MIN_CHUNKS vectors it is rebuilt as HNSW or IVF, optionally with scalar
+(SQ8) or product (PQ) quantization to shrink memory. Search breadth
+(efSearch for HNSW, nprobe for IVF) can be set per query.
+
+Deleted vectors are tombstoned (excluded from search with an ID selector)
+and physically removed by compact_vector, which also re-picks the index
+type for the new size.
+"""
+import math
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+ANN_MIN_CHUNKS = int(os.environ.get("ANN_MIN_CHUNKS", "20000"))  # below this, stay exact (flat)
+ANN_INDEX_TYPE = os.environ.get("ANN_INDEX_TYPE", "hnsw").lower()  # 'hnsw' or 'ivf'
+ANN_QUANTIZATION = os.environ.get("ANN_QUANTIZATION", "none").lower()  # 'none', 'sq8' or 'pq'
+ANN_HNSW_M = int(os.environ.get("ANN_HNSW_M", "32"))
+ANN_EF_SEARCH = int(os.environ.get("ANN_EF_SEARCH", "64"))
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", "16"))
+MAX_EF_SEARCH = 4096  # per-query upper bounds; larger values only cost time
+MAX_NPROBE = 4096
+
+# Per-query presets for {"recall": "..."} in place of explicit nprobe/ef_search
+RECALL_PRESETS = {
+    "fast": {"ef_search": 16, "nprobe": 4},
+    "balanced": {"ef_search": ANN_EF_SEARCH, "nprobe": ANN_NPROBE},
+    "high": {"ef_search": 256, "nprobe": 64},
+}
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """Largest of 64/48/32/16/8 sub-quantizers that divides the dimension"""
+    for m in (64, 48, 32, 16, 8):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def index_description(n: int, dim: int, index_type: str = ANN_INDEX_TYPE,
+                      quantization: str = ANN_QUANTIZATION) -> str:
+    """faiss.index_factory string for `n` vectors of dimension `dim`"""
+    if n < ANN_MIN_CHUNKS or index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        # HNSW graphs can sit on flat or SQ8 storage; PQ falls back to SQ8 here
+        storage = "SQ8" if quantization in ("sq8", "pq") else "Flat"
+        return f"HNSW{ANN_HNSW_M},{storage}" if storage != "Flat" else f"HNSW{ANN_HNSW_M}"
+    if index_type == "ivf":
+        nlist = max(1, int(4 * math.sqrt(n)))
+        if quantization == "pq":
+            return f"IVF{nlist},PQ{_pq_subquantizers(dim)}"
+        if quantization == "sq8":
+            return f"IVF{nlist},SQ8"
+        return f"IVF{nlist},Flat"
+    raise ValueError(f"Unknown ANN index type: {index_type!r}")
+
+
+def build_faiss_index(vectors: np.ndarray, description: str) -> faiss.Index:
+    """Train (if needed) and fill an index described by `description`"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(vectors.shape[1], description)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    apply_search_params(index, ef_search=ANN_EF_SEARCH, nprobe=ANN_NPROBE)
+    return index
+
+
+def index_vectors(index: faiss.Index) -> np.ndarray:
+    """Return every stored vector of a FAISS index in position order"""
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        ivf.make_direct_map()
+    except RuntimeError:
+        pass  # not an IVF index
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def is_flat(index: faiss.Index) -> bool:
+    return isinstance(index, faiss.IndexFlat)
+
+
+def is_lossy(index: faiss.Index) -> bool:
+    """True when vectors are stored quantized (PQ/SQ8): reconstruct() then only
+    returns approximations, and re-encoding those loses a little more recall"""
+    index = faiss.downcast_index(index)
+    if hasattr(index, "hnsw"):
+        return not isinstance(faiss.downcast_index(index.storage), faiss.IndexFlat)
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return not isinstance(index, faiss.IndexFlat)
+    return not isinstance(faiss.downcast_index(ivf), faiss.IndexIVFFlat)
+
+
+def optimize_index(vector: Optional[FAISS]) -> Optional[FAISS]:
+    """Swap a large flat index for the configured ANN type (docstore is kept as is)"""
+    if vector is None or not is_flat(vector.index):
+        return vector
+    description = index_description(vector.index.ntotal, vector.index.d)
+    if description == "Flat":
+        return vector
+    vector.index = build_faiss_index(index_vectors(vector.index), description)
+    print(f"✅ Rebuilt index with {vector.index.ntotal} vectors as {description}")
+    return vector
+
+
+def apply_search_params(index: faiss.Index, ef_search: Optional[int] = None,
+                        nprobe: Optional[int] = None) -> None:
+    """Set the default search breadth stored on the index itself"""
+    if ef_search and hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    if nprobe:
+        try:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+        except RuntimeError:
+            pass
+
+
+class ReadWriteLock:
+    """
+    Many concurrent readers or one writer. `with lock:` takes the write side
+    (re-entrant for the writing thread), `with lock.read():` the shared side.
+    Waiting writers block new readers, so updates are not starved by a steady
+    stream of searches.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer: Optional[int] = None
+        self._depth = 0
+        self._writers_waiting = 0
+
+    def acquire(self) -> bool:
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._depth += 1
+                return True
+            self._writers_waiting += 1
+            try:
+                self._cond.wait_for(lambda: self._writer is None and self._readers == 0)
+            finally:
+                self._writers_waiting -= 1
+            self._writer, self._depth = me, 1
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self._depth -= 1
+            if not self._depth:
+                self._writer = None
+                self._cond.notify_all()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+    def is_write_locked(self) -> bool:
+        """True when the calling thread holds the write side"""
+        return self._writer == threading.get_ident()
+
+    @contextmanager
+    def read(self):
+        if self.is_write_locked():
+            # The writer may read what it is changing
+            yield
+            return
+        with self._cond:
+            self._cond.wait_for(lambda: self._writer is None and not self._writers_waiting)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+
+class Tombstones:
+    """Positions of deleted vectors in one index, excluded from search until compaction"""
+
+    def __init__(self, positions: Iterable[int] = ()):
+        self.positions: Set[int] = set(positions)
+        self._selector = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def add(self, positions: Iterable[int]) -> None:
+        with self._lock:
+            self.positions = self.positions | set(positions)
+            self._selector = None
+
+    def reset(self, positions: Iterable[int] = ()) -> None:
+        with self._lock:
+            self.positions = set(positions)
+            self._selector = None
+
+    def selector(self):
+        """faiss selector accepting every id except the tombstoned ones (None if there are none)"""
+        with self._lock:
+            if not self.positions:
+                return None
+            if self._selector is None:
+                # The batch selector must outlive the Not() wrapping it, so keep both
+                batch = faiss.IDSelectorBatch(np.fromiter(sorted(self.positions), dtype=np.int64))
+                self._selector = (batch, faiss.IDSelectorNot(batch))
+            return self._selector[1]
+
+
+def search_parameters(index: faiss.Index, ef_search: Optional[int] = None,
+                      nprobe: Optional[int] = None, selector=None):
+    """Per-call search parameters, so concurrent queries can use different settings"""
+    extra = {"sel": selector} if selector is not None else {}
+    if hasattr(index, "hnsw"):
+        if ef_search:
+            return faiss.SearchParametersHNSW(efSearch=ef_search, **extra)
+        if selector is not None:
+            return faiss.SearchParametersHNSW(efSearch=index.hnsw.efSearch, **extra)
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        if nprobe:
+            return faiss.SearchParametersIVF(nprobe=nprobe, **extra)
+        if selector is not None:
+            return faiss.SearchParametersIVF(nprobe=ivf.nprobe, **extra)
+    except RuntimeError:
+        pass
+    if selector is not None:
+        return faiss.SearchParameters(**extra)
+    return None
+
+
+def resolve_search_options(options: Optional[dict]) -> dict:
+    """Turn {"recall": "...", "ef_search": n, "nprobe": n} into explicit settings
+
+    Raises ValueError for an unknown preset or an out-of-range number.
+    """
+    if not options:
+        return {}
+    settings = {}
+    recall = options.get("recall")
+    if recall is not None:
+        if recall not in RECALL_PRESETS:
+            raise ValueError(f"recall must be one of {', '.join(RECALL_PRESETS)}")
+        settings.update(RECALL_PRESETS[recall])
+    for name, high in (("ef_search", MAX_EF_SEARCH), ("nprobe", MAX_NPROBE)):
+        value = options.get(name)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            raise ValueError(f"{name} must be an integer")
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValueError(f"{name} must be an integer")
+        if not 1 <= value <= high:
+            raise ValueError(f"{name} must be between 1 and {high}")
+        settings[name] = value
+    return settings
+
+
+def batch_search_ids(vector: FAISS, embeddings: List[List[float]], k: int,
+                     ef_search: Optional[int] = None,
+                     nprobe: Optional[int] = None,
+                     tombstones: Optional[Tombstones] = None) -> List[List[Tuple[str, float]]]:
+    """One FAISS search for many query vectors with per-call efSearch/nprobe,
+    skipping tombstoned vectors; returns (docstore id, distance) lists per query"""
+    queries = np.asarray(embeddings, dtype=np.float32)
+    selector = tombstones.selector() if tombstones is not None else None
+    params = search_parameters(vector.index, ef_search, nprobe, selector)
+    if params is not None:
+        distances, positions = vector.index.search(queries, k, params=params)
+    else:
+        distances, positions = vector.index.search(queries, k)
+    return [
+        [
+            (vector.index_to_docstore_id[int(position)], float(distance))
+            for distance, position in zip(row_distances, row_positions)
+            if position != -1
+        ]
+        for row_distances, row_positions in zip(distances, positions)
+    ]
+
+
+def rebuild_without(vectors: np.ndarray, index_to_docstore_id: dict,
+                    dead: Set[int]) -> Tuple[faiss.Index, dict, List[str]]:
+    """
+    Build a replacement index from `vectors` (all stored vectors, in position
+    order) without the `dead` positions, sized for what remains. Returns
+    (index, new position -> docstore id map, docstore ids that were dropped).
+    """
+    live = [p for p in range(len(vectors)) if p not in dead]
+    index = build_faiss_index(vectors[live], index_description(len(live), vectors.shape[1]))
+    new_map = {i: index_to_docstore_id[p] for i, p in enumerate(live)}
+    dropped = [index_to_docstore_id[p] for p in sorted(dead) if p in index_to_docstore_id]
+    return index, new_map, dropped
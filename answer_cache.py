@@ -0,0 +1,170 @@
+"""
+Semantic answer cache for LlamaDoc AI
+
+Answers are cached per upload_id and retrieval settings (see
+retrieval.settings_key), so a request with reranking or a different k never
+gets an answer produced without it. A lookup first tries the normalized
+question text, then falls back to cosine similarity against the embeddings
+of questions already answered for that PDF with the same settings.
+
+Every upload has a generation number that invalidate() bumps. Callers take
+it before retrieving and pass it to put(), so an answer computed from an
+index that changed in the meantime is never stored.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "2000"))  # total cached answers, 0 = off
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", "86400"))  # seconds
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0.95"))  # cosine threshold
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case, drop punctuation and collapse whitespace"""
+    text = _PUNCTUATION_RE.sub(" ", question.lower())
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+class AnswerCache:
+    """
+    Bounded (LRU) cache of formatted answers and sources with a TTL.
+    Keys are (upload_id, settings key, normalized question); each entry also
+    keeps the unit-normalized question embedding for similarity matches.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE,
+                 ttl_seconds: float = ANSWER_CACHE_TTL,
+                 similarity: float = ANSWER_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self._entries: "OrderedDict[Tuple[str, str, str], dict]" = OrderedDict()
+        self._by_upload: Dict[str, List[Tuple[str, str, str]]] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def generation(self, upload_id: str) -> int:
+        """Current generation of an upload; take it before retrieving and pass it to put()"""
+        with self._lock:
+            return self._generations.get(upload_id, 0)
+
+    def get(self, upload_id: str, question: str, embedding=None, settings: str = "") -> Optional[dict]:
+        """Return {"answer", "sources", "match", "similarity"} or None"""
+        if not self.enabled:
+            return None
+        key = (upload_id, settings, normalize_question(question))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry["created_at"] > self.ttl_seconds:
+                del self._entries[key]
+                self._forget(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return {"answer": entry["answer"], "sources": entry["sources"], "match": "exact", "similarity": 1.0}
+
+            if embedding is not None:
+                best_key, best_score = None, self.similarity
+                query = self._unit(embedding)
+                for candidate in self._by_upload.get(upload_id, []):
+                    if candidate[1] != settings:
+                        continue
+                    cached = self._entries.get(candidate)
+                    if cached is None or cached["embedding"] is None:
+                        continue
+                    if now - cached["created_at"] > self.ttl_seconds:
+                        continue
+                    score = float(np.dot(query, cached["embedding"]))
+                    if score >= best_score:
+                        best_key, best_score = candidate, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    cached = self._entries[best_key]
+                    return {"answer": cached["answer"], "sources": cached["sources"],
+                            "match": "semantic", "similarity": round(best_score, 4)}
+
+            self.misses += 1
+            return None
+
+    def put(self, upload_id: str, question: str, answer: dict, sources: list, embedding=None,
+            settings: str = "", generation: Optional[int] = None) -> bool:
+        """Cache an answer; skipped (False) when the index changed since `generation`"""
+        if not self.enabled:
+            return False
+        key = (upload_id, settings, normalize_question(question))
+        with self._lock:
+            if generation is not None and generation != self._generations.get(upload_id, 0):
+                return False
+            if key not in self._entries:
+                self._by_upload.setdefault(upload_id, []).append(key)
+            self._entries[key] = {
+                "answer": answer,
+                "sources": sources,
+                "embedding": self._unit(embedding) if embedding is not None else None,
+                "created_at": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._forget(old_key)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, upload_id: str) -> None:
+        """Drop every cached answer for an upload (call whenever its index changes)"""
+        with self._lock:
+            for key in self._by_upload.pop(upload_id, []):
+                self._entries.pop(key, None)
+            self._generations[upload_id] = self._generations.get(upload_id, 0) + 1
+            self.invalidations += 1
+
+    def _forget(self, key: Tuple[str, str, str]) -> None:
+        keys = self._by_upload.get(key[0])
+        if keys:
+            keys.remove(key)
+            if not keys:
+                del self._by_upload[key[0]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "similarity_threshold": self.similarity,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
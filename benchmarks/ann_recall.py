@@ -0,0 +1,101 @@
+"""
+Recall/latency benchmark of ANN index types against exact flat search
+
+Usage:
+    python benchmarks/ann_recall.py --upload-id <upload_id>   # vectors of an indexed PDF
+    python benchmarks/ann_recall.py --synthetic 50000         # random vectors
+
+Queries are stored vectors with a little noise added; ground truth is an
+exact IndexFlatL2 search. For every index type and search breadth the
+script prints recall@k and mean latency per query.
+"""
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann import build_faiss_index, index_vectors, search_parameters  # noqa: E402
+
+CONFIGS = [
+    ("HNSW32", "ef_search", [16, 32, 64, 128, 256]),
+    ("HNSW32,SQ8", "ef_search", [16, 32, 64, 128, 256]),
+    ("IVF{nlist},Flat", "nprobe", [1, 4, 16, 64]),
+    ("IVF{nlist},SQ8", "nprobe", [1, 4, 16, 64]),
+    ("IVF{nlist},PQ{m}", "nprobe", [1, 4, 16, 64]),
+]
+
+
+def load_vectors(args) -> np.ndarray:
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        return rng.standard_normal((args.synthetic, args.dim)).astype(np.float32)
+    from index_store import load_index
+    vector = load_index(args.upload_id)
+    if vector is None:
+        sys.exit(f"No index found for upload_id {args.upload_id}")
+    return index_vectors(vector.index)
+
+
+def timed_search(index, queries, k, params=None):
+    start = time.perf_counter()
+    if params is not None:
+        _, ids = index.search(queries, k, params=params)
+    else:
+        _, ids = index.search(queries, k)
+    return ids, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--upload-id")
+    source.add_argument("--synthetic", type=int, help="number of random vectors")
+    parser.add_argument("--dim", type=int, default=384, help="dimension for --synthetic")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    vectors = np.ascontiguousarray(load_vectors(args), dtype=np.float32)
+    n, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    sample = vectors[rng.choice(n, size=min(args.queries, n), replace=False)]
+    queries = (sample + rng.normal(0, 0.01, sample.shape)).astype(np.float32)
+
+    flat = faiss.IndexFlatL2(dim)
+    flat.add(vectors)
+    truth, flat_ms = timed_search(flat, queries, args.k)
+    print(f"{n} vectors, dim {dim}, {len(queries)} queries, k={args.k}")
+    print(f"{'index':<24}{'setting':<16}{'recall':>8}{'ms/query':>10}{'speedup':>9}")
+    print(f"{'Flat (exact)':<24}{'-':<16}{1.0:>8.3f}{flat_ms:>10.3f}{1.0:>9.1f}")
+
+    nlist = max(1, int(4 * np.sqrt(n)))
+    m = next(m for m in (64, 48, 32, 16, 8, 1) if dim % m == 0)
+    for template, knob, values in CONFIGS:
+        description = template.format(nlist=nlist, m=m)
+        try:
+            start = time.perf_counter()
+            index = build_faiss_index(vectors, description)
+            build_s = time.perf_counter() - start
+        except RuntimeError as e:
+            print(f"{description:<24}skipped: {e}")
+            continue
+        for value in values:
+            params = search_parameters(index, **{knob: value})
+            found, ms = timed_search(index, queries, args.k, params)
+            print(f"{description:<24}{f'{knob}={value}':<16}{recall_at_k(found, truth):>8.3f}"
+                  f"{ms:>10.3f}{flat_ms / ms if ms else 0:>9.1f}")
+        print(f"{'':<24}(built in {build_s:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+PDF text extraction throughput (pages/s) per extractor backend
+
+Usage:
+    python benchmarks/extract_speed.py samples/                 # every PDF in a directory
+    python benchmarks/extract_speed.py a.pdf b.pdf --workers 4  # explicit files
+
+For every installed backend the script extracts the whole corpus once in a
+single process and once split into page ranges over a process pool (the
+way ingestion does it), and prints pages per second for both.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extractors import EXTRACTORS, page_ranges  # noqa: E402
+
+
+def collect_pdfs(paths):
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(path.rglob("*.pdf")))
+        else:
+            files.append(path)
+    return [str(f) for f in files]
+
+
+def extract_range(name, file_path, start, stop):
+    return sum(1 for _ in EXTRACTORS[name]().extract(file_path, start, stop))
+
+
+def run_serial(name, files):
+    backend = EXTRACTORS[name]()
+    pages = 0
+    for file_path in files:
+        pages += sum(1 for _ in backend.extract(file_path, 0, backend.page_count(file_path)))
+    return pages
+
+
+def run_parallel(name, files, workers, per_task):
+    backend = EXTRACTORS[name]()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(extract_range, name, file_path, pages.start, pages.stop)
+            for file_path in files
+            for pages in page_ranges(backend.page_count(file_path), per_task)
+        ]
+        return sum(f.result() for f in futures)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    pages = fn(*args)
+    return pages, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="PDF files or directories")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--pages-per-task", type=int, default=16)
+    parser.add_argument("--backends", nargs="+", default=list(EXTRACTORS), choices=list(EXTRACTORS))
+    args = parser.parse_args()
+
+    files = collect_pdfs(args.paths)
+    if not files:
+        sys.exit("No PDF files found")
+    print(f"{len(files)} PDFs, {args.workers} workers, {args.pages_per_task} pages per task")
+    print(f"{'backend':<12}{'mode':<10}{'pages':>8}{'seconds':>10}{'pages/s':>10}")
+    for name in args.backends:
+        if not EXTRACTORS[name].available():
+            print(f"{name:<12}skipped: not installed")
+            continue
+        for mode, fn, extra in (("serial", run_serial, ()),
+                                ("parallel", run_parallel, (args.workers, args.pages_per_task))):
+            pages, seconds = timed(fn, name, files, *extra)
+            print(f"{name:<12}{mode:<10}{pages:>8}{seconds:>10.2f}{pages / seconds if seconds else 0:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Bulk PDF ingestion for LlamaDoc AI
+
+Loads many PDFs in one run (POST /upload/bulk and `python main.py ingest`).
+Page ranges of all documents share the extraction process pool, and chunks
+from different documents are embedded together in large batches
+(BULK_EMBED_BATCH texts per model call), which keeps the CPU busy with
+length-sorted batches instead of one small batch per page range.
+
+Every run has a JSON checkpoint under BULK_DIR listing its files, the
+upload_id each one was given and which are finished. It is rewritten after
+every document, so an interrupted run resumes with the documents that were
+not done and keeps the upload_ids it already handed out.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from ann import optimize_index
+from embeddings import get_embedder
+from extractors import page_ranges
+from ingestion import INGEST_QUEUE_BATCHES, IngestionPool, count_pages, extract_chunks
+
+BULK_DIR = Path(os.environ.get("BULK_DIR", "uploads/bulk"))
+BULK_EMBED_BATCH = int(os.environ.get("BULK_EMBED_BATCH", "256"))  # texts per embedding call, across documents
+HASH_READ_CHUNK = 1024 * 1024
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(HASH_READ_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def checkpoint_path(batch_id: str) -> Path:
+    return BULK_DIR / f"{batch_id}.json"
+
+
+def _rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 2) if seconds else 0.0
+
+
+class BulkCheckpoint:
+    """Manifest and progress of one bulk run, saved as JSON after every finished document"""
+
+    def __init__(self, path: Path, batch_id: Optional[str] = None, extractor: Optional[str] = None):
+        self.path = Path(path)
+        self.batch_id = batch_id or self.path.stem
+        self.extractor = extractor  # PDF text extractor for every run, None = default
+        self.items: List[dict] = []  # {"file_path", "filename", "sha256", "upload_id"}
+        self.done: Dict[str, dict] = {}  # upload_id -> {"pages", "chunks"} or {"deduplicated": owner}
+        self.failed: Dict[str, str] = {}  # upload_id -> error of the last attempt
+        self.pages = 0
+        self.chunks = 0
+        self.seconds = 0.0  # summed over all runs of this checkpoint
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path) -> "BulkCheckpoint":
+        """Read a checkpoint, or start an empty one when the file does not exist"""
+        checkpoint = cls(path)
+        if checkpoint.path.exists():
+            with open(checkpoint.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            checkpoint.batch_id = data.get("batch_id", checkpoint.batch_id)
+            checkpoint.extractor = data.get("extractor")
+            checkpoint.items = data.get("items", [])
+            checkpoint.done = data.get("done", {})
+            checkpoint.failed = data.get("failed", {})
+            checkpoint.pages = data.get("pages", 0)
+            checkpoint.chunks = data.get("chunks", 0)
+            checkpoint.seconds = data.get("seconds", 0.0)
+        return checkpoint
+
+    def add(self, file_path: str, filename: str, sha256: str, upload_id: Optional[str] = None) -> dict:
+        """Add a file to the manifest; a file already listed keeps its upload_id"""
+        with self._lock:
+            for item in self.items:
+                if item["file_path"] == file_path:
+                    return item
+            item = {
+                "file_path": file_path,
+                "filename": filename,
+                "sha256": sha256,
+                "upload_id": upload_id or str(uuid.uuid4()),
+            }
+            self.items.append(item)
+            return item
+
+    def pending(self) -> List[dict]:
+        with self._lock:
+            return [item for item in self.items if item["upload_id"] not in self.done]
+
+    def mark_done(self, upload_id: str, **result) -> None:
+        with self._lock:
+            self.done[upload_id] = result
+            self.failed.pop(upload_id, None)
+        self.save()
+
+    def mark_failed(self, upload_id: str, error: str) -> None:
+        with self._lock:
+            self.failed[upload_id] = error
+        self.save()
+
+    def add_run(self, pages: int, chunks: int, seconds: float) -> None:
+        with self._lock:
+            self.pages += pages
+            self.chunks += chunks
+            self.seconds += seconds
+        self.save()
+
+    def save(self) -> None:
+        """Write atomically so a crash mid-write never corrupts the checkpoint"""
+        with self._lock:
+            data = {
+                "batch_id": self.batch_id,
+                "extractor": self.extractor,
+                "items": self.items,
+                "done": self.done,
+                "failed": self.failed,
+                "pages": self.pages,
+                "chunks": self.chunks,
+                "seconds": round(self.seconds, 3),
+            }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "batch_id": self.batch_id,
+                "documents": len(self.items),
+                "done": len(self.done),
+                "failed": len(self.failed),
+                "pending": len(self.items) - len(self.done),
+                "pages": self.pages,
+                "chunks": self.chunks,
+                "seconds": round(self.seconds, 2),
+                "pages_per_second": _rate(self.pages, self.seconds),
+                "chunks_per_second": _rate(self.chunks, self.seconds),
+                "errors": dict(self.failed),
+            }
+
+
+class _BulkDocument:
+    """Extraction and embedding state of one PDF during a bulk run"""
+
+    def __init__(self, item: dict, pages_total: int, extractor: str):
+        self.item = item
+        self.upload_id = item["upload_id"]
+        self.pages_total = pages_total
+        self.extractor = extractor
+        self.ranges_left = len(page_ranges(pages_total))
+        self.pages_done = 0
+        self.parts: List[Tuple[int, List[Document], List[List[float]]]] = []
+        self.error: Optional[str] = None
+
+    @property
+    def complete(self) -> bool:
+        return self.error is None and self.ranges_left == 0
+
+    @property
+    def chunks(self) -> int:
+        return sum(len(docs) for _, docs, _ in self.parts)
+
+    def build_vector(self) -> Optional[FAISS]:
+        """FAISS index over all ranges in page order (runs in a thread)"""
+        parts = sorted(self.parts, key=lambda part: part[0])
+        docs = [doc for _, chunks, _ in parts for doc in chunks]
+        if not docs:
+            return None
+        vectors = [v for _, _, embedded in parts for v in embedded]
+        vector = FAISS.from_embeddings(
+            list(zip([d.page_content for d in docs], vectors)),
+            get_embedder(),
+            metadatas=[d.metadata for d in docs],
+        )
+        return optimize_index(vector)
+
+
+async def run_bulk(pool: IngestionPool, store, checkpoint: BulkCheckpoint,
+                   on_start: Optional[Callable[[str, int], None]] = None,
+                   on_batch: Optional[Callable[[str, int, int], None]] = None,
+                   on_finish: Optional[Callable[[str, Optional[str]], None]] = None,
+                   embed_batch: int = BULK_EMBED_BATCH) -> dict:
+    """
+    Ingest every pending document of `checkpoint` into `store` (an IndexStore).
+
+    Callbacks get the upload_id: `on_start(upload_id, pages_total)`,
+    `on_batch(upload_id, pages_done, chunks)` after each embedded range and
+    `on_finish(upload_id, error)` with error None on success. Returns the
+    throughput of this run (pages/s and chunks/s over the wall-clock time).
+    """
+    start = time.perf_counter()
+    pages_run = 0
+    chunks_run = 0
+
+    def finish(upload_id: str, error: Optional[str] = None, **result) -> None:
+        if error:
+            checkpoint.mark_failed(upload_id, error)
+        else:
+            checkpoint.mark_done(upload_id, **result)
+        if on_finish:
+            on_finish(upload_id, error)
+
+    # Identical files (already indexed, or repeated in this batch) share one index
+    todo, duplicates, owners = [], [], {}
+    for item in checkpoint.pending():
+        existing = await pool.run_in_thread(store.lookup_content, item["sha256"])
+        if existing or item["sha256"] in owners:
+            duplicates.append(item)
+        else:
+            owners[item["sha256"]] = item["upload_id"]
+            todo.append(item)
+
+    counts = await asyncio.gather(
+        *(pool.run_in_process(count_pages, item["file_path"], checkpoint.extractor) for item in todo),
+        return_exceptions=True,
+    )
+    docs: List[_BulkDocument] = []
+    for item, counted in zip(todo, counts):
+        if isinstance(counted, BaseException):
+            finish(item["upload_id"], f"Could not open PDF: {counted}")
+            continue
+        doc = _BulkDocument(item, *counted)
+        if doc.pages_total == 0:
+            finish(doc.upload_id, "The PDF has no pages")
+            continue
+        if on_start:
+            on_start(doc.upload_id, doc.pages_total)
+        docs.append(doc)
+
+    # Ranges of all documents in one queue, a bounded window of them in flight
+    tasks = [(doc, pages) for doc in docs for pages in page_ranges(doc.pages_total)]
+    tasks.reverse()
+    in_flight: Dict[asyncio.Future, Tuple[_BulkDocument, range]] = {}
+    window = pool.parse_workers + INGEST_QUEUE_BATCHES
+
+    def fill() -> None:
+        while tasks and len(in_flight) < window:
+            doc, pages = tasks.pop()
+            if doc.error:
+                continue
+            metadata = {"document_id": doc.upload_id, "filename": doc.item["filename"]}
+            future = asyncio.ensure_future(pool.run_in_process(
+                extract_chunks, doc.item["file_path"], pages.start, pages.stop, doc.extractor, metadata
+            ))
+            in_flight[future] = (doc, pages)
+
+    async def finalize(doc: _BulkDocument) -> None:
+        chunks = doc.chunks
+        try:
+            vector = await pool.run_in_thread(doc.build_vector)
+            if vector is None:
+                finish(doc.upload_id, "No text could be extracted from the PDF")
+                return
+            await pool.run_in_thread(
+                store.put, doc.upload_id, vector, {"filename": doc.item["filename"], "sha256": doc.item["sha256"]}
+            )
+            await pool.run_in_thread(store.register_content, doc.item["sha256"], doc.upload_id)
+        except Exception as e:
+            finish(doc.upload_id, f"Indexing error: {e}")
+            return
+        finally:
+            doc.parts = []
+        finish(doc.upload_id, pages=doc.pages_total, chunks=chunks)
+
+    buffer: List[Tuple[_BulkDocument, range, List[Document]]] = []
+    buffered = 0
+    fill()
+    try:
+        while in_flight or buffer:
+            if in_flight:
+                finished, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for future in finished:
+                    doc, pages = in_flight.pop(future)
+                    try:
+                        chunks = future.result()
+                    except Exception as e:
+                        if not doc.error:
+                            doc.error = f"Extraction error on pages {pages.start + 1}-{pages.stop}: {e}"
+                            finish(doc.upload_id, doc.error)
+                        continue
+                    buffer.append((doc, pages, chunks))
+                    buffered += len(chunks)
+                fill()
+            if buffered < embed_batch and in_flight:
+                continue
+
+            # One large embedding call for chunks of several documents
+            texts = [chunk.page_content for _, _, chunks in buffer for chunk in chunks]
+            vectors = await pool.run_in_thread(get_embedder().embed_documents, texts, embed_batch) if texts else []
+            offset = 0
+            for doc, pages, chunks in buffer:
+                part = vectors[offset:offset + len(chunks)]
+                offset += len(chunks)
+                pages_run += len(pages)
+                chunks_run += len(chunks)
+                if doc.error:
+                    continue
+                doc.parts.append((pages.start, chunks, part))
+                doc.ranges_left -= 1
+                doc.pages_done += len(pages)
+                if on_batch:
+                    on_batch(doc.upload_id, doc.pages_done, len(chunks))
+                if doc.complete:
+                    await finalize(doc)
+            buffer = []
+            buffered = 0
+    finally:
+        for future in in_flight:
+            future.cancel()
+        seconds = time.perf_counter() - start
+        checkpoint.add_run(pages_run, chunks_run, seconds)
+
+    for item in duplicates:
+        owner = await pool.run_in_thread(store.lookup_content, item["sha256"])
+        if owner is None:
+            finish(item["upload_id"], "Identical document in this batch failed to index")
+            continue
+        await pool.run_in_thread(store.alias, item["upload_id"], owner)
+        finish(item["upload_id"], deduplicated=owner)
+
+    return {
+        "documents": len(todo) + len(duplicates),
+        "pages": pages_run,
+        "chunks": chunks_run,
+        "seconds": round(seconds, 2),
+        "pages_per_second": _rate(pages_run, seconds),
+        "chunks_per_second": _rate(chunks_run, seconds),
+    }
@@ -0,0 +1,118 @@
+"""
+Token-budgeted context assembly for LlamaDoc AI
+
+Retrieved chunks overlap (CHUNK_OVERLAP characters are repeated between
+neighbours) and often come from the same page. Before prompting, chunks of
+the same page are merged in reading order with the repeated overlap removed,
+exact duplicates are dropped, and the resulting blocks are packed in
+relevance order until CONTEXT_TOKEN_BUDGET tokens are used.
+"""
+import math
+import os
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1200"))  # tokens of retrieved text per prompt
+CONTEXT_TOKENIZER = os.environ.get("CONTEXT_TOKENIZER", "cl100k_base")  # tiktoken encoding used for counting
+MIN_OVERLAP_CHARS = 20  # shorter suffix/prefix matches are treated as coincidence
+MAX_OVERLAP_CHARS = 400  # chunks repeat CHUNK_OVERLAP (100) characters; search a little wider
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+except Exception:
+    # tiktoken missing or the encoding cannot be loaded offline: estimate instead
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def overlap_length(previous: str, text: str) -> int:
+    """Length of the longest suffix of `previous` that starts `text`"""
+    for size in range(min(len(previous), len(text), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(text[:size]):
+            return size
+    return 0
+
+
+def _page_key(doc: Document) -> Tuple[str, object]:
+    return doc.metadata.get("source", ""), doc.metadata.get("page")
+
+
+def _merge_page(docs: List[Tuple[int, Document]]) -> List[dict]:
+    """Merge ranked chunks of one page into blocks of contiguous text"""
+    # start_index (set by the splitter at ingestion) gives reading order; older
+    # indexes lack it and keep retrieval order, relying on overlap detection
+    ordered = sorted(docs, key=lambda item: item[1].metadata.get("start_index", item[0]))
+    blocks: List[dict] = []
+    for rank, doc in ordered:
+        text = doc.page_content
+        block = blocks[-1] if blocks else None
+        if block is not None:
+            overlap = overlap_length(block["text"], text)
+            if overlap:
+                block["text"] += text[overlap:]
+                block["rank"] = min(block["rank"], rank)
+                block["overlap_chars"] += overlap
+                continue
+        blocks.append({"text": text, "rank": rank, "metadata": doc.metadata, "overlap_chars": 0})
+    return blocks
+
+
+def assemble_context(docs: List[Document],
+                     budget: Optional[int] = None) -> Tuple[List[Document], dict]:
+    """
+    Merge, de-duplicate and pack `docs` (most relevant first) into at most
+    `budget` tokens. Returns the packed documents and packing stats.
+    """
+    budget = budget or CONTEXT_TOKEN_BUDGET
+    pages: dict = {}
+    seen = set()
+    duplicates = 0
+    for rank, doc in enumerate(docs):
+        if doc.page_content in seen:
+            duplicates += 1
+            continue
+        seen.add(doc.page_content)
+        pages.setdefault(_page_key(doc), []).append((rank, doc))
+
+    blocks = [block for page_docs in pages.values() for block in _merge_page(page_docs)]
+    blocks.sort(key=lambda block: block["rank"])
+
+    packed: List[Document] = []
+    used = 0
+    dropped = 0
+    for block in blocks:
+        tokens = count_tokens(block["text"])
+        if used + tokens > budget:
+            if packed:
+                dropped += 1
+                continue
+            # Even the best block is over budget: keep its head
+            block["text"] = truncate_tokens(block["text"], budget)
+            tokens = count_tokens(block["text"])
+        packed.append(Document(page_content=block["text"], metadata=block["metadata"]))
+        used += tokens
+
+    stats = {
+        "context_chunks": len(docs),
+        "context_blocks": len(packed),
+        "context_tokens": used,
+        "context_tokens_raw": sum(count_tokens(doc.page_content) for doc in docs),
+        "context_budget": budget,
+        "overlap_chars_removed": sum(block["overlap_chars"] for block in blocks),
+        "duplicates_removed": duplicates,
+        "blocks_dropped": dropped,
+    }
+    return packed, stats
@@ -0,0 +1,206 @@
+"""
+Sharded corpus index for searching across many uploads in LlamaDoc AI
+
+Every indexed upload is also added to a small number of large shards
+(CORPUS_SHARD_SIZE vectors each) with its upload_id in the chunk metadata.
+A corpus query searches each shard once, restricted inside FAISS (an id
+selector) to the vectors of the requested upload_ids, and merges the
+per-shard top-k. Query cost therefore depends on
+the number of shards, not on how many PDFs they hold.
+"""
+import asyncio
+import heapq
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from ann import index_vectors
+from embeddings import get_embedder
+from index_store import load_vector, save_vector
+
+CORPUS_DIR = Path(os.environ.get("CORPUS_DIR", "uploads/corpus"))
+CORPUS_SHARD_SIZE = int(os.environ.get("CORPUS_SHARD_SIZE", "100000"))  # vectors per shard
+
+
+class CorpusIndex:
+    """
+    Shards are persisted under CORPUS_DIR/shard-NNNN and loaded on first use.
+    Changes are kept in memory and written back by flush(). Shards stay flat
+    (exact) because uploads are added and removed from them in place.
+    """
+
+    def __init__(self, shard_size: int = CORPUS_SHARD_SIZE):
+        self.shard_size = shard_size
+        self._shards: List[Optional[FAISS]] = []
+        self._shard_locks: List[threading.Lock] = []  # guard each shard between search and update
+        self._dirty: Set[int] = set()
+        self._owners: Dict[str, Dict[int, List[str]]] = {}  # upload_id -> shard -> docstore ids
+        self._positions: Dict[int, Dict[str, int]] = {}  # shard -> docstore id -> FAISS position
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def _shard_path(self, shard_no: int) -> Path:
+        return CORPUS_DIR / f"shard-{shard_no:04d}"
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            shard_no = 0
+            while (self._shard_path(shard_no)).exists():
+                # Shards are modified in place, so never map them read-only
+                shard = load_vector(self._shard_path(shard_no), mmap=False)
+                self._shards.append(shard)
+                self._shard_locks.append(threading.Lock())
+                if shard is not None:
+                    for doc_id in shard.index_to_docstore_id.values():
+                        owner = shard.docstore.search(doc_id).metadata.get("upload_id")
+                        self._owners.setdefault(owner, {}).setdefault(shard_no, []).append(doc_id)
+                shard_no += 1
+            self._loaded = True
+
+    def add(self, upload_id: str, vector: FAISS, skip: Iterable[int] = ()) -> None:
+        """Copy the chunks and vectors of one upload index into the current shard,
+        leaving out the (tombstoned) positions in `skip`"""
+        self._ensure_loaded()
+        skip = set(skip)
+        positions = [p for p in range(vector.index.ntotal) if p not in skip]
+        # For a PQ/SQ8 upload index these are decoded approximations; shards are
+        # flat, so they are stored as decoded and never re-quantized
+        embeddings = index_vectors(vector.index)[positions]
+        texts, metadatas, ids = [], [], []
+        for position in positions:
+            doc_id = vector.index_to_docstore_id[position]
+            doc = vector.docstore.search(doc_id)
+            texts.append(doc.page_content)
+            metadatas.append({**doc.metadata, "upload_id": upload_id})
+            ids.append(f"{upload_id}:{doc_id}")
+        if not ids:
+            self.remove(upload_id)
+            return
+
+        with self._lock:
+            self.remove(upload_id)
+            last = self._shards[-1] if self._shards else None
+            if not self._shards or (last is not None and last.index.ntotal + len(ids) > self.shard_size):
+                self._shards.append(None)
+                self._shard_locks.append(threading.Lock())
+            shard_no = len(self._shards) - 1
+            text_embeddings = list(zip(texts, embeddings.tolist()))
+            shard = self._shards[shard_no]
+            if shard is None:
+                shard = FAISS.from_embeddings(text_embeddings, get_embedder(), metadatas=metadatas, ids=ids)
+                self._shards[shard_no] = shard
+            else:
+                with self._shard_locks[shard_no]:
+                    shard.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+                    self._positions.pop(shard_no, None)
+            self._owners[upload_id] = {shard_no: ids}
+            self._dirty.add(shard_no)
+
+    def remove(self, upload_id: str) -> None:
+        """Remove every chunk of `upload_id` from the shards"""
+        self._ensure_loaded()
+        with self._lock:
+            for shard_no, ids in self._owners.pop(upload_id, {}).items():
+                shard = self._shards[shard_no]
+                if shard is not None and ids:
+                    with self._shard_locks[shard_no]:
+                        # Deleting renumbers the positions after the removed vectors
+                        shard.delete(ids)
+                        self._positions.pop(shard_no, None)
+                    self._dirty.add(shard_no)
+
+    def refresh(self, upload_id: str, vector: Optional[FAISS], skip: Iterable[int] = ()) -> None:
+        """Re-sync one upload after its index changed (vector None = deleted)"""
+        if vector is None:
+            self.remove(upload_id)
+        else:
+            self.add(upload_id, vector, skip)
+
+    def flush(self) -> int:
+        """Write changed shards to disk; returns how many were written"""
+        with self._lock:
+            dirty, self._dirty = sorted(self._dirty), set()
+            shards = [(n, self._shards[n]) for n in dirty]
+        for shard_no, shard in shards:
+            if shard is not None:
+                with self._shard_locks[shard_no]:
+                    save_vector(self._shard_path(shard_no), shard, {"shard": shard_no})
+        return len(shards)
+
+    def _position_map(self, shard_no: int) -> Dict[str, int]:
+        """docstore id -> FAISS position for one shard (caller holds the shard lock)"""
+        positions = self._positions.get(shard_no)
+        if positions is None:
+            shard = self._shards[shard_no]
+            positions = {doc_id: position for position, doc_id in shard.index_to_docstore_id.items()}
+            self._positions[shard_no] = positions
+        return positions
+
+    def _search_shard(self, shard_no: int, embedding: List[float], k: int,
+                      doc_ids: Optional[List[str]]) -> List[Tuple[Document, float]]:
+        """Top-k of one shard, limited to `doc_ids` (None = every vector in it)"""
+        shard = self._shards[shard_no]
+        with self._shard_locks[shard_no]:
+            if doc_ids is None:
+                return shard.similarity_search_with_score_by_vector(embedding, k=k)
+            # Filter inside the search, so a large upload sharing the shard cannot
+            # crowd the requested ones out of the candidates
+            position_of = self._position_map(shard_no)
+            positions = [position_of[doc_id] for doc_id in doc_ids if doc_id in position_of]
+            if not positions:
+                return []
+            selector = faiss.IDSelectorBatch(np.asarray(positions, dtype=np.int64))
+            distances, found = shard.index.search(
+                np.asarray([embedding], dtype=np.float32),
+                min(k, len(positions)),
+                params=faiss.SearchParameters(sel=selector),
+            )
+            return [
+                (shard.docstore.search(shard.index_to_docstore_id[int(position)]), float(distance))
+                for distance, position in zip(distances[0], found[0])
+                if position != -1
+            ]
+
+    async def asearch(self, question: str, k: int = 5,
+                      upload_ids: Optional[Iterable[str]] = None,
+                      embedding: Optional[List[float]] = None) -> List[Tuple[Document, float]]:
+        """Search all shards in parallel and merge the top-k (lowest distance first);
+        `embedding` skips re-embedding the question"""
+        await asyncio.to_thread(self._ensure_loaded)
+        allowed = set(upload_ids) if upload_ids is not None else None
+        if embedding is None:
+            embedding = await asyncio.to_thread(get_embedder().embed_query, question)
+        with self._lock:
+            if allowed is None:
+                wanted = {n: None for n in range(len(self._shards))}
+            else:
+                wanted = {}
+                for uid in allowed:
+                    for n, ids in self._owners.get(uid, {}).items():
+                        wanted.setdefault(n, []).extend(ids)
+            shards = [(n, ids) for n, ids in sorted(wanted.items()) if self._shards[n] is not None]
+        results = await asyncio.gather(*[
+            asyncio.to_thread(self._search_shard, n, embedding, k, ids) for n, ids in shards
+        ])
+        return heapq.nsmallest(k, (hit for hits in results for hit in hits), key=lambda hit: hit[1])
+
+    def stats(self) -> dict:
+        self._ensure_loaded()
+        with self._lock:
+            return {
+                "uploads": len(self._owners),
+                "shards": len(self._shards),
+                "shard_size": self.shard_size,
+                "vectors": sum(s.index.ntotal for s in self._shards if s is not None),
+                "dirty_shards": len(self._dirty),
+            }
@@ -0,0 +1,209 @@
+"""
+Process-wide embedding service for LlamaDoc AI
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from langchain_core.embeddings import Embeddings
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+EMBEDDING_MODEL_NAME = os.environ.get("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", "0"))  # 0 = leave torch default
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "50000"))  # chunk vectors kept, 0 = off
+
+
+class EmbeddingService(Embeddings):
+    """
+    Wraps a single HuggingFaceEmbeddings instance so the model weights and
+    tokenizer are loaded once per process and shared by every upload and query.
+    Texts are embedded in fixed-size batches and per-batch throughput is recorded.
+    Document vectors are cached by text hash (LRU), so re-uploaded or revised
+    PDFs only embed the chunks whose text changed.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME,
+                 batch_size: int = EMBEDDING_BATCH_SIZE,
+                 num_threads: int = EMBEDDING_THREADS,
+                 cache_size: int = EMBEDDING_CACHE_SIZE):
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.num_threads = num_threads
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._model: Optional[HuggingFaceEmbeddings] = None
+        self._load_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.load_seconds = 0.0
+        self.batches = 0
+        self.texts = 0
+        self.embed_seconds = 0.0
+        self.last_batch_size = 0
+        self.last_batch_seconds = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self) -> "EmbeddingService":
+        """Load the model if it is not loaded yet (thread-safe)"""
+        if self._model is not None:
+            return self
+        with self._load_lock:
+            if self._model is None:
+                if self.num_threads > 0:
+                    import torch
+                    torch.set_num_threads(self.num_threads)
+                start = time.perf_counter()
+                self._model = HuggingFaceEmbeddings(
+                    model_name=self.model_name,
+                    encode_kwargs={"batch_size": self.batch_size},
+                )
+                self.load_seconds = time.perf_counter() - start
+                print(f"✅ Embedding model '{self.model_name}' loaded in {self.load_seconds:.2f}s")
+        return self
+
+    def warmup(self, batch_size: Optional[int] = None) -> None:
+        """Run a dummy batch through the model so the first real request is not slow"""
+        n = batch_size or self.batch_size
+        self.embed_documents(["warmup"] * n)
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """One model forward pass over the whole batch
+
+        HuggingFaceEmbeddings.embed_documents would re-split it into
+        encode_kwargs["batch_size"] texts, so call the model with this
+        batch's size instead (same newline handling as the wrapper).
+        """
+        start = time.perf_counter()
+        texts = [text.replace("\n", " ") for text in batch]
+        encode_kwargs = {**self._model.encode_kwargs, "batch_size": len(texts)}
+        vectors = self._model.client.encode(texts, show_progress_bar=False, **encode_kwargs).tolist()
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.batches += 1
+            self.texts += len(batch)
+            self.embed_seconds += elapsed
+            self.last_batch_size = len(batch)
+            self.last_batch_seconds = elapsed
+        return vectors
+
+    @staticmethod
+    def text_key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        """Embed chunks, `batch_size` (default EMBEDDING_BATCH_SIZE) texts per model forward pass"""
+        self.load()
+        batch_size = max(1, batch_size or self.batch_size)
+        keys = [self.text_key(t) for t in texts]
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        missing: List[int] = []
+        with self._stats_lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key) if self.cache_size else None
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    vectors[i] = cached.tolist()
+                else:
+                    missing.append(i)
+            self.cache_hits += len(texts) - len(missing)
+            self.cache_misses += len(missing)
+
+        for start in range(0, len(missing), batch_size):
+            positions = missing[start:start + batch_size]
+            embedded = self._embed_batch([texts[i] for i in positions])
+            with self._stats_lock:
+                for i, vector in zip(positions, embedded):
+                    vectors[i] = vector
+                    if self.cache_size:
+                        self._cache[keys[i]] = np.asarray(vector, dtype=np.float32)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a question; cached too, so the answer cache and retrieval share one pass"""
+        self.load()
+        key = "q:" + self.text_key(text)
+        with self._stats_lock:
+            cached = self._cache.get(key) if self.cache_size else None
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached.tolist()
+        vector = self._model.embed_query(text)
+        if self.cache_size:
+            with self._stats_lock:
+                self._cache[key] = np.asarray(vector, dtype=np.float32)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed many questions in one batched pass, sharing embed_query()'s cache"""
+        self.load()
+        keys = ["q:" + self.text_key(t) for t in texts]
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        missing: List[int] = []
+        with self._stats_lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key) if self.cache_size else None
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    vectors[i] = cached.tolist()
+                else:
+                    missing.append(i)
+        if missing:
+            # Query and document embeddings are the same for sentence-transformers models
+            embedded = self._embed_batch([texts[i] for i in missing])
+            with self._stats_lock:
+                for i, vector in zip(missing, embedded):
+                    vectors[i] = vector
+                    if self.cache_size:
+                        self._cache[keys[i]] = np.asarray(vector, dtype=np.float32)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return vectors
+
+    def stats(self) -> dict:
+        """Load time and batch throughput counters"""
+        with self._stats_lock:
+            return {
+                "model_name": self.model_name,
+                "loaded": self.loaded,
+                "batch_size": self.batch_size,
+                "num_threads": self.num_threads,
+                "load_seconds": round(self.load_seconds, 4),
+                "batches": self.batches,
+                "texts": self.texts,
+                "embed_seconds": round(self.embed_seconds, 4),
+                "texts_per_second": round(self.texts / self.embed_seconds, 2) if self.embed_seconds else 0.0,
+                "last_batch_texts_per_second": (
+                    round(self.last_batch_size / self.last_batch_seconds, 2) if self.last_batch_seconds else 0.0
+                ),
+                "cache_size": len(self._cache),
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+            }
+
+
+_embedder: Optional[EmbeddingService] = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> EmbeddingService:
+    """Return the process-wide embedding service, creating it on first use"""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = EmbeddingService()
+    return _embedder
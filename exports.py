@@ -0,0 +1,319 @@
+"""
+Answer exports (TXT / DOCX / PDF) for LlamaDoc AI
+
+Exports are rendered into in-memory buffers, so concurrent downloads never
+share a file on disk. Single answers are cached by (history row id, format).
+
+Whole-conversation exports are read from the database in pages of
+EXPORT_PAGE_ROWS rows and streamed: TXT entry by entry, PDF page by page
+(stream_conversation), so neither the rows nor the document are held at
+once and nothing is cached. DOCX is a zip of one XML part that python-docx
+only writes in save(), so it cannot be streamed; it is rendered in memory,
+capped at EXPORT_DOCX_MAX_ENTRIES entries, and cached by (upload_id, newest
+row id, format) when small enough.
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from models import ChatHistory
+
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get("EXPORT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+EXPORT_CACHE_ITEM_MAX_BYTES = int(os.environ.get("EXPORT_CACHE_ITEM_MAX_BYTES", str(1024 * 1024)))  # larger exports are not cached
+EXPORT_DOCX_MAX_ENTRIES = int(os.environ.get("EXPORT_DOCX_MAX_ENTRIES", "500"))  # DOCX conversations are built in memory
+EXPORT_PAGE_ROWS = int(os.environ.get("EXPORT_PAGE_ROWS", "100"))  # history rows read per query
+EXPORT_STREAM_CHUNK = 64 * 1024
+
+EXPORT_FORMATS = {
+    "txt": "text/plain; charset=utf-8",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pdf": "application/pdf",
+}
+
+
+class ExportTooLarge(Exception):
+    """The conversation has more entries than a DOCX export may hold"""
+
+
+# Writers take add() calls; drain() returns the bytes that are final so far
+# (streamable formats only) and getvalue() ends the document with the rest.
+
+class TextWriter:
+    def __init__(self, title: Optional[str] = None):
+        self.buffer = io.StringIO()
+        if title:
+            self.buffer.write(f"{title}\n{'=' * len(title)}\n\n")
+        self.entries = 0
+
+    def drain(self) -> bytes:
+        data = self.buffer.getvalue().encode("utf-8")
+        self.buffer = io.StringIO()
+        return data
+
+    def add(self, question: str, answer: str, heading: Optional[str] = None) -> None:
+        if self.entries:
+            self.buffer.write("\n\n")
+        if heading:
+            self.buffer.write(f"{heading}\n\n")
+        self.buffer.write(f"Question: {question}\n\nAnswer:\n{answer}")
+        self.entries += 1
+
+    def getvalue(self) -> bytes:
+        return self.drain()
+
+
+class DocxWriter:
+    def __init__(self, title: str = "AI Generated Answer"):
+        from docx import Document
+        self.doc = Document()
+        self.doc.add_heading(title, level=1)
+
+    def add(self, question: str, answer: str, heading: Optional[str] = None) -> None:
+        if heading:
+            self.doc.add_heading(heading, level=2)
+        self.doc.add_heading("Question:", level=2 if not heading else 3)
+        self.doc.add_paragraph(question)
+        self.doc.add_heading("Answer:", level=2 if not heading else 3)
+        self.doc.add_paragraph(answer)
+
+    def drain(self) -> bytes:
+        return b""
+
+    def getvalue(self) -> bytes:
+        buffer = io.BytesIO()
+        self.doc.save(buffer)
+        return buffer.getvalue()
+
+
+def _pdf_string(text: str) -> bytes:
+    data = text.replace("\r", "").encode("cp1252", "replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+class PdfWriter:
+    """
+    Letter pages, Helvetica, wrapped lines with a new page whenever the bottom margin is reached.
+    The PDF is written object by object, so every finished page can be sent
+    (drain()) before the next one is laid out; reportlab is only used to
+    measure text for wrapping (its canvas keeps every page until save()).
+    """
+
+    FONTS = {"Helvetica": b"/F1", "Helvetica-Bold": b"/F2"}
+
+    def __init__(self, title: str = "AI Generated Answer"):
+        from reportlab.lib.pagesizes import letter
+        self.width, self.height = letter
+        self._out: List[bytes] = []
+        self._written = 0
+        self._offsets: Dict[int, int] = {}
+        self._pages: List[int] = []
+        self._ops: List[bytes] = []
+        # 1 catalog, 2 page tree (written last), 3/4 fonts
+        self._next_object = 5
+        self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        for number, font in ((3, "Helvetica"), (4, "Helvetica-Bold")):
+            self._object(number, b"<< /Type /Font /Subtype /Type1 /BaseFont /" + font.encode("ascii")
+                         + b" /Encoding /WinAnsiEncoding >>")
+        # Title
+        self._text("Helvetica-Bold", 16, self.height - 50, title)
+        self.y = self.height - 100
+
+    def _emit(self, data: bytes) -> None:
+        self._out.append(data)
+        self._written += len(data)
+
+    def _object(self, number: int, body: bytes) -> None:
+        self._offsets[number] = self._written
+        self._emit(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+    def _new_object(self) -> int:
+        self._next_object += 1
+        return self._next_object - 1
+
+    def _text(self, font: str, size: int, y: float, text: str) -> None:
+        self._ops.append(b"BT %s %d Tf 50 %.2f Td %s Tj ET" % (self.FONTS[font], size, y, _pdf_string(text)))
+
+    def _show_page(self) -> None:
+        content = b"\n".join(self._ops)
+        stream = self._new_object()
+        self._object(stream, b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        page = self._new_object()
+        self._object(page, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                           b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+                     % (self.width, self.height, stream))
+        self._pages.append(page)
+        self._ops = []
+
+    def _space(self, needed: float) -> None:
+        if self.y - needed < 50:
+            self._show_page()
+            self.y = self.height - 50
+
+    def _label(self, text: str) -> None:
+        self._space(40)
+        self._text("Helvetica-Bold", 12, self.y, text)
+        self.y -= 20
+
+    def _paragraph(self, text: str) -> None:
+        from reportlab.lib.utils import simpleSplit
+        for line in simpleSplit(text, "Helvetica", 10, self.width - 100):
+            if self.y < 50:
+                self._show_page()
+                self.y = self.height - 50
+            self._text("Helvetica", 10, self.y, line)
+            self.y -= 15
+
+    def add(self, question: str, answer: str, heading: Optional[str] = None) -> None:
+        if heading:
+            self._label(heading)
+            self.y -= 5
+        self._label("Question:")
+        self._paragraph(question)
+        self.y -= 20
+        self._label("Answer:")
+        self._paragraph(answer)
+        self.y -= 30
+
+    def drain(self) -> bytes:
+        data = b"".join(self._out)
+        self._out = []
+        return data
+
+    def getvalue(self) -> bytes:
+        self._show_page()
+        kids = b" ".join(b"%d 0 R" % page for page in self._pages)
+        self._object(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._pages)))
+        self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref = self._written
+        self._emit(b"xref\n0 %d\n0000000000 65535 f \n" % self._next_object)
+        for number in range(1, self._next_object):
+            self._emit(b"%010d 00000 n \n" % self._offsets[number])
+        self._emit(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (self._next_object, xref))
+        return self.drain()
+
+
+WRITERS = {"txt": TextWriter, "docx": DocxWriter, "pdf": PdfWriter}
+
+
+def render_entry(question: str, answer: str, fmt: str) -> bytes:
+    """One question/answer pair in the single-answer layout"""
+    writer = WRITERS[fmt]()
+    writer.add(question, answer)
+    return writer.getvalue()
+
+
+def iter_conversation(session_factory, upload_id: str,
+                      page_rows: int = EXPORT_PAGE_ROWS) -> Iterator[ChatHistory]:
+    """All history rows of an upload, oldest first, read in keyset pages"""
+    last = None
+    while True:
+        db = session_factory()
+        try:
+            query = db.query(ChatHistory).filter(ChatHistory.upload_id == upload_id)
+            if last is not None:
+                query = query.filter(
+                    (ChatHistory.created_at > last[0])
+                    | ((ChatHistory.created_at == last[0]) & (ChatHistory.id > last[1]))
+                )
+            rows = query.order_by(ChatHistory.created_at, ChatHistory.id).limit(page_rows).all()
+            db.expunge_all()
+        finally:
+            db.close()
+        yield from rows
+        if len(rows) < page_rows:
+            return
+        last = (rows[-1].created_at, rows[-1].id)
+
+
+def _add_rows(writer, rows: Iterable[ChatHistory], max_entries: Optional[int] = None) -> Iterator[int]:
+    """Add every row to `writer`, yielding the running entry count after each"""
+    for count, row in enumerate(rows, start=1):
+        if max_entries is not None and count > max_entries:
+            raise ExportTooLarge(f"Conversations over {max_entries} answers cannot be exported as DOCX; use txt or pdf")
+        stamp = row.created_at.strftime("%Y-%m-%d %H:%M UTC") if row.created_at else ""
+        writer.add(row.question, row.answer, heading=f"{count}. {stamp}".strip())
+        yield count
+
+
+def render_conversation(rows: Iterable[ChatHistory], upload_id: str, fmt: str,
+                        max_entries: Optional[int] = None) -> Tuple[bytes, int]:
+    """Every entry of a conversation in one in-memory document; returns (bytes, entries).
+    Raises ExportTooLarge past `max_entries`."""
+    writer = WRITERS[fmt](f"Conversation {upload_id}")
+    count = 0
+    for count in _add_rows(writer, rows, max_entries):
+        pass
+    return writer.getvalue(), count
+
+
+def stream_conversation(rows: Iterable[ChatHistory], upload_id: str, fmt: str) -> Iterator[bytes]:
+    """
+    A conversation as a stream of chunks (txt or pdf), sent as entries or
+    pages are finished. The writer is created here, so a missing library
+    raises before the first chunk.
+    """
+    writer = WRITERS[fmt](f"Conversation {upload_id}")
+
+    def chunks() -> Iterator[bytes]:
+        for _ in _add_rows(writer, rows):
+            data = writer.drain()
+            if data:
+                yield data
+        yield writer.getvalue()
+
+    return chunks()
+
+
+def iter_bytes(data: bytes, chunk_size: int = EXPORT_STREAM_CHUNK) -> Iterator[bytes]:
+    view = memoryview(data)
+    for start in range(0, len(data), chunk_size):
+        yield bytes(view[start:start + chunk_size])
+
+
+class ExportCache:
+    """LRU cache of rendered exports, bounded by total bytes"""
+
+    def __init__(self, max_bytes: int = EXPORT_CACHE_MAX_BYTES,
+                 max_item_bytes: int = EXPORT_CACHE_ITEM_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = min(max_item_bytes, max_bytes)
+        self._items: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            data = self._items.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: tuple, data: bytes) -> None:
+        if len(data) > self.max_item_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._items[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,120 @@
+"""
+PDF text extractors for LlamaDoc AI
+
+Every backend can open a PDF, count its pages and extract an arbitrary page
+range, so a long PDF can be split into ranges that are extracted in
+parallel by separate processes. pypdfium2 (PDFium, native code) is the
+fast default; pdfplumber is slower but keeps table layout better and
+stays available as a fallback.
+
+Pages are returned as Documents with the same metadata PDFPlumberLoader
+used (source, file_path, page starting at 0, total_pages).
+"""
+import os
+from typing import Dict, Iterator, List, Optional, Type
+
+from langchain_core.documents import Document
+
+PDF_EXTRACTOR = os.environ.get("PDF_EXTRACTOR", "pdfium").lower()  # 'pdfium' or 'pdfplumber'
+EXTRACT_PAGES_PER_TASK = int(os.environ.get("EXTRACT_PAGES_PER_TASK", "16"))  # pages per parallel range
+
+
+class PdfiumExtractor:
+    """PDFium via pypdfium2: native text extraction, much faster than pure Python"""
+
+    name = "pdfium"
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import pypdfium2  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def page_count(self, file_path: str) -> int:
+        import pypdfium2 as pdfium
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+    def extract(self, file_path: str, start: int, stop: int) -> Iterator[Document]:
+        import pypdfium2 as pdfium
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            total = len(pdf)
+            for page_no in range(start, min(stop, total)):
+                page = pdf[page_no]
+                textpage = page.get_textpage()
+                try:
+                    text = textpage.get_text_range().replace("\r\n", "\n")
+                finally:
+                    textpage.close()
+                    page.close()
+                yield Document(page_content=text, metadata=_page_metadata(file_path, page_no, total))
+        finally:
+            pdf.close()
+
+
+class PdfplumberExtractor:
+    """pdfplumber: pure Python and slow, but better with table-heavy layouts"""
+
+    name = "pdfplumber"
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import pdfplumber  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def page_count(self, file_path: str) -> int:
+        import pdfplumber
+        with pdfplumber.open(file_path) as pdf:
+            return len(pdf.pages)
+
+    def extract(self, file_path: str, start: int, stop: int) -> Iterator[Document]:
+        import pdfplumber
+        with pdfplumber.open(file_path) as pdf:
+            total = len(pdf.pages)
+            for page_no in range(start, min(stop, total)):
+                page = pdf.pages[page_no]
+                text = page.extract_text() or ""
+                page.flush_cache()
+                yield Document(page_content=text, metadata=_page_metadata(file_path, page_no, total))
+
+
+EXTRACTORS: Dict[str, Type] = {
+    PdfiumExtractor.name: PdfiumExtractor,
+    PdfplumberExtractor.name: PdfplumberExtractor,
+}
+
+
+def _page_metadata(file_path: str, page_no: int, total: int) -> dict:
+    return {"source": file_path, "file_path": file_path, "page": page_no, "total_pages": total}
+
+
+def get_extractor(name: Optional[str] = None):
+    """
+    Extractor instance for `name` (default PDF_EXTRACTOR). Falls back to the
+    other backend when the requested one is not installed.
+    """
+    name = (name or PDF_EXTRACTOR).lower()
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown PDF extractor: {name!r} (choose from {', '.join(EXTRACTORS)})")
+    if EXTRACTORS[name].available():
+        return EXTRACTORS[name]()
+    for fallback in EXTRACTORS.values():
+        if fallback.available():
+            print(f"Warning: PDF extractor '{name}' is not installed, using '{fallback.name}'")
+            return fallback()
+    raise RuntimeError("No PDF extractor installed (install pypdfium2 or pdfplumber)")
+
+
+def page_ranges(total: int, per_task: int = EXTRACT_PAGES_PER_TASK) -> List[range]:
+    """Split pages 0..total-1 into consecutive ranges of `per_task` pages"""
+    per_task = max(1, per_task)
+    return [range(start, min(start + per_task, total)) for start in range(0, total, per_task)]
@@ -0,0 +1,293 @@
+"""
+Chat history persistence for LlamaDoc AI
+
+Answered questions are queued and written behind the request path: a single
+writer thread groups queued rows into one transaction (HISTORY_BATCH_SIZE
+rows or HISTORY_FLUSH_MS, whichever comes first). Rows get their id and
+created_at when they are queued, so callers can return the id right away
+and ordering follows request time, not commit time. Reads only wait for
+the writer when a row they would return is still queued.
+
+/history pages with a keyset cursor on (created_at, id) instead of
+OFFSET, so a page deep into a long conversation costs the same as the
+first one, and can project only the list columns (no full answers).
+"""
+import base64
+import os
+import threading
+import time
+from datetime import datetime
+from queue import Empty, Full, Queue
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, event, or_
+
+from models import ChatHistory, gen_uuid
+
+HISTORY_BATCH_SIZE = int(os.environ.get("HISTORY_BATCH_SIZE", "100"))  # rows per transaction
+HISTORY_FLUSH_MS = float(os.environ.get("HISTORY_FLUSH_MS", "250"))  # longest a queued row waits for its batch
+HISTORY_QUEUE_SIZE = int(os.environ.get("HISTORY_QUEUE_SIZE", "10000"))  # queued rows before writes go inline
+HISTORY_PAGE_MAX = 200
+
+# Columns of the "summary" view: everything the history list shows, no full answer
+SUMMARY_COLUMNS = (
+    ChatHistory.id,
+    ChatHistory.upload_id,
+    ChatHistory.question,
+    ChatHistory.summary,
+    ChatHistory.question_audio_path,
+    ChatHistory.answer_audio_path,
+    ChatHistory.created_at,
+    ChatHistory.voice_type,
+    ChatHistory.audio_speed,
+    ChatHistory.is_muted,
+)
+
+_FLUSH = object()
+_STOP = object()
+
+
+def enable_sqlite_wal(engine) -> None:
+    """WAL lets /history read while the writer commits; NORMAL sync is safe under WAL"""
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+
+def ensure_indexes(engine) -> None:
+    """create_all() skips indexes of tables that already exist; add any that are missing"""
+    for index in ChatHistory.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+
+def encode_cursor(created_at: datetime, history_id: str) -> str:
+    raw = f"{created_at.isoformat()}|{history_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Raises ValueError for a cursor that was not produced by encode_cursor()"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, history_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), history_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def history_page(db, upload_id: Optional[str] = None, limit: int = 50,
+                 cursor: Optional[str] = None, view: str = "full") -> Tuple[List[dict], Optional[str]]:
+    """
+    One page of history, newest first. Returns (rows, next cursor or None).
+    `view` "summary" leaves out the full answer text.
+    """
+    limit = max(1, min(limit, HISTORY_PAGE_MAX))
+    query = db.query(ChatHistory) if view == "full" else db.query(*SUMMARY_COLUMNS)
+    if upload_id:
+        query = query.filter(ChatHistory.upload_id == upload_id)
+    if cursor:
+        created_at, history_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            ChatHistory.created_at < created_at,
+            and_(ChatHistory.created_at == created_at, ChatHistory.id < history_id),
+        ))
+    rows = query.order_by(ChatHistory.created_at.desc(), ChatHistory.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    if view == "full":
+        return [row.to_dict() for row in rows], next_cursor
+    return [
+        {**row._asdict(), "created_at": row.created_at.isoformat() if row.created_at else None}
+        for row in rows
+    ], next_cursor
+
+
+class HistoryWriter:
+    """
+    Background writer for ChatHistory rows. submit() only enqueues; one
+    thread commits queued rows in batches. When the queue is full the row is
+    written inline, so a stalled database slows requests instead of losing
+    history.
+    """
+
+    def __init__(self, session_factory, batch_size: int = HISTORY_BATCH_SIZE,
+                 flush_ms: float = HISTORY_FLUSH_MS, queue_size: int = HISTORY_QUEUE_SIZE,
+                 on_write: Optional[Callable[[float, int], None]] = None):
+        self.session_factory = session_factory
+        self.on_write = on_write  # called with (seconds, rows) after every transaction
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = max(0.0, flush_ms) / 1000
+        self._queue: Queue = Queue(maxsize=max(1, queue_size))
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._done = threading.Condition()
+        self._submitted = 0
+        self._processed = 0
+        self._pending: Dict[str, Optional[str]] = {}  # queued row id -> upload_id
+        self._pending_uploads: Counter = Counter()
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.batches = 0
+        self.inline_writes = 0
+        self.write_seconds = 0.0
+        self.last_write_ms = 0.0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Write everything still queued, then stop the thread"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        self._thread = None
+
+    def submit(self, upload_id: Optional[str], question: str, answer: str, summary: Optional[str] = None,
+               question_audio_path: Optional[str] = None, answer_audio_path: Optional[str] = None,
+               voice_type: str = "default", audio_speed: int = 180, is_muted: bool = False) -> str:
+        """Queue one history row and return its id"""
+        row = {
+            "id": gen_uuid(),
+            "upload_id": upload_id,
+            "question": question or "",
+            "answer": answer if isinstance(answer, str) else str(answer),
+            "summary": summary,
+            "question_audio_path": question_audio_path,
+            "answer_audio_path": answer_audio_path,
+            "created_at": datetime.utcnow(),
+            "voice_type": voice_type or "default",
+            "audio_speed": audio_speed or 180,
+            "is_muted": bool(is_muted),
+        }
+        self.start()
+        with self._done:
+            self._submitted += 1
+            self._pending[row["id"]] = upload_id
+            self._pending_uploads[upload_id] += 1
+        try:
+            self._queue.put_nowait(row)
+        except Full:
+            with self._done:
+                self.inline_writes += 1
+            self._write([row])
+        return row["id"]
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Commit everything queued so far now; True once it is written"""
+        with self._done:
+            target = self._submitted
+            if self._processed >= target:
+                return True
+        self._queue.put(_FLUSH)
+        with self._done:
+            return self._done.wait_for(lambda: self._processed >= target, timeout)
+
+    def pending(self, upload_id: Optional[str] = None, history_id: Optional[str] = None) -> bool:
+        """Whether a queued, not yet committed row matches (any row when both are None)"""
+        with self._done:
+            if history_id is not None:
+                return history_id in self._pending
+            if upload_id is not None:
+                return self._pending_uploads[upload_id] > 0
+            return bool(self._pending)
+
+    def flush_pending(self, upload_id: Optional[str] = None, history_id: Optional[str] = None,
+                      timeout: float = 5.0) -> bool:
+        """flush() only if a read for `upload_id` / `history_id` would miss a queued row"""
+        if not self.pending(upload_id, history_id):
+            return True
+        return self.flush(timeout)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            if item is _FLUSH:
+                continue
+            batch = [item]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                if item is _FLUSH:
+                    break
+                batch.append(item)
+            self._write(batch)
+        # Drain whatever arrived before the stop
+        rest = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                break
+            if isinstance(item, dict):
+                rest.append(item)
+        if rest:
+            self._write(rest)
+
+    def _write(self, rows: List[dict]) -> None:
+        start = time.perf_counter()
+        db = self.session_factory()
+        try:
+            db.bulk_insert_mappings(ChatHistory, rows)
+            db.commit()
+            written = True
+        except Exception as e:
+            db.rollback()
+            written = False
+            print(f"Warning: Could not save {len(rows)} history rows: {e}")
+        finally:
+            db.close()
+        elapsed = time.perf_counter() - start
+        with self._done:
+            if written:
+                self.rows_written += len(rows)
+            else:
+                self.rows_failed += len(rows)
+            self.batches += 1
+            self.write_seconds += elapsed
+            self.last_write_ms = round(elapsed * 1000, 2)
+            self._processed += len(rows)
+            for row in rows:
+                self._pending.pop(row["id"], None)
+                self._pending_uploads[row["upload_id"]] -= 1
+                if self._pending_uploads[row["upload_id"]] <= 0:
+                    del self._pending_uploads[row["upload_id"]]
+            self._done.notify_all()
+        if self.on_write:
+            self.on_write(elapsed, len(rows))
+
+    def stats(self) -> dict:
+        with self._done:
+            return {
+                "queued": self._submitted - self._processed,
+                "rows_written": self.rows_written,
+                "rows_failed": self.rows_failed,
+                "batches": self.batches,
+                "inline_writes": self.inline_writes,
+                "rows_per_batch": round((self.rows_written + self.rows_failed) / self.batches, 2) if self.batches else 0.0,
+                "last_write_ms": self.last_write_ms,
+                "avg_write_ms": round(self.write_seconds / self.batches * 1000, 2) if self.batches else 0.0,
+            }
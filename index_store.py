@@ -0,0 +1,800 @@
+"""
+On-disk FAISS index store for LlamaDoc AI
+
+Each upload is saved under INDEX_DIR/<upload_id>/ as:
+  - index.faiss       raw FAISS index (flat vectors and IVF inverted lists are
+                      memory-mapped on load; HNSW graphs are read into memory)
+  - docstore.jsonl.gz one JSON line per vector: docstore id, page_content, metadata
+  - lexical.json.gz   BM25 inverted index over the same chunks
+  - meta.json         small summary (chunk count, dimension, creation time)
+
+INDEX_DIR/registry.json maps PDF content hashes to the upload_id that owns
+the index, and alias upload_ids to that owner, so re-uploads of the same
+file share one index.
+
+An index can hold several documents (chunk metadata "document_id").
+Documents are appended with their existing embeddings and deleted by
+tombstoning their vector positions (listed in meta.json under
+"deleted_positions"; a delete rewrites only meta.json, and the positions are
+applied to the BM25 index on load); compact() later rebuilds the index
+without them.
+"""
+import gzip
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from ann import (ANN_EF_SEARCH, ANN_NPROBE, ReadWriteLock, Tombstones, apply_search_params,
+                 index_description, index_vectors, is_flat, is_lossy, rebuild_without)
+from embeddings import get_embedder
+from lexical import BM25Index
+from retrieval import HybridRetriever
+
+INDEX_DIR = Path(os.environ.get("INDEX_DIR", "uploads/indexes"))
+INDEX_MMAP = os.environ.get("INDEX_MMAP", "1") == "1"
+INDEX_CACHE_MAX_BYTES = int(os.environ.get("INDEX_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+INDEX_CACHE_POLICY = os.environ.get("INDEX_CACHE_POLICY", "lru").lower()  # 'lru' or 'lfu'
+INDEX_COMPACT_RATIO = float(os.environ.get("INDEX_COMPACT_RATIO", "0.1"))  # tombstoned share that triggers compaction
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.jsonl.gz"
+LEXICAL_FILE = "lexical.json.gz"
+META_FILE = "meta.json"
+REGISTRY_FILE = "registry.json"
+
+_UPLOAD_ID_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def estimate_bytes(vector: FAISS) -> int:
+    """Approximate resident size of a vector store: index codes plus docstore text"""
+    index = vector.index
+    code_size = getattr(index, "code_size", 0) or index.d * 4
+    size = index.ntotal * code_size
+    for doc in vector.docstore._dict.values():
+        size += len(doc.page_content.encode("utf-8"))
+        size += len(json.dumps(doc.metadata, default=str))
+    return size
+
+
+def entry_bytes(entry: dict) -> int:
+    size = estimate_bytes(entry["vector"])
+    if entry.get("lexical") is not None:
+        size += entry["lexical"].nbytes()
+    return size
+
+
+def make_entry(vector: FAISS, lexical: Optional[BM25Index] = None,
+               tombstones: Optional[Tombstones] = None, mapped: bool = False) -> dict:
+    """Build the {"retriever", "vector", "lexical", "tombstones", "lock"} entry used by the query endpoints
+
+    `lock` is a ReadWriteLock: searches share its read side, in-place updates
+    take the write side (`with entry["lock"]:`); `mapped`
+    marks an index that is memory-mapped read-only (flat vectors or IVF lists),
+    so it must be re-read into memory before it is written.
+    """
+    tombstones = tombstones or Tombstones()
+    if lexical is None:
+        lexical = BM25Index.from_vector(vector)
+    if tombstones.positions:
+        lexical.delete(vector.index_to_docstore_id[p] for p in tombstones.positions)
+    lock = ReadWriteLock()
+    entry = {
+        "retriever": HybridRetriever(vectorstore=vector, lexical=lexical, tombstones=tombstones, lock=lock),
+        "vector": vector,
+        "lexical": lexical,
+        "tombstones": tombstones,
+        "lock": lock,
+        "mapped": mapped,
+    }
+    entry["bytes"] = entry_bytes(entry)
+    return entry
+
+
+def needs_compaction(entry: dict) -> bool:
+    """Too many tombstones, or a flat index that has grown past the ANN threshold"""
+    index = entry["vector"].index
+    if not index.ntotal:
+        return False
+    dead = len(entry["tombstones"])
+    if dead and dead / index.ntotal >= INDEX_COMPACT_RATIO:
+        return True
+    return is_flat(index) and index_description(index.ntotal - dead, index.d) != "Flat"
+
+
+def valid_upload_id(upload_id: str) -> bool:
+    """Upload ids become directory names, so only allow uuid-like values"""
+    return bool(upload_id) and bool(_UPLOAD_ID_RE.match(upload_id))
+
+
+def index_path(upload_id: str) -> Path:
+    if not valid_upload_id(upload_id):
+        raise ValueError(f"Invalid upload_id: {upload_id!r}")
+    return INDEX_DIR / upload_id
+
+
+def save_vector(folder: Path, vector: FAISS, meta: Optional[dict] = None,
+                lexical: Optional[BM25Index] = None) -> Path:
+    """Write a FAISS vector store (and its BM25 index) into `folder` atomically (tmp dir + rename)"""
+    folder.parent.mkdir(parents=True, exist_ok=True)
+    tmp = folder.parent / f".{folder.name}.tmp"
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+
+    faiss.write_index(vector.index, str(tmp / INDEX_FILE))
+
+    with gzip.open(tmp / DOCSTORE_FILE, "wt", encoding="utf-8") as f:
+        for position in range(vector.index.ntotal):
+            doc_id = vector.index_to_docstore_id[position]
+            doc = vector.docstore.search(doc_id)
+            f.write(json.dumps({
+                "id": doc_id,
+                "page_content": doc.page_content,
+                "metadata": doc.metadata,
+            }, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+
+    if lexical is not None:
+        lexical.save(tmp / LEXICAL_FILE)
+
+    meta = dict(meta or {})
+    meta.update({
+        "chunks": vector.index.ntotal,
+        "dim": vector.index.d,
+        "index_type": type(vector.index).__name__,
+    })
+    meta.setdefault("created_at", time.time())
+    with open(tmp / META_FILE, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    if folder.exists():
+        shutil.rmtree(folder)
+    os.replace(tmp, folder)
+    return folder
+
+
+def save_index(upload_id: str, vector: FAISS, extra_meta: Optional[dict] = None,
+               lexical: Optional[BM25Index] = None) -> Path:
+    """Persist the index of one upload under INDEX_DIR/<upload_id>"""
+    meta = dict(extra_meta or {})
+    meta["upload_id"] = upload_id
+    return save_vector(index_path(upload_id), vector, meta, lexical)
+
+
+# File headers (fourcc) of flat indexes, whose vectors IO_FLAG_MMAP_IFC maps in place
+_FLAT_FOURCCS = {b"IxF2", b"IxFI", b"IxFl"}
+
+
+def _read_faiss_index(path: Path, mmap: bool = INDEX_MMAP):
+    """Read a FAISS index; with `mmap`, flat vectors and IVF inverted lists stay
+    on disk (read-only). HNSW graphs are always read fully into memory.
+
+    A mapped index must never be added to: swap it first (_ensure_writable).
+    """
+    if mmap:
+        with open(path, "rb") as f:
+            flat = f.read(4) in _FLAT_FOURCCS
+        flags = faiss.IO_FLAG_MMAP_IFC if flat else faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        try:
+            return faiss.read_index(str(path), flags)
+        except RuntimeError:
+            # Not every index type can be memory-mapped; fall back to a full read
+            pass
+    return faiss.read_index(str(path))
+
+
+def is_mapped(index) -> bool:
+    """True for a flat index whose vectors, or an IVF index whose inverted lists,
+    are memory-mapped from disk"""
+    flat = faiss.downcast_index(index)
+    if isinstance(flat, faiss.IndexFlatCodes):
+        return not flat.codes.is_owned
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return False
+    return isinstance(faiss.downcast_InvertedLists(ivf.invlists), faiss.OnDiskInvertedLists)
+
+
+def load_vector(folder: Path, mmap: bool = INDEX_MMAP) -> Optional[FAISS]:
+    """Load a vector store written by save_vector, or None when `folder` has none"""
+    if not (folder / INDEX_FILE).exists():
+        return None
+
+    index = _read_faiss_index(folder / INDEX_FILE, mmap)
+    apply_search_params(index, ef_search=ANN_EF_SEARCH, nprobe=ANN_NPROBE)
+
+    docs: Dict[str, Document] = {}
+    index_to_docstore_id: Dict[int, str] = {}
+    with gzip.open(folder / DOCSTORE_FILE, "rt", encoding="utf-8") as f:
+        for position, line in enumerate(f):
+            row = json.loads(line)
+            docs[row["id"]] = Document(page_content=row["page_content"], metadata=row["metadata"])
+            index_to_docstore_id[position] = row["id"]
+
+    return FAISS(
+        embedding_function=get_embedder(),
+        index=index,
+        docstore=InMemoryDocstore(docs),
+        index_to_docstore_id=index_to_docstore_id,
+    )
+
+
+def load_index(upload_id: str) -> Optional[FAISS]:
+    """Load a persisted upload index, or None when it does not exist on disk"""
+    return load_vector(index_path(upload_id))
+
+
+def load_lexical(upload_id: str) -> Optional[BM25Index]:
+    """Load the BM25 index of an upload, or None for indexes saved before it existed"""
+    return BM25Index.load(index_path(upload_id) / LEXICAL_FILE)
+
+
+def list_indexed_uploads() -> List[str]:
+    """upload_ids that own an index on disk (aliases excluded)"""
+    if not INDEX_DIR.exists():
+        return []
+    return [p.name for p in INDEX_DIR.iterdir()
+            if p.is_dir() and valid_upload_id(p.name) and (p / INDEX_FILE).exists()]
+
+
+def delete_index(upload_id: str) -> None:
+    folder = index_path(upload_id)
+    if folder.exists():
+        shutil.rmtree(folder)
+
+
+def read_meta(upload_id: str) -> Optional[dict]:
+    path = index_path(upload_id) / META_FILE
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_meta(upload_id: str, meta: dict) -> None:
+    """Replace meta.json atomically (tmp file + rename)"""
+    path = index_path(upload_id) / META_FILE
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, path)
+
+
+class IndexStore:
+    """
+    Bounded cache of vector stores keyed by upload_id.
+
+    Newly created indexes are written to disk immediately; indexes that only
+    exist on disk (e.g. after a restart or after eviction) are loaded lazily
+    on first access, so startup cost does not depend on how many PDFs have
+    been indexed. Resident indexes are kept under a byte budget and evicted
+    with an LRU or LFU policy. Every change is written to disk when it is
+    made, so evicting an entry never needs a write.
+    """
+
+    def __init__(self, max_bytes: int = INDEX_CACHE_MAX_BYTES, policy: str = INDEX_CACHE_POLICY):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown index cache policy: {policy!r}")
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._uses: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.resident_bytes = 0
+        self._content: Dict[str, str] = {}  # sha256 of PDF bytes -> owning upload_id
+        self._aliases: Dict[str, str] = {}  # alias upload_id -> owning upload_id
+        self._listeners: List[Callable[[str], None]] = []
+        self._locked_listeners: List[Callable[[str], None]] = []
+        self._compacting: Set[str] = set()
+        self._loading: Dict[str, threading.Lock] = {}  # upload_id -> lock held while it is read from disk
+        self._load_registry()
+
+    def __contains__(self, upload_id: str) -> bool:
+        if not valid_upload_id(upload_id):
+            return False
+        with self._lock:
+            upload_id = self._aliases.get(upload_id, upload_id)
+            if upload_id in self._entries:
+                return True
+        return (index_path(upload_id) / INDEX_FILE).exists()
+
+    def __getitem__(self, upload_id: str) -> dict:
+        entry = self.get(upload_id)
+        if entry is None:
+            raise KeyError(upload_id)
+        return entry
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, upload_id: str) -> Optional[dict]:
+        """
+        Resident entry of an upload, loading it from disk on a miss. Only the
+        loading upload_id waits for the disk read; lookups of other uploads
+        are not blocked by it.
+        """
+        if not valid_upload_id(upload_id):
+            return None
+        with self._lock:
+            upload_id = self._aliases.get(upload_id, upload_id)
+            entry = self._lookup(upload_id)
+            if entry is not None:
+                return entry
+            loading = self._loading.setdefault(upload_id, threading.Lock())
+        with loading:
+            with self._lock:
+                # Another request may have loaded it while we waited
+                entry = self._lookup(upload_id)
+                if entry is not None:
+                    return entry
+                self.misses += 1
+            try:
+                entry = self._load_entry(upload_id)
+            except BaseException:
+                with self._lock:
+                    self._loading.pop(upload_id, None)
+                raise
+            with self._lock:
+                # Unregister the loading lock only together with the insert, so a
+                # caller arriving in between finds the entry instead of reading again
+                self._loading.pop(upload_id, None)
+                # put() may have stored a newer entry while this one was read
+                current = self._entries.get(upload_id)
+                if current is not None:
+                    return current
+                # The upload may have been deleted while it was read
+                if entry is None or not (index_path(upload_id) / INDEX_FILE).exists():
+                    return None
+                return self._insert(upload_id, entry)
+
+    def put(self, upload_id: str, vector: FAISS, extra_meta: Optional[dict] = None) -> dict:
+        entry = make_entry(vector)
+        save_index(upload_id, vector, extra_meta, entry["lexical"])
+        with self._lock:
+            entry = self._insert(upload_id, entry)
+            self._notify_locked(upload_id)
+        self._notify(upload_id)
+        return entry
+
+    def delete(self, upload_id: str) -> None:
+        """Remove an upload. Aliases are simply dropped; if the owner of a shared
+        index is deleted, ownership passes to one of its aliases."""
+        with self._lock:
+            if upload_id in self._aliases:
+                del self._aliases[upload_id]
+                self._save_registry()
+                return
+            self._notify_locked(upload_id)
+            heirs = [alias for alias, owner in self._aliases.items() if owner == upload_id]
+            if not heirs:
+                self._drop(upload_id)
+                self._content = {h: u for h, u in self._content.items() if u != upload_id}
+                self._save_registry()
+                delete_index(upload_id)
+                heir = None
+            else:
+                heir = heirs[0]
+                entry = self._drop(upload_id)
+                os.replace(index_path(upload_id), index_path(heir))
+                meta = read_meta(heir) or {}
+                meta["upload_id"] = heir
+                write_meta(heir, meta)
+                if entry is not None:
+                    self._insert(heir, entry)
+                del self._aliases[heir]
+                self._aliases = {a: (heir if o == upload_id else o) for a, o in self._aliases.items()}
+                self._content = {h: (heir if u == upload_id else u) for h, u in self._content.items()}
+                self._save_registry()
+        self._notify(upload_id)
+        if heir:
+            self._notify(heir)
+
+    def detach(self, upload_id: str) -> str:
+        """
+        Make sure no other upload_id shares the index of `upload_id` before it
+        is modified: an alias gets its own copy of the owner's files, and if
+        `upload_id` owns a shared index the copy goes to one of its aliases.
+        Nothing is re-embedded. The content hash of `upload_id` is forgotten
+        because its index will no longer match the original PDF bytes.
+        """
+        heir = None
+        with self._lock:
+            owner = self._aliases.get(upload_id)
+            if owner is not None:
+                self._copy_index(owner, upload_id)
+                del self._aliases[upload_id]
+            else:
+                heirs = [alias for alias, o in self._aliases.items() if o == upload_id]
+                if heirs:
+                    heir = heirs[0]
+                    self._copy_index(upload_id, heir)
+                    del self._aliases[heir]
+                    self._aliases = {a: (heir if o == upload_id else o) for a, o in self._aliases.items()}
+                    self._content = {h: (heir if u == upload_id else u) for h, u in self._content.items()}
+            self._content = {h: u for h, u in self._content.items() if u != upload_id}
+            self._save_registry()
+        if heir:
+            self._notify(heir)
+        return upload_id
+
+    def documents(self, upload_id: str) -> Optional[List[dict]]:
+        """Documents in an upload's index with their live chunk and page counts"""
+        entry = self.get(upload_id)
+        if entry is None:
+            return None
+        owner = self.resolve(upload_id)
+        documents: Dict[str, dict] = {}
+        with entry["lock"].read():
+            vector, dead = entry["vector"], entry["tombstones"].positions
+            for position, doc_id in vector.index_to_docstore_id.items():
+                if position in dead:
+                    continue
+                metadata = vector.docstore.search(doc_id).metadata
+                document_id = metadata.get("document_id", owner)
+                info = documents.setdefault(document_id, {
+                    "document_id": document_id,
+                    "filename": metadata.get("filename") or os.path.basename(metadata.get("source", "")),
+                    "chunks": 0,
+                    "pages": set(),
+                })
+                info["chunks"] += 1
+                info["pages"].add(metadata.get("page"))
+        for info in documents.values():
+            info["pages"] = len(info["pages"])
+        return list(documents.values())
+
+    def add_documents(self, upload_id: str, new_vector: FAISS, replace: Optional[str] = None) -> dict:
+        """
+        Append the chunks of `new_vector` to an upload's index, reusing their
+        embeddings. With `replace`, that document's chunks are tombstoned in
+        the same step. Returns {"added", "removed"}.
+        """
+        owner = self.detach(upload_id)
+        entry = self.get(owner)
+        if entry is None:
+            raise KeyError(upload_id)
+        embeddings = index_vectors(new_vector.index)
+        texts, metadatas, ids = [], [], []
+        for position in range(new_vector.index.ntotal):
+            doc_id = new_vector.index_to_docstore_id[position]
+            doc = new_vector.docstore.search(doc_id)
+            texts.append(doc.page_content)
+            metadatas.append(doc.metadata)
+            ids.append(doc_id)
+        with entry["lock"]:
+            self._ensure_writable(owner, entry)
+            removed = self._tombstone_document(owner, entry, replace) if replace else 0
+            if ids:
+                entry["vector"].add_embeddings(list(zip(texts, embeddings.tolist())), metadatas=metadatas, ids=ids)
+                entry["lexical"].add(ids, texts)
+            self._save_entry(owner, entry)
+            self._notify_locked(owner)
+        self._resize(owner, entry)
+        self._notify(owner)
+        return {"added": len(ids), "removed": removed}
+
+    def remove_document(self, upload_id: str, document_id: str) -> int:
+        """Tombstone every chunk of one document; returns how many were removed"""
+        owner = self.resolve(upload_id)
+        entry = self.get(owner)
+        if entry is None:
+            raise KeyError(upload_id)
+        with entry["lock"].read():
+            if not self._document_positions(owner, entry, document_id):
+                return 0
+        owner = self.detach(upload_id)
+        entry = self.get(owner)
+        with entry["lock"]:
+            removed = self._tombstone_document(owner, entry, document_id)
+            # Only the tombstone list changed: the index and docstore files stay as they are
+            self._save_tombstones(owner, entry)
+            self._notify_locked(owner)
+        self._resize(owner, entry)
+        self._notify(owner)
+        return removed
+
+    def compact(self, upload_id: str) -> Optional[dict]:
+        """
+        Rebuild an index without its tombstoned vectors (and as ANN if it has
+        grown large). The new index is built outside the lock, so searches
+        continue meanwhile; updates made during the build are carried over.
+        """
+        owner = self.resolve(upload_id)
+        entry = self.get(owner)
+        if entry is None:
+            return None
+        with self._lock:
+            if owner in self._compacting:
+                return None
+            self._compacting.add(owner)
+        try:
+            return self._compact(owner, entry)
+        finally:
+            with self._lock:
+                self._compacting.discard(owner)
+
+    def _compact(self, owner: str, entry: dict) -> dict:
+        start = time.perf_counter()
+        vector, tombstones = entry["vector"], entry["tombstones"]
+        with entry["lock"]:
+            self._ensure_writable(owner, entry)
+            snapshot = vector.index.ntotal
+            dead = set(tombstones.positions)
+            id_map = dict(vector.index_to_docstore_id)
+            # PQ/SQ8 codes only decode to approximations; rebuilding from those
+            # would lose a little recall on every compaction, so re-embed the text
+            lossy = is_lossy(vector.index)
+            if lossy:
+                texts = {p: vector.docstore.search(id_map[p]).page_content for p in range(snapshot) if p not in dead}
+            else:
+                vectors = index_vectors(vector.index)
+        if lossy:
+            vectors = np.zeros((snapshot, vector.index.d), dtype=np.float32)  # dead rows stay unused
+            vectors[list(texts)] = self._embed(vector, list(texts.values()))
+        index, new_map, dropped = rebuild_without(vectors, id_map, dead)
+
+        with entry["lock"]:
+            old_to_new = {old: new for new, old in enumerate(p for p in range(snapshot) if p not in dead)}
+            if vector.index.ntotal > snapshot:
+                if lossy:
+                    appended = self._embed(vector, [
+                        vector.docstore.search(vector.index_to_docstore_id[p]).page_content
+                        for p in range(snapshot, vector.index.ntotal)
+                    ])
+                else:
+                    appended = index_vectors(vector.index)[snapshot:]
+                for offset in range(len(appended)):
+                    old_to_new[snapshot + offset] = index.ntotal + offset
+                    new_map[index.ntotal + offset] = vector.index_to_docstore_id[snapshot + offset]
+                index.add(appended)
+            late = [old_to_new[p] for p in tombstones.positions - dead if p in old_to_new]
+            vector.index = index
+            vector.index_to_docstore_id = new_map
+            if dropped:
+                vector.docstore.delete(dropped)
+            tombstones.reset(late)
+            entry["lexical"].compact()
+            entry["mapped"] = False
+            # The upload may have been deleted while the index was rebuilt
+            if (index_path(owner) / INDEX_FILE).exists():
+                self._save_entry(owner, entry)
+        self._resize(owner, entry)
+        seconds = time.perf_counter() - start
+        print(f"🧹 Compacted index {owner}: {len(dropped)} removed, {index.ntotal} kept in {seconds:.2f}s")
+        return {
+            "upload_id": owner,
+            "removed": len(dropped),
+            "chunks": index.ntotal,
+            "index_type": type(index).__name__,
+            "seconds": round(seconds, 3),
+        }
+
+    @staticmethod
+    def _embed(vector: FAISS, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, vector.index.d), dtype=np.float32)
+        embeddings = np.asarray(vector.embedding_function.embed_documents(texts), dtype=np.float32)
+        if embeddings.shape != (len(texts), vector.index.d):
+            raise ValueError(f"Embedding model output {embeddings.shape[-1]} does not match the index dimension {vector.index.d}")
+        return embeddings
+
+    def compact_due(self) -> List[dict]:
+        """Compact every resident index that needs it (see needs_compaction)"""
+        with self._lock:
+            due = [uid for uid, entry in self._entries.items() if needs_compaction(entry)]
+        return [result for result in (self.compact(uid) for uid in due) if result]
+
+    def add_listener(self, callback: Callable[[str], None], locked: bool = False) -> None:
+        """
+        Call `callback(owner_upload_id)` whenever an index is replaced, changed
+        or deleted. `locked` callbacks run before the index lock is released,
+        so no search sees the change first; they must be quick and must not
+        call back into the store.
+        """
+        (self._locked_listeners if locked else self._listeners).append(callback)
+
+    def _notify_locked(self, upload_id: str) -> None:
+        self._notify(upload_id, self._locked_listeners)
+
+    def _notify(self, upload_id: str, listeners: Optional[List[Callable[[str], None]]] = None) -> None:
+        for callback in self._listeners if listeners is None else listeners:
+            try:
+                callback(upload_id)
+            except Exception as e:
+                print(f"Warning: index change listener failed: {e}")
+
+    def resolve(self, upload_id: str) -> str:
+        """Return the upload_id that owns the index for `upload_id` (itself unless aliased)"""
+        with self._lock:
+            return self._aliases.get(upload_id, upload_id)
+
+    def lookup_content(self, content_hash: str) -> Optional[str]:
+        """Return the upload_id already indexed for this PDF content hash, if it still exists"""
+        with self._lock:
+            owner = self._content.get(content_hash)
+        if owner and owner in self:
+            return owner
+        return None
+
+    def register_content(self, content_hash: str, upload_id: str) -> None:
+        with self._lock:
+            self._content[content_hash] = upload_id
+            self._save_registry()
+
+    def alias(self, upload_id: str, owner: str) -> None:
+        """Make `upload_id` share the index of `owner`"""
+        if not valid_upload_id(upload_id):
+            raise ValueError(f"Invalid upload_id: {upload_id!r}")
+        with self._lock:
+            self._aliases[upload_id] = self._aliases.get(owner, owner)
+            self._save_registry()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            tombstoned = sum(len(e["tombstones"]) for e in self._entries.values())
+            return {
+                "policy": self.policy,
+                "max_bytes": self.max_bytes,
+                "resident_bytes": self.resident_bytes,
+                "resident_indexes": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "tombstoned_vectors": tombstoned,
+                "indexes": {uid: e["bytes"] for uid, e in self._entries.items()},
+            }
+
+    # Update helpers (callers hold entry["lock"], never self._lock)
+
+    def _ensure_writable(self, upload_id: str, entry: dict) -> None:
+        """Swap a read-only memory-mapped index for an in-memory copy"""
+        if entry.get("mapped"):
+            index = _read_faiss_index(index_path(upload_id) / INDEX_FILE, mmap=False)
+            apply_search_params(index, ef_search=ANN_EF_SEARCH, nprobe=ANN_NPROBE)
+            entry["vector"].index = index
+            entry["mapped"] = False
+
+    def _document_positions(self, owner: str, entry: dict, document_id: str) -> List[int]:
+        vector, dead = entry["vector"], entry["tombstones"].positions
+        return [
+            position for position, doc_id in vector.index_to_docstore_id.items()
+            if position not in dead
+            and vector.docstore.search(doc_id).metadata.get("document_id", owner) == document_id
+        ]
+
+    def _tombstone_document(self, owner: str, entry: dict, document_id: str) -> int:
+        positions = self._document_positions(owner, entry, document_id)
+        entry["tombstones"].add(positions)
+        entry["lexical"].delete(entry["vector"].index_to_docstore_id[p] for p in positions)
+        return len(positions)
+
+    def _save_entry(self, upload_id: str, entry: dict) -> None:
+        """Rewrite all files of an index; a memory-mapped index is read into memory first,
+        since writing it would only store a header pointing at its mapped lists"""
+        self._ensure_writable(upload_id, entry)
+        meta = read_meta(upload_id) or {}
+        meta["deleted_positions"] = sorted(entry["tombstones"].positions)
+        save_index(upload_id, entry["vector"], meta, entry["lexical"])
+
+    def _save_tombstones(self, upload_id: str, entry: dict) -> None:
+        meta = read_meta(upload_id) or {}
+        meta["deleted_positions"] = sorted(entry["tombstones"].positions)
+        write_meta(upload_id, meta)
+
+    def _resize(self, upload_id: str, entry: dict) -> None:
+        with self._lock:
+            if self._entries.get(upload_id) is entry:
+                new_bytes = entry_bytes(entry)
+                self.resident_bytes += new_bytes - entry["bytes"]
+                entry["bytes"] = new_bytes
+                self._evict_over_budget(keep=upload_id)
+
+    def _load_entry(self, upload_id: str) -> Optional[dict]:
+        """Read an upload's index files into a new entry (no store lock held)"""
+        vector = load_index(upload_id)
+        if vector is None:
+            return None
+        lexical = load_lexical(upload_id)
+        meta = read_meta(upload_id) or {}
+        entry = make_entry(vector, lexical, Tombstones(meta.get("deleted_positions", [])),
+                           mapped=is_mapped(vector.index))
+        if lexical is None:
+            # Older index without a BM25 file: persist the one just built
+            entry["lexical"].save(index_path(upload_id) / LEXICAL_FILE)
+        return entry
+
+    # Internal helpers (callers hold self._lock)
+
+    def _lookup(self, upload_id: str) -> Optional[dict]:
+        entry = self._entries.get(upload_id)
+        if entry is not None:
+            self.hits += 1
+            self._touch(upload_id)
+        return entry
+
+    def _copy_index(self, source: str, target: str) -> None:
+        tmp = INDEX_DIR / f".{target}.tmp"
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        shutil.copytree(index_path(source), tmp)
+        with open(tmp / META_FILE, encoding="utf-8") as f:
+            meta = json.load(f)
+        meta["upload_id"] = target
+        with open(tmp / META_FILE, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        if index_path(target).exists():
+            shutil.rmtree(index_path(target))
+        os.replace(tmp, index_path(target))
+
+    def _load_registry(self) -> None:
+        path = INDEX_DIR / REGISTRY_FILE
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            self._content = data.get("content", {})
+            self._aliases = data.get("aliases", {})
+
+    def _save_registry(self) -> None:
+        INDEX_DIR.mkdir(parents=True, exist_ok=True)
+        path = INDEX_DIR / REGISTRY_FILE
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"content": self._content, "aliases": self._aliases}, f)
+        os.replace(tmp, path)
+
+    def _touch(self, upload_id: str) -> None:
+        self._entries.move_to_end(upload_id)
+        self._uses[upload_id] = self._uses.get(upload_id, 0) + 1
+
+    def _insert(self, upload_id: str, entry: dict) -> dict:
+        self._drop(upload_id)
+        self._entries[upload_id] = entry
+        self._uses[upload_id] = 1
+        self.resident_bytes += entry["bytes"]
+        self._evict_over_budget(keep=upload_id)
+        return entry
+
+    def _drop(self, upload_id: str) -> Optional[dict]:
+        entry = self._entries.pop(upload_id, None)
+        self._uses.pop(upload_id, None)
+        if entry is not None:
+            self.resident_bytes -= entry["bytes"]
+        return entry
+
+    def _victim(self, keep: str) -> Optional[str]:
+        candidates = [uid for uid in self._entries if uid != keep]
+        if not candidates:
+            return None
+        if self.policy == "lfu":
+            # Least used wins; OrderedDict order breaks ties by recency
+            return min(candidates, key=lambda uid: self._uses.get(uid, 0))
+        return candidates[0]
+
+    def _evict_over_budget(self, keep: str) -> None:
+        while self.resident_bytes > self.max_bytes:
+            victim = self._victim(keep)
+            if victim is None:
+                # A single index larger than the budget stays resident while in use
+                break
+            entry = self._drop(victim)
+            self.evictions += 1
+            print(f"♻️ Evicted index {victim} ({entry['bytes']} bytes) from memory")
@@ -0,0 +1,222 @@
+"""
+PDF ingestion workers for LlamaDoc AI
+
+Text extraction and chunking are CPU-bound, so they run in a process pool;
+embedding releases the GIL inside torch, so it runs in a thread pool that
+shares the process-wide embedder. Neither blocks the event loop.
+
+A PDF is split into page ranges (see extractors.py) that are extracted in
+parallel by the worker processes. Only a bounded window of ranges is in
+flight, and finished ranges are embedded in page order while later ones are
+still being extracted, so peak transient memory depends on the window size,
+not the PDF size.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from ann import optimize_index
+from embeddings import get_embedder
+from extractors import PdfplumberExtractor, get_extractor, page_ranges
+
+INGEST_PARSE_WORKERS = int(os.environ.get("INGEST_PARSE_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+INGEST_EMBED_WORKERS = int(os.environ.get("INGEST_EMBED_WORKERS", "2"))
+INGEST_MAX_PENDING = int(os.environ.get("INGEST_MAX_PENDING", "16"))
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+INGEST_QUEUE_BATCHES = int(os.environ.get("INGEST_QUEUE_BATCHES", "2"))  # extracted ranges waiting beyond the workers
+UPLOAD_READ_CHUNK = 1024 * 1024  # bytes read per step when streaming an upload to disk
+
+
+class IngestionBusy(Exception):
+    """Raised when the ingestion queue is full and the caller should retry later"""
+
+
+def split_pages(pages: List[Document], metadata: Optional[dict] = None) -> List[Document]:
+    """Split extracted pages into chunks, adding `metadata` (e.g. document_id, filename) to each"""
+    # start_index lets the context assembler put chunks of a page back in order
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True
+    )
+    chunks = text_splitter.split_documents(pages)
+    if metadata:
+        for chunk in chunks:
+            chunk.metadata.update(metadata)
+    return chunks
+
+
+def count_pages(file_path: str, extractor: Optional[str] = None) -> Tuple[int, str]:
+    """Return (page count, extractor name to use); PDFs PDFium cannot open go to pdfplumber"""
+    backend = get_extractor(extractor)
+    try:
+        return backend.page_count(file_path), backend.name
+    except Exception:
+        if backend.name == PdfplumberExtractor.name or not PdfplumberExtractor.available():
+            raise
+        print(f"Warning: {backend.name} could not open {os.path.basename(file_path)}, using pdfplumber")
+        return PdfplumberExtractor().page_count(file_path), PdfplumberExtractor.name
+
+
+def extract_and_split(file_path: str, start: int, stop: int, extractor: Optional[str] = None,
+                      metadata: Optional[dict] = None) -> Tuple[List[Document], float, float]:
+    """Extract and split pages start..stop-1 (runs in a worker process)
+
+    Returns (chunks, extraction seconds, splitting seconds).
+    """
+    started = time.perf_counter()
+    pages = list(get_extractor(extractor).extract(file_path, start, stop))
+    extracted = time.perf_counter()
+    chunks = split_pages(pages, metadata)
+    return chunks, extracted - started, time.perf_counter() - extracted
+
+
+def extract_chunks(file_path: str, start: int, stop: int, extractor: Optional[str] = None,
+                   metadata: Optional[dict] = None) -> List[Document]:
+    """Extract and split pages start..stop-1 of a PDF (runs in a worker process)"""
+    return extract_and_split(file_path, start, stop, extractor, metadata)[0]
+
+
+def add_to_index(vector: Optional[FAISS], documents: List[Document]) -> Optional[FAISS]:
+    """Embed `documents` with the shared embedder and add them to `vector` (created if None)"""
+    if not documents:
+        return vector
+    embedder = get_embedder()
+    texts = [d.page_content for d in documents]
+    metadatas = [d.metadata for d in documents]
+    text_embeddings = list(zip(texts, embedder.embed_documents(texts)))
+    if vector is None:
+        return FAISS.from_embeddings(text_embeddings, embedder, metadatas=metadatas)
+    vector.add_embeddings(text_embeddings, metadatas=metadatas)
+    return vector
+
+
+class IngestionPool:
+    """
+    Process pool for parsing plus thread pool for embedding, with a bounded
+    number of in-flight uploads. When the bound is reached new work is
+    rejected with IngestionBusy instead of queueing without limit.
+    """
+
+    def __init__(self, parse_workers: int = INGEST_PARSE_WORKERS,
+                 embed_workers: int = INGEST_EMBED_WORKERS,
+                 max_pending: int = INGEST_MAX_PENDING):
+        self.parse_workers = max(1, parse_workers)
+        self.embed_workers = max(1, embed_workers)
+        self.max_pending = max(1, max_pending)
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.embed_workers,
+                                                   thread_name_prefix="embed")
+
+    def shutdown(self) -> None:
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+            self._thread_pool = None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def acquire(self) -> None:
+        """Reserve an ingestion slot or raise IngestionBusy"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise IngestionBusy(f"Ingestion queue is full ({self.max_pending} uploads in progress)")
+            self._pending += 1
+
+    def release(self) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def ingest(self, file_path: str,
+                     on_start: Optional[Callable[[int], None]] = None,
+                     on_batch: Optional[Callable[[int, int], None]] = None,
+                     metadata: Optional[dict] = None,
+                     extractor: Optional[str] = None,
+                     on_stage: Optional[Callable[[str, float], None]] = None) -> Tuple[int, Optional[FAISS]]:
+        """Extract page ranges in parallel worker processes and embed them in page order
+
+        `on_start(pages_total)` is called once, `on_batch(pages_done, chunks)`
+        after every range is indexed, and `on_stage(stage, seconds)` with the
+        time of each "extract", "split", "embed" and "optimize" step. Returns
+        (pages, vector store or None when no text was extracted).
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        stage = on_stage or (lambda name, seconds: None)
+        total, extractor = await loop.run_in_executor(self._process_pool, count_pages, file_path, extractor)
+        if on_start:
+            on_start(total)
+
+        ranges = iter(page_ranges(total))
+        in_flight = deque()
+
+        def submit_next() -> None:
+            pages = next(ranges, None)
+            if pages is not None:
+                in_flight.append((pages, loop.run_in_executor(
+                    self._process_pool, extract_and_split, file_path, pages.start, pages.stop, extractor, metadata
+                )))
+
+        for _ in range(self.parse_workers + INGEST_QUEUE_BATCHES):
+            submit_next()
+        vector = None
+        try:
+            while in_flight:
+                pages, extracted = in_flight.popleft()
+                chunks, extract_seconds, split_seconds = await extracted
+                submit_next()
+                stage("extract", extract_seconds)
+                stage("split", split_seconds)
+                embed_start = time.perf_counter()
+                vector = await loop.run_in_executor(self._thread_pool, add_to_index, vector, chunks)
+                stage("embed", time.perf_counter() - embed_start)
+                if on_batch:
+                    on_batch(pages.stop, len(chunks))
+        finally:
+            for _, extracted in in_flight:
+                extracted.cancel()
+        # Large documents switch from exact flat search to ANN
+        optimize_start = time.perf_counter()
+        vector = await loop.run_in_executor(self._thread_pool, optimize_index, vector)
+        stage("optimize", time.perf_counter() - optimize_start)
+        return total, vector
+
+    async def run_in_thread(self, fn, *args):
+        """Run blocking helper work (e.g. index persistence) on the embed threads"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._thread_pool, fn, *args)
+
+    async def run_in_process(self, fn, *args):
+        """Run CPU-bound work (e.g. extracting a page range) on the parse processes"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._process_pool, fn, *args)
+
+    def stats(self) -> dict:
+        return {
+            "parse_workers": self.parse_workers,
+            "embed_workers": self.embed_workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+        }
@@ -0,0 +1,132 @@
+"""
+Background ingestion job tracking for LlamaDoc AI
+"""
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+JOB_TTL_SECONDS = 3600  # finished jobs are forgotten after an hour
+
+ACTIVE_STATUSES = ("queued", "parsing", "embedding", "indexing")
+
+
+class IngestionJob:
+    """
+    Progress of one PDF ingestion. Updated from worker threads, read by the
+    job-status and SSE endpoints; every update bumps `version` so streams
+    know when there is something new to send.
+    """
+
+    def __init__(self, upload_id: str, filename: str,
+                 document_id: Optional[str] = None, operation: str = "create",
+                 extractor: Optional[str] = None):
+        self.job_id = str(uuid.uuid4())
+        self.upload_id = upload_id
+        self.filename = filename
+        self.document_id = document_id or upload_id
+        self.operation = operation  # 'create', 'append' or 'replace'
+        self.extractor = extractor  # PDF text extractor, None = default
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.pages_total = 0
+        self.pages_parsed = 0
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.created_at = time.time()
+        self.embed_started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def update(self, **fields) -> None:
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            if fields.get("status") == "embedding" and self.embed_started_at is None:
+                self.embed_started_at = time.time()
+            if fields.get("status") in ("done", "failed"):
+                self.finished_at = time.time()
+            self.version += 1
+
+    def add_batch(self, pages_parsed: int, chunks: int) -> None:
+        """Record one indexed batch from the streaming pipeline"""
+        with self._lock:
+            if self.embed_started_at is None:
+                self.embed_started_at = time.time()
+                self.status = "embedding"
+            self.pages_parsed = pages_parsed
+            self.chunks_total += chunks
+            self.chunks_embedded += chunks
+            self.version += 1
+
+    @property
+    def finished(self) -> bool:
+        return self.status not in ACTIVE_STATUSES
+
+    def eta_seconds(self) -> Optional[float]:
+        """Estimate remaining time from the page (or chunk) rate so far"""
+        if self.finished:
+            return 0.0
+        if not self.embed_started_at:
+            return None
+        elapsed = time.time() - self.created_at
+        if self.pages_total and 0 < self.pages_parsed < self.pages_total:
+            return round(elapsed / self.pages_parsed * (self.pages_total - self.pages_parsed), 1)
+        if self.chunks_total and 0 < self.chunks_embedded < self.chunks_total:
+            return round(elapsed / self.chunks_embedded * (self.chunks_total - self.chunks_embedded), 1)
+        return None
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "upload_id": self.upload_id,
+                "filename": self.filename,
+                "document_id": self.document_id,
+                "operation": self.operation,
+                "extractor": self.extractor,
+                "status": self.status,
+                "error": self.error,
+                "pages_total": self.pages_total,
+                "pages_parsed": self.pages_parsed,
+                "chunks_total": self.chunks_total,
+                "chunks_embedded": self.chunks_embedded,
+                "eta_seconds": self.eta_seconds(),
+                "elapsed_seconds": round((self.finished_at or time.time()) - self.created_at, 2),
+            }
+
+
+class JobRegistry:
+    """In-memory registry of ingestion jobs; finished jobs expire after JOB_TTL_SECONDS"""
+
+    def __init__(self, ttl_seconds: int = JOB_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._lock = threading.Lock()
+
+    def create(self, upload_id: str, filename: str,
+               document_id: Optional[str] = None, operation: str = "create",
+               extractor: Optional[str] = None) -> IngestionJob:
+        job = IngestionJob(upload_id, filename, document_id, operation, extractor)
+        with self._lock:
+            self._expire()
+            self._jobs[job.job_id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def find_active(self, upload_id: str) -> Optional[IngestionJob]:
+        """Return the unfinished job building `upload_id`, if any"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.upload_id == upload_id and not job.finished:
+                    return job
+        return None
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        for job_id in [j.job_id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
@@ -0,0 +1,170 @@
+"""
+BM25 inverted index for LlamaDoc AI
+
+Built next to each FAISS index so exact identifiers (part numbers, error
+codes, clause IDs) that embeddings blur together can still be found.
+Postings are stored as compact integer arrays, documents can be appended
+or deleted (tombstoned) without a rebuild, and the whole index is saved as
+gzipped JSON next to the FAISS file.
+"""
+import gzip
+import heapq
+import json
+import math
+import re
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Identifiers such as "ERR-404", "3.2.1" or "A_17b" are kept whole; their parts
+# are indexed too so "404" also matches "ERR-404"
+_TOKEN_RE = re.compile(r"[A-Za-z0-9]+(?:[-_./:][A-Za-z0-9]+)*")
+_PART_RE = re.compile(r"[A-Za-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        parts = _PART_RE.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """
+    Inverted index over the chunks of one upload, keyed by docstore id.
+    Each term maps to two parallel uint32 arrays: document positions and
+    term frequencies.
+    """
+
+    def __init__(self):
+        self.doc_ids: List[str] = []
+        self.doc_lengths = array("I")
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.deleted: Set[int] = set()
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_ids) - len(self.deleted)
+
+    @property
+    def avg_length(self) -> float:
+        live = len(self)
+        return self._total_length / live if live else 0.0
+
+    def add(self, doc_ids: Iterable[str], texts: Iterable[str]) -> None:
+        """Append documents; existing postings are extended in place"""
+        for doc_id, text in zip(doc_ids, texts):
+            position = len(self.doc_ids)
+            tokens = tokenize(text)
+            self.doc_ids.append(doc_id)
+            self.doc_lengths.append(len(tokens))
+            self._total_length += len(tokens)
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for term, tf in counts.items():
+                positions, freqs = self.postings.setdefault(term, (array("I"), array("I")))
+                positions.append(position)
+                freqs.append(tf)
+
+    def delete(self, doc_ids: Iterable[str]) -> None:
+        """Tombstone documents; call compact() to reclaim their postings"""
+        wanted = set(doc_ids)
+        for position, doc_id in enumerate(self.doc_ids):
+            if doc_id in wanted and position not in self.deleted:
+                self.deleted.add(position)
+                self._total_length -= self.doc_lengths[position]
+
+    def compact(self) -> None:
+        """Rebuild postings without tombstoned documents"""
+        if not self.deleted:
+            return
+        remap = {}
+        doc_ids, doc_lengths = [], array("I")
+        for position, doc_id in enumerate(self.doc_ids):
+            if position not in self.deleted:
+                remap[position] = len(doc_ids)
+                doc_ids.append(doc_id)
+                doc_lengths.append(self.doc_lengths[position])
+        postings = {}
+        for term, (positions, freqs) in self.postings.items():
+            new_positions, new_freqs = array("I"), array("I")
+            for position, tf in zip(positions, freqs):
+                if position in remap:
+                    new_positions.append(remap[position])
+                    new_freqs.append(tf)
+            if new_positions:
+                postings[term] = (new_positions, new_freqs)
+        self.doc_ids, self.doc_lengths, self.postings, self.deleted = doc_ids, doc_lengths, postings, set()
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Return up to k (doc_id, BM25 score) pairs, best first"""
+        # compact() swaps these in one assignment, so read a consistent snapshot
+        doc_ids, doc_lengths, postings, deleted = self.doc_ids, self.doc_lengths, self.postings, self.deleted
+        live = len(doc_ids) - len(deleted)
+        if not live:
+            return []
+        avg_length = self.avg_length or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            posting = postings.get(term)
+            if posting is None:
+                continue
+            positions, freqs = posting
+            df = len(positions)
+            idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+            for position, tf in zip(positions, freqs):
+                if position in deleted:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[position] / avg_length)
+                scores[position] = scores.get(position, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(doc_ids[position], score) for position, score in best]
+
+    def nbytes(self) -> int:
+        """Approximate memory used by the postings arrays"""
+        size = self.doc_lengths.itemsize * len(self.doc_lengths)
+        for term, (positions, freqs) in self.postings.items():
+            size += len(term) + positions.itemsize * (len(positions) + len(freqs))
+        return size
+
+    def save(self, path: Path) -> None:
+        self.compact()
+        data = {
+            "doc_ids": self.doc_ids,
+            "doc_lengths": self.doc_lengths.tolist(),
+            "postings": {term: [p.tolist(), f.tolist()] for term, (p, f) in self.postings.items()},
+        }
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["BM25Index"]:
+        if not path.exists():
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls()
+        index.doc_ids = data["doc_ids"]
+        index.doc_lengths = array("I", data["doc_lengths"])
+        index.postings = {
+            term: (array("I", positions), array("I", freqs))
+            for term, (positions, freqs) in data["postings"].items()
+        }
+        index._total_length = sum(index.doc_lengths)
+        return index
+
+    @classmethod
+    def from_vector(cls, vector) -> "BM25Index":
+        """Build from the docstore of a LangChain FAISS store, in index order"""
+        index = cls()
+        doc_ids = [vector.index_to_docstore_id[i] for i in range(vector.index.ntotal)]
+        index.add(doc_ids, (vector.docstore.search(doc_id).page_content for doc_id in doc_ids))
+        return index
@@ -1,4 +1,8 @@
 import os
+import asyncio
+import hashlib
+import json
+import time
 import uuid
 import warnings
 from contextlib import asynccontextmanager
@@ -6,25 +10,34 @@ import markdown
 from markdown.extensions.codehilite import CodeHiliteExtension
 from markdown.extensions.fenced_code import FencedCodeExtension
 from markdown.extensions.tables import TableExtension
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Depends, Form
-from fastapi.responses import HTMLResponse, JSONResponse, Response, FileResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Form
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-from langchain.chains import RetrievalQA
-from langchain.chains.llm import LLMChain
-from langchain.chains.combine_documents.stuff import StuffDocumentsChain
-from langchain.prompts import PromptTemplate
-from langchain_community.document_loaders import PDFPlumberLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
-from langchain_community.chat_models import ChatOpenAI
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import sessionmaker
 from models import Base, ChatHistory
+from speech import AudioDecodeError, RecognizerUnavailable, SpeechNotUnderstood, SpeechService
+from exports import (EXPORT_DOCX_MAX_ENTRIES, EXPORT_FORMATS, ExportCache, ExportTooLarge, iter_bytes,
+                     iter_conversation, render_conversation, render_entry, stream_conversation)
+from tts import TTSService, normalize_settings, tts_available
+from history import HistoryWriter, enable_sqlite_wal, ensure_indexes, history_page
+from embeddings import get_embedder
+from index_store import IndexStore, list_indexed_uploads, load_index, valid_upload_id
+from ingestion import IngestionPool, IngestionBusy, UPLOAD_READ_CHUNK
+from extractors import EXTRACTORS
+from bulk import BulkCheckpoint, checkpoint_path, file_sha256, run_bulk
+from jobs import JobRegistry, IngestionJob
+from qa import get_qa_service, close_qa_service
+from answer_cache import AnswerCache
+from corpus import CorpusIndex
+from retrieval import resolve_retrieval_options, settings_key
+from rerank import get_reranker
+from metrics import Metrics, METRICS_TIMING_HEADERS, finish_request_timing, server_timing_header, start_request_timing
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 # Suppress LangChain deprecation warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning, module="langchain")
@@ -34,21 +47,80 @@ warnings.filterwarnings("ignore", category=DeprecationWarning, module="langchain
 async def lifespan(app: FastAPI):
     # Startup
     print("🦙 LlamaDoc AI - Starting up...")
+    embedder = get_embedder().load()
+    if os.environ.get("EMBEDDING_WARMUP", "1") == "1":
+        embedder.warmup()
+        print("✅ Embedding model warmed up")
+    get_qa_service()
+    get_reranker().load()
+    corpus_flusher = asyncio.create_task(_flush_corpus_periodically())
+    index_compactor = asyncio.create_task(_compact_indexes_periodically())
+    INGESTION_POOL.start()
+    HISTORY_WRITER.start()
+    print(f"✅ Ingestion pool started ({INGESTION_POOL.parse_workers} parse / {INGESTION_POOL.embed_workers} embed workers)")
     print("✅ Database initialized")
     print("✅ Static files mounted")
     print("✅ Ready to process PDFs!")
     yield
     # Shutdown
     print("🔄 LlamaDoc AI - Shutting down gracefully...")
+    corpus_flusher.cancel()
+    index_compactor.cancel()
+    CORPUS.flush()
+    INGESTION_POOL.shutdown()
+    TTS_SERVICE.shutdown()
+    SPEECH_SERVICE.shutdown()
+    await asyncio.to_thread(HISTORY_WRITER.stop)
+    await close_qa_service()
 
 app = FastAPI(title="PDF QA with LangChain & FastAPI", lifespan=lifespan)
 
+# Per-stage and per-request latency histograms, served at /metrics
+METRICS = Metrics()
+
+@app.middleware("http")
+async def record_request_timing(request: Request, call_next):
+    """
+    Time every request; add Server-Timing when enabled or asked for with X-Debug-Timings: 1.
+    The request histogram is observed once the body has been sent, so streamed
+    responses count their whole duration; their Server-Timing header (sent
+    before the body) only covers the time to the first byte.
+    """
+    token = start_request_timing()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        stages = finish_request_timing(token)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    path = route.path if route else "unmatched"
+    if METRICS_TIMING_HEADERS or request.headers.get("x-debug-timings") == "1":
+        response.headers["Server-Timing"] = server_timing_header(stages, elapsed)
+        response.headers["X-Response-Time-Ms"] = str(round(elapsed * 1000, 2))
+
+    body = getattr(response, "body_iterator", None)
+    if body is None:
+        METRICS.observe_request(request.method, path, response.status_code, elapsed)
+        return response
+
+    async def timed_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            METRICS.observe_request(request.method, path, response.status_code, time.perf_counter() - start)
+
+    response.body_iterator = timed_body()
+    return response
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -61,48 +133,115 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 AUDIO_DIR = Path("uploads/audio")
 AUDIO_DIR.mkdir(parents=True, exist_ok=True)
 
+# Synthesized speech, cached in AUDIO_DIR by content hash (see tts.py)
+TTS_SERVICE = TTSService(AUDIO_DIR)
+
+# /voice-input transcription on its own worker pool (VOICE_RECOGNIZER picks the backend)
+SPEECH_SERVICE = SpeechService()
+
 # Mount uploads directory for serving audio files
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
 # Database setup
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./history.db")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
 engine = create_engine(
     DATABASE_URL, 
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
+    poolclass=QueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
 )
+if DATABASE_URL.startswith("sqlite"):
+    enable_sqlite_wal(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Create tables
+# Create tables (and indexes added to existing tables since)
 Base.metadata.create_all(bind=engine)
+ensure_indexes(engine)
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# History rows are written behind the request path in batched transactions
+HISTORY_WRITER = HistoryWriter(SessionLocal, on_write=lambda seconds, rows: METRICS.observe_db_write(seconds))
+
+# Rendered /download exports, keyed by history row id and format
+EXPORT_CACHE = ExportCache()
+
+# Indexes are persisted under uploads/indexes, loaded lazily on first query and
+# kept in memory under a byte budget (INDEX_CACHE_MAX_BYTES, LRU/LFU eviction)
+INDEX_STORE = IndexStore()
+
+# Parsing runs in a process pool and embedding in a thread pool, off the event loop
+INGESTION_POOL = IngestionPool()
+
+# Answers cached per PDF by exact/normalized question and by question embedding;
+# entries for an upload are dropped whenever its index changes
+ANSWER_CACHE = AnswerCache()
+INDEX_STORE.add_listener(ANSWER_CACHE.invalidate, locked=True)
+
+# Gauges read when /metrics is scraped
+METRICS.gauge("index_store_resident_indexes", "Indexes held in memory",
+              lambda: INDEX_STORE.stats()["resident_indexes"])
+METRICS.gauge("index_store_resident_bytes", "Memory used by resident indexes",
+              lambda: INDEX_STORE.stats()["resident_bytes"])
+METRICS.gauge("index_store_max_bytes", "Index memory budget (INDEX_CACHE_MAX_BYTES)",
+              lambda: INDEX_STORE.max_bytes)
+METRICS.gauge("ingestion_pending", "Uploads waiting for or being ingested",
+              lambda: INGESTION_POOL.stats()["pending"])
+METRICS.gauge("history_queue_depth", "History rows queued but not yet written",
+              lambda: HISTORY_WRITER.stats()["queued"])
+METRICS.gauge("history_last_write_seconds", "Duration of the latest history write transaction",
+              lambda: HISTORY_WRITER.last_write_ms / 1000)
+METRICS.gauge("tts_cache_bytes", "Cached TTS audio on disk", lambda: TTS_SERVICE.stats()["bytes"])
+METRICS.gauge("export_cache_bytes", "Rendered exports held in memory", lambda: EXPORT_CACHE.stats()["bytes"])
+
+# /query/batch limits: questions per request and LLM calls in flight per batch
+QUERY_BATCH_MAX_QUESTIONS = int(os.environ.get("QUERY_BATCH_MAX_QUESTIONS", "50"))
+QUERY_BATCH_CONCURRENCY = int(os.environ.get("QUERY_BATCH_CONCURRENCY", "4"))
 
-OPENAI_API_BASE = os.environ.get("OPENAI_API_BASE", "http://localhost:1234/v1")
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "lm-studio")
+# Shared, sharded index over all uploads for cross-document questions
+CORPUS = CorpusIndex()
+CORPUS_FLUSH_SECONDS = float(os.environ.get("CORPUS_FLUSH_SECONDS", "30"))
 
-INDEX_STORE = {}
+def _sync_corpus(upload_id: str):
+    """Mirror an index change into the corpus shards"""
+    entry = INDEX_STORE.get(upload_id) if upload_id in INDEX_STORE else None
+    if entry is None:
+        CORPUS.refresh(upload_id, None)
+        return
+    with entry['lock'].read():
+        CORPUS.refresh(upload_id, entry['vector'], entry['tombstones'].positions)
 
-prompt = """
-You are a domain expert assistant.
-Use the provided context to answer the question clearly and accurately.
-If the answer cannot be found in the context, say "The information is not available in the provided context."
-Provide a well-structured answer in 3–4 sentences and keep it factual.
+INDEX_STORE.add_listener(_sync_corpus)
 
-Context:
-{context}
+async def _flush_corpus_periodically():
+    while True:
+        await asyncio.sleep(CORPUS_FLUSH_SECONDS)
+        try:
+            await asyncio.to_thread(CORPUS.flush)
+        except Exception as e:
+            print(f"Warning: Could not flush corpus shards: {e}")
+
+# Indexes with many deleted (tombstoned) chunks, or flat indexes that grew past
+# the ANN threshold through appends, are rebuilt in the background
+INDEX_COMPACT_SECONDS = float(os.environ.get("INDEX_COMPACT_SECONDS", "300"))
 
-Question:
-{question}
+async def _compact_indexes_periodically():
+    while True:
+        await asyncio.sleep(INDEX_COMPACT_SECONDS)
+        try:
+            await asyncio.to_thread(INDEX_STORE.compact_due)
+        except Exception as e:
+            print(f"Warning: Could not compact indexes: {e}")
 
-Answer:
-"""
-QA_CHAIN_PROMPT = PromptTemplate.from_template(prompt)
+# Background ingestion jobs reported by /jobs/{job_id} and its SSE stream
+JOBS = JobRegistry()
+_BACKGROUND_TASKS = set()
+
+# Bulk ingestion (/upload/bulk): files per request and batches currently running
+BULK_MAX_FILES = int(os.environ.get("BULK_MAX_FILES", "500"))
+_BULK_RUNNING = set()
 
 def convert_markdown_to_html(text: str) -> str:
     """
@@ -129,6 +268,32 @@ def convert_markdown_to_html(text: str) -> str:
     )
     return md.convert(text)
 
+def format_answer(answer) -> dict:
+    """
+    Build a structured answer payload to make UI formatting easier
+    - text: original answer string
+    - html: markdown converted to HTML
+    - summary: first non-empty paragraph (useful as short summary)
+    - paragraphs: answer split into paragraphs
+    """
+    if isinstance(answer, str):
+        paragraphs = [p.strip() for p in answer.split('\n\n') if p.strip()]
+        summary = paragraphs[0] if paragraphs else answer.strip()
+        # Convert markdown to HTML for rich rendering
+        html_content = convert_markdown_to_html(answer)
+    else:
+        # Fallback if answer is not a string
+        paragraphs = [str(answer)]
+        summary = str(answer)
+        html_content = convert_markdown_to_html(str(answer))
+
+    return {
+        'text': answer,
+        'html': html_content,  # Rich HTML content
+        'summary': summary,
+        'paragraphs': paragraphs,
+    }
+
 def allowed_file(filename: str) -> bool:
     return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'pdf'
 
@@ -144,41 +309,454 @@ async def favicon():
 async def home(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
+class _StageTimes(dict):
+    """Seconds per ingestion stage, summed over page batches, recorded once per upload"""
+
+    def add(self, stage: str, seconds: float):
+        self[stage] = self.get(stage, 0.0) + seconds
+
+    def record(self, endpoint: str = "upload"):
+        for stage, seconds in self.items():
+            METRICS.observe_stage(endpoint, stage, seconds)
+
+async def _run_ingestion_job(job: IngestionJob, file_path: str, content_hash: str):
+    """Parse, embed and persist one uploaded PDF, recording progress on the job"""
+    stages = _StageTimes()
+    try:
+        job.update(status="parsing")
+        # Pages are parsed, split and embedded batch by batch as they stream in;
+        # the shared process-wide embedder is used for every batch
+        try:
+            pages, vector = await INGESTION_POOL.ingest(
+                file_path,
+                on_start=lambda total: job.update(pages_total=total),
+                on_batch=job.add_batch,
+                metadata={"document_id": job.document_id, "filename": job.filename},
+                extractor=job.extractor,
+                on_stage=stages.add,
+            )
+        except Exception as e:
+            job.update(status="failed", error=f"Failed to create vector store: {e}")
+            return
+
+        # If no text was extracted, fail the job with a clear error
+        if vector is None:
+            job.update(status="failed", error="No text could be extracted from the uploaded PDF")
+            return
+
+        job.update(status="indexing", pages_parsed=pages)
+        persist_start = time.perf_counter()
+        await INGESTION_POOL.run_in_thread(
+            INDEX_STORE.put, job.upload_id, vector, {"filename": job.filename, "sha256": content_hash}
+        )
+        stages.add("persist", time.perf_counter() - persist_start)
+        # Later uploads of the same bytes will reuse this index
+        await INGESTION_POOL.run_in_thread(INDEX_STORE.register_content, content_hash, job.upload_id)
+        job.update(status="done")
+        stages.record()
+    except Exception as e:
+        job.update(status="failed", error=f"Ingestion error: {e}")
+    finally:
+        INGESTION_POOL.release()
+
+async def _run_update_job(job: IngestionJob, file_path: str):
+    """Parse and embed one PDF and add it to an existing index (append or replace)"""
+    stages = _StageTimes()
+    try:
+        job.update(status="parsing")
+        try:
+            pages, vector = await INGESTION_POOL.ingest(
+                file_path,
+                on_start=lambda total: job.update(pages_total=total),
+                on_batch=job.add_batch,
+                metadata={"document_id": job.document_id, "filename": job.filename},
+                extractor=job.extractor,
+                on_stage=stages.add,
+            )
+        except Exception as e:
+            job.update(status="failed", error=f"Failed to create vector store: {e}")
+            return
+        if vector is None:
+            job.update(status="failed", error="No text could be extracted from the uploaded PDF")
+            return
+
+        job.update(status="indexing", pages_parsed=pages)
+        replace = job.document_id if job.operation == "replace" else None
+        persist_start = time.perf_counter()
+        await INGESTION_POOL.run_in_thread(INDEX_STORE.add_documents, job.upload_id, vector, replace)
+        stages.add("persist", time.perf_counter() - persist_start)
+        job.update(status="done")
+        stages.record("index_update")
+    except Exception as e:
+        job.update(status="failed", error=f"Index update error: {e}")
+    finally:
+        INGESTION_POOL.release()
+
+async def _receive_pdf(file: UploadFile, uid: str):
+    """Stream an uploaded PDF to disk, hashing it on the way; returns (path, sha256)"""
+    file_path = os.path.join(UPLOAD_FOLDER, f"{uid}_{file.filename}")
+    digest = hashlib.sha256()
+    with open(file_path, "wb") as f:
+        while chunk := await file.read(UPLOAD_READ_CHUNK):
+            digest.update(chunk)
+            f.write(chunk)
+    return file_path, digest.hexdigest()
+
+def _start_job(job: IngestionJob, runner, *args) -> JSONResponse:
+    task = asyncio.create_task(runner(job, *args))
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return JSONResponse(
+        {
+            "job_id": job.job_id,
+            "upload_id": job.upload_id,
+            "document_id": job.document_id,
+            "status": job.status,
+            "message": "Indexing started",
+        },
+        status_code=202,
+    )
+
+def _check_extractor(extractor: Optional[str]) -> Optional[str]:
+    if extractor and extractor.lower() not in EXTRACTORS:
+        raise HTTPException(status_code=400, detail=f"extractor must be one of {', '.join(EXTRACTORS)}")
+    return extractor.lower() if extractor else None
+
 @app.post("/upload")
-async def upload_pdf(file: UploadFile = File(...)):
+async def upload_pdf(file: UploadFile = File(...), extractor: Optional[str] = Form(None)):
+    """
+    Save the PDF and start indexing it in the background.
+    The optional `extractor` form field picks the text extractor ("pdfium",
+    the fast default, or "pdfplumber" for table-heavy documents).
+    Returns a job_id right away; poll /jobs/{job_id} or stream /jobs/{job_id}/events
+    until the status is "done" before querying the upload_id.
+    If the same PDF bytes were indexed before, the new upload_id is aliased to
+    that index and no job is started.
+    """
     if not allowed_file(file.filename):
         raise HTTPException(status_code=400, detail="Invalid file type")
+    extractor = _check_extractor(extractor)
 
-    uid = str(uuid.uuid4())
-    file_path = os.path.join(UPLOAD_FOLDER, f"{uid}_{file.filename}")
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+    try:
+        INGESTION_POOL.acquire()
+    except IngestionBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
 
-    loader = PDFPlumberLoader(file_path)
-    docs = loader.load()
+    try:
+        uid = str(uuid.uuid4())
+        # Stream the upload to disk instead of holding the whole PDF in memory,
+        # hashing it on the way for deduplication
+        with METRICS.timer("upload", "receive"):
+            file_path, content_hash = await _receive_pdf(file, uid)
+    except Exception:
+        INGESTION_POOL.release()
+        raise
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    documents = text_splitter.split_documents(docs)
+    existing = await INGESTION_POOL.run_in_thread(INDEX_STORE.lookup_content, content_hash)
+    if existing:
+        INGESTION_POOL.release()
+        await INGESTION_POOL.run_in_thread(INDEX_STORE.alias, uid, existing)
+        os.remove(file_path)
+        return JSONResponse({
+            "job_id": None,
+            "upload_id": uid,
+            "status": "done",
+            "deduplicated": True,
+            "message": "Index reused from an identical upload",
+        })
 
-    # If no text was extracted, return a clear error to the client
-    if not documents:
-        raise HTTPException(status_code=400, detail="No text could be extracted from the uploaded PDF")
+    job = JOBS.create(uid, file.filename, extractor=extractor)
+    return _start_job(job, _run_ingestion_job, file_path, content_hash)
 
-    # Explicitly provide a model_name to avoid LangChain deprecation warnings
-    # and to ensure embeddings can be produced. You can change this model to one
-    # available in your environment if needed.
-    embedder = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+async def _run_bulk_job(checkpoint: BulkCheckpoint, jobs: dict):
+    """Ingest a bulk batch, mirroring each document's progress onto its own job"""
+    def on_finish(upload_id: str, error: Optional[str]):
+        if error:
+            jobs[upload_id].update(status="failed", error=error)
+        else:
+            jobs[upload_id].update(status="done")
 
     try:
-        vector = FAISS.from_documents(documents, embedder)
+        summary = await run_bulk(
+            INGESTION_POOL, INDEX_STORE, checkpoint,
+            on_start=lambda upload_id, total: jobs[upload_id].update(status="parsing", pages_total=total),
+            on_batch=lambda upload_id, pages, chunks: jobs[upload_id].add_batch(pages, chunks),
+            on_finish=on_finish,
+        )
+        print(f"✅ Bulk batch {checkpoint.batch_id}: {summary['documents']} PDFs, "
+              f"{summary['pages_per_second']} pages/s, {summary['chunks_per_second']} chunks/s")
     except Exception as e:
-        # Catch embedding/index creation errors and return a helpful message
-        raise HTTPException(status_code=500, detail=f"Failed to create vector store: {e}")
-    retriever = vector.as_retriever(search_type="similarity", search_kwargs={"k": 3})
+        for job in jobs.values():
+            if not job.finished:
+                job.update(status="failed", error=f"Bulk ingestion error: {e}")
+    finally:
+        _BULK_RUNNING.discard(checkpoint.batch_id)
+        INGESTION_POOL.release()
+
+def _start_bulk(checkpoint: BulkCheckpoint) -> JSONResponse:
+    jobs = {
+        item["upload_id"]: JOBS.create(item["upload_id"], item["filename"], extractor=checkpoint.extractor)
+        for item in checkpoint.pending()
+    }
+    _BULK_RUNNING.add(checkpoint.batch_id)
+    task = asyncio.create_task(_run_bulk_job(checkpoint, jobs))
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return JSONResponse(
+        {
+            "batch_id": checkpoint.batch_id,
+            "status": "queued",
+            "documents": [
+                {"job_id": job.job_id, "upload_id": job.upload_id, "filename": job.filename}
+                for job in jobs.values()
+            ],
+            "message": "Bulk indexing started",
+        },
+        status_code=202,
+    )
+
+@app.post("/upload/bulk")
+async def upload_bulk(files: List[UploadFile] = File(...), extractor: Optional[str] = Form(None)):
+    """
+    Save many PDFs and index them as one bulk batch in the background.
+    Page ranges of all files are extracted in parallel and their chunks are
+    embedded together in large batches. Returns a batch_id plus a job per
+    file (same /jobs/{job_id} progress as /upload); GET /upload/bulk/{batch_id}
+    reports aggregate pages/s and chunks/s, and an interrupted batch continues
+    with POST /upload/bulk/{batch_id}/resume.
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No files uploaded")
+    if len(files) > BULK_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_FILES} files per bulk upload")
+    for file in files:
+        if not allowed_file(file.filename):
+            raise HTTPException(status_code=400, detail=f"Invalid file type: {file.filename}")
+    extractor = _check_extractor(extractor)
+
+    # The whole batch takes one ingestion slot
+    try:
+        INGESTION_POOL.acquire()
+    except IngestionBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+    batch_id = str(uuid.uuid4())
+    checkpoint = BulkCheckpoint(checkpoint_path(batch_id), batch_id, extractor)
+    try:
+        for file in files:
+            uid = str(uuid.uuid4())
+            file_path, content_hash = await _receive_pdf(file, uid)
+            checkpoint.add(file_path, file.filename, content_hash, uid)
+        checkpoint.save()
+    except Exception:
+        INGESTION_POOL.release()
+        raise
+    return _start_bulk(checkpoint)
+
+def _load_bulk(batch_id: str) -> BulkCheckpoint:
+    path = checkpoint_path(batch_id) if valid_upload_id(batch_id) else None
+    if path is None or not path.exists():
+        raise HTTPException(status_code=404, detail="unknown batch_id")
+    return BulkCheckpoint.load(path)
+
+@app.get("/upload/bulk/{batch_id}")
+async def bulk_status(batch_id: str):
+    """Documents done/failed/pending and aggregate throughput of a bulk batch"""
+    checkpoint = await asyncio.to_thread(_load_bulk, batch_id)
+    return JSONResponse({**checkpoint.summary(), "running": batch_id in _BULK_RUNNING})
+
+@app.post("/upload/bulk/{batch_id}/resume")
+async def bulk_resume(batch_id: str):
+    """Continue an interrupted bulk batch with the documents that are not done"""
+    if batch_id in _BULK_RUNNING:
+        raise HTTPException(status_code=409, detail="The batch is still running")
+    checkpoint = await asyncio.to_thread(_load_bulk, batch_id)
+    if not checkpoint.pending():
+        return JSONResponse({**checkpoint.summary(), "running": False})
+    try:
+        INGESTION_POOL.acquire()
+    except IngestionBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return _start_bulk(checkpoint)
+
+def _require_index(upload_id: str) -> str:
+    """Owner upload_id of an existing index, else 409 (still indexing) or 404
+
+    Takes the index store lock, so call it off the event loop.
+    """
+    if upload_id not in INDEX_STORE:
+        if JOBS.find_active(upload_id):
+            raise HTTPException(status_code=409, detail="The PDF is still being indexed")
+        raise HTTPException(status_code=404, detail="unknown upload_id")
+    return INDEX_STORE.resolve(upload_id)
+
+async def _start_update(upload_id: str, file: UploadFile, document_id: str, operation: str,
+                        extractor: Optional[str]) -> JSONResponse:
+    if not allowed_file(file.filename):
+        raise HTTPException(status_code=400, detail="Invalid file type")
+    extractor = _check_extractor(extractor)
+    try:
+        INGESTION_POOL.acquire()
+    except IngestionBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    try:
+        file_path, _ = await _receive_pdf(file, document_id)
+    except Exception:
+        INGESTION_POOL.release()
+        raise
+    job = JOBS.create(upload_id, file.filename, document_id, operation, extractor)
+    return _start_job(job, _run_update_job, file_path)
+
+@app.get("/indexes/{upload_id}/documents")
+async def list_documents(upload_id: str):
+    """Documents in an upload's index with live chunk and page counts"""
+    await asyncio.to_thread(_require_index, upload_id)
+    documents = await asyncio.to_thread(INDEX_STORE.documents, upload_id)
+    if documents is None:
+        raise HTTPException(status_code=404, detail="unknown upload_id")
+    return JSONResponse({"upload_id": upload_id, "documents": documents})
+
+@app.post("/indexes/{upload_id}/documents")
+async def append_document(upload_id: str, file: UploadFile = File(...), extractor: Optional[str] = Form(None)):
+    """
+    Add another PDF to an existing upload_id without re-embedding what is
+    already indexed. Returns a job like /upload, plus the new document_id.
+    """
+    await asyncio.to_thread(_require_index, upload_id)
+    return await _start_update(upload_id, file, str(uuid.uuid4()), "append", extractor)
+
+@app.put("/indexes/{upload_id}/documents/{document_id}")
+async def replace_document(upload_id: str, document_id: str, file: UploadFile = File(...),
+                           extractor: Optional[str] = Form(None)):
+    """Replace one document of an upload with a revised PDF (old chunks are removed when the new ones are in)"""
+    await asyncio.to_thread(_require_index, upload_id)
+    documents = await asyncio.to_thread(INDEX_STORE.documents, upload_id)
+    if not any(d["document_id"] == document_id for d in documents or []):
+        raise HTTPException(status_code=404, detail="unknown document_id")
+    return await _start_update(upload_id, file, document_id, "replace", extractor)
 
-    INDEX_STORE[uid] = {"retriever": retriever, "vector": vector}
+@app.delete("/indexes/{upload_id}/documents/{document_id}")
+async def delete_document(upload_id: str, document_id: str):
+    """Remove one document's chunks from an upload's index (space is reclaimed by compaction)"""
+    await asyncio.to_thread(_require_index, upload_id)
+    removed = await asyncio.to_thread(INDEX_STORE.remove_document, upload_id, document_id)
+    if not removed:
+        raise HTTPException(status_code=404, detail="unknown document_id")
+    return JSONResponse({"upload_id": upload_id, "document_id": document_id, "chunks_removed": removed})
 
-    return JSONResponse({"upload_id": uid, "message": "Index created"})
+@app.delete("/indexes/{upload_id}")
+async def delete_upload_index(upload_id: str):
+    """Delete an upload_id and its index (shared indexes stay with their other aliases)"""
+    await asyncio.to_thread(_require_index, upload_id)
+    await asyncio.to_thread(INDEX_STORE.delete, upload_id)
+    return JSONResponse({"upload_id": upload_id, "deleted": True})
+
+@app.post("/indexes/{upload_id}/compact")
+async def compact_index(upload_id: str):
+    """Rebuild an index now without its deleted chunks"""
+    await asyncio.to_thread(_require_index, upload_id)
+    result = await INGESTION_POOL.run_in_thread(INDEX_STORE.compact, upload_id)
+    if result is None:
+        raise HTTPException(status_code=409, detail="Index is already being compacted")
+    return JSONResponse(result)
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Return ingestion progress for a job"""
+    job = JOBS.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="unknown job_id")
+    return JSONResponse(job.to_dict())
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-Sent Events stream of ingestion progress; ends when the job finishes"""
+    job = JOBS.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="unknown job_id")
+
+    async def event_stream():
+        last_version = -1
+        while True:
+            if job.version != last_version:
+                last_version = job.version
+                payload = job.to_dict()
+                event = payload["status"] if job.finished else "progress"
+                yield sse_event(event, payload)
+                if job.finished:
+                    return
+            await asyncio.sleep(0.25)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/stats/embeddings")
+async def embedding_stats():
+    """Report embedding model load time and batch throughput"""
+    return JSONResponse(get_embedder().stats())
+
+@app.get("/stats/indexes")
+async def index_stats():
+    """Report index cache hits, misses, evictions and resident bytes per index"""
+    return JSONResponse(INDEX_STORE.stats())
+
+@app.get("/stats/answer-cache")
+async def answer_cache_stats():
+    """Report answer cache size and exact/semantic hit rates"""
+    return JSONResponse(ANSWER_CACHE.stats())
+
+@app.get("/stats/corpus")
+async def corpus_stats():
+    """Report corpus shard count and size"""
+    return JSONResponse(await asyncio.to_thread(CORPUS.stats))
+
+@app.get("/stats/rerank")
+async def rerank_stats():
+    return JSONResponse(get_reranker().stats())
+
+@app.get("/stats/tts")
+async def tts_stats():
+    """Report TTS cache size, hit rate and synthesis workers"""
+    return JSONResponse(TTS_SERVICE.stats())
+
+@app.get("/stats/exports")
+async def export_stats():
+    """Report rendered export cache size and hit rate"""
+    return JSONResponse(EXPORT_CACHE.stats())
+
+@app.get("/stats/history")
+async def history_stats():
+    """Report history writer batching and commit latency"""
+    return JSONResponse(HISTORY_WRITER.stats())
+
+@app.get("/metrics")
+async def metrics():
+    """Latency histograms and cache gauges in the Prometheus text format"""
+    return Response(METRICS.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/stats/ingestion")
+async def ingestion_stats():
+    """Report ingestion worker counts and in-flight uploads"""
+    return JSONResponse(INGESTION_POOL.stats())
+
+def save_query_history(upload_id: str, question: str, answer, summary: str):
+    """Queue one answered question for the chat history (written in the background)"""
+    try:
+        HISTORY_WRITER.submit(upload_id, question, answer, summary)
+    except Exception as e:
+        print(f"Warning: Could not save history: {e}")
+
+def source_payload(source_documents) -> list:
+    return [
+        {'page_content': sd.page_content[:800], 'metadata': getattr(sd, 'metadata', {})}
+        for sd in source_documents
+    ]
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 @app.post("/query")
 async def query(request: Request):
@@ -186,10 +764,16 @@ async def query(request: Request):
 
     JSON example: {"upload_id": "...", "question": "..."}
     Form example: upload_id and question fields in form data
+    JSON bodies may also tune ANN search breadth for large PDFs with
+    "recall" ("fast", "balanced", "high") and/or explicit "ef_search" / "nprobe",
+    pick "retrieval": "hybrid" (BM25 + vector, default) or "vector", set the
+    final "k", and turn on two-stage retrieval with "rerank": true and a
+    first-stage "candidates" depth.
     """
     upload_id = None
     question = None
     from_form = False
+    data = None
 
     # Accept JSON body
     try:
@@ -209,67 +793,59 @@ async def query(request: Request):
 
     if not upload_id or not question:
         raise HTTPException(status_code=400, detail="upload_id and question required")
-    if upload_id not in INDEX_STORE:
-        raise HTTPException(status_code=404, detail="unknown upload_id")
-
-    retriever = INDEX_STORE[upload_id]['retriever']
-
-    llm = ChatOpenAI(
-        model="tinyllama-1.1b-chat-v1.0",
-        temperature=0.0,
-        openai_api_base=OPENAI_API_BASE,
-        openai_api_key=OPENAI_API_KEY,
-        request_timeout=60,
-    )
-
-    llm_chain = LLMChain(llm=llm, prompt=QA_CHAIN_PROMPT)
-
-    document_prompt = PromptTemplate(
-        input_variables=["page_content", "source"],
-        template="Context:\ncontent:{page_content}\nsource:{source}",
-    )
+    try:
+        search_settings = resolve_retrieval_options(data) if isinstance(data, dict) else {}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cache_key = await asyncio.to_thread(_require_index, upload_id)
 
-    combine_documents_chain = StuffDocumentsChain(
-        llm_chain=llm_chain,
-        document_variable_name="context",
-        document_prompt=document_prompt,
-    )
+    setup_start = time.perf_counter()
+    question_embedding = await asyncio.to_thread(get_embedder().embed_query, question)
+    # Answers are cached per retrieval settings; the generation guards against
+    # storing an answer from an index that changes while it is computed
+    variant = settings_key(search_settings)
+    generation = ANSWER_CACHE.generation(cache_key)
+    cached = ANSWER_CACHE.get(cache_key, question, question_embedding, variant)
 
-    qa = RetrievalQA(
-        combine_documents_chain=combine_documents_chain,
-        retriever=retriever,
-        return_source_documents=True,
-    )
-
-    # Call the RetrievalQA with a query dict so it returns structured data
-    result = qa({"query": question})
-    answer = result.get('result')
-    sources = []
-    for sd in result.get('source_documents', []):
-        sources.append({'page_content': sd.page_content[:800], 'metadata': getattr(sd, 'metadata', {})})
-
-    # Build a structured answer payload to make UI formatting easier
-    # - text: original answer string
-    # - html: markdown converted to HTML
-    # - summary: first non-empty paragraph (useful as short summary)
-    # - paragraphs: answer split into paragraphs
-    if isinstance(answer, str):
-        paragraphs = [p.strip() for p in answer.split('\n\n') if p.strip()]
-        summary = paragraphs[0] if paragraphs else answer.strip()
-        # Convert markdown to HTML for rich rendering
-        html_content = convert_markdown_to_html(answer)
+    if cached:
+        formatted_answer = cached['answer']
+        sources = cached['sources']
+        answer = formatted_answer['text']
+        summary = formatted_answer['summary']
+        timings = {
+            'cache': cached['match'],
+            'cache_lookup_ms': round((time.perf_counter() - setup_start) * 1000, 2),
+        }
     else:
-        # Fallback if answer is not a string
-        paragraphs = [str(answer)]
-        summary = str(answer)
-        html_content = convert_markdown_to_html(str(answer))
+        # A cold index is read from disk, so load it off the event loop
+        entry = await asyncio.to_thread(INDEX_STORE.get, upload_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="unknown upload_id")
+        # Shared LLM client and chain; only the retriever is bound per request
+        qa = get_qa_service()
+        setup_ms = round((time.perf_counter() - setup_start) * 1000, 2)
 
-    formatted_answer = {
-        'text': answer,
-        'html': html_content,  # Rich HTML content
-        'summary': summary,
-        'paragraphs': paragraphs,
-    }
+        source_documents, retrieval_timings = await asyncio.to_thread(
+            entry['retriever'].retrieve, question, question_embedding, **search_settings
+        )
+        answer, timings = await qa.aanswer_docs(source_documents, question)
+        timings = {**retrieval_timings, **timings}
+        if search_settings:
+            timings['search'] = search_settings
+        sources = source_payload(source_documents)
+
+        render_start = time.perf_counter()
+        formatted_answer = format_answer(answer)
+        summary = formatted_answer['summary']
+        timings = {
+            'cache': 'miss',
+            'setup_ms': setup_ms,
+            **timings,
+            'render_ms': round((time.perf_counter() - render_start) * 1000, 2),
+        }
+        ANSWER_CACHE.put(cache_key, question, formatted_answer, sources, question_embedding,
+                         variant, generation)
+    METRICS.record_stages("query", timings)
 
     # If the request came from a form POST, render the HTML template with the answer
     if from_form:
@@ -285,23 +861,284 @@ async def query(request: Request):
         )
     
     # Save to history automatically (for regular text queries)
+    save_query_history(upload_id, question, answer, summary)
+
+    return JSONResponse({'answer': formatted_answer, 'sources': sources, 'timings': timings})
+
+@app.post("/query/stream")
+async def query_stream(request: Request):
+    """
+    Streaming variant of /query using Server-Sent Events.
+    Body: {"upload_id": "...", "question": "..."}
+    Emits "token" events ({"text": ...}) as the model generates, then one "final"
+    event with the same answer/sources payload as /query plus timings.
+    History is saved once the stream completes.
+    """
     try:
-        db: Session = next(get_db())
-        history_record = ChatHistory(
-            upload_id=upload_id,
-            question=question,
-            answer=answer if isinstance(answer, str) else str(answer),
-            summary=summary,
-            voice_type="default",
-            audio_speed=180,
-            is_muted=False
+        data = await request.json()
+    except Exception:
+        data = None
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="JSON body required")
+    upload_id = data.get("upload_id")
+    question = data.get("question")
+
+    if not upload_id or not question:
+        raise HTTPException(status_code=400, detail="upload_id and question required")
+    cache_key = await asyncio.to_thread(_require_index, upload_id)
+
+    lookup_start = time.perf_counter()
+    question_embedding = await asyncio.to_thread(get_embedder().embed_query, question)
+    variant = settings_key(None)
+    generation = ANSWER_CACHE.generation(cache_key)
+    cached = ANSWER_CACHE.get(cache_key, question, question_embedding, variant)
+    if cached:
+        async def cached_stream():
+            timings = {
+                'cache': cached['match'],
+                'cache_lookup_ms': round((time.perf_counter() - lookup_start) * 1000, 2),
+            }
+            try:
+                yield sse_event("final", {'answer': cached['answer'], 'sources': cached['sources'], 'timings': timings})
+            finally:
+                METRICS.record_stages("query_stream", timings)
+            save_query_history(upload_id, question, cached['answer']['text'], cached['answer']['summary'])
+
+        return StreamingResponse(
+            cached_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
         )
-        db.add(history_record)
-        db.commit()
-    except Exception as e:
-        print(f"Warning: Could not save history: {e}")
 
-    return JSONResponse({'answer': formatted_answer, 'sources': sources})
+    entry = await asyncio.to_thread(INDEX_STORE.get, upload_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="unknown upload_id")
+    qa = get_qa_service()
+
+    async def event_stream():
+        start = time.perf_counter()
+        # Stages are recorded when the generator ends, also on errors and client disconnects
+        timings = {'cache': 'miss'}
+        try:
+            source_documents, retrieval_timings = await asyncio.to_thread(
+                entry['retriever'].retrieve, question, question_embedding
+            )
+            timings.update(retrieval_timings)
+            retrieved = time.perf_counter()
+            prompt_text, context_stats = qa.build_prompt(source_documents, question)
+            tokens = []
+            timings['first_token_ms'] = None
+            async for token in qa.astream_answer(prompt_text):
+                if timings['first_token_ms'] is None:
+                    timings['first_token_ms'] = round((time.perf_counter() - start) * 1000, 2)
+                tokens.append(token)
+                yield sse_event("token", {"text": token})
+            generated = time.perf_counter()
+            timings['llm_ms'] = round((generated - retrieved) * 1000, 2)
+
+            answer = "".join(tokens)
+            formatted_answer = format_answer(answer)
+            sources = source_payload(source_documents)
+            timings['render_ms'] = round((time.perf_counter() - generated) * 1000, 2)
+            timings.update(context_stats)
+            yield sse_event("final", {'answer': formatted_answer, 'sources': sources, 'timings': timings})
+            ANSWER_CACHE.put(cache_key, question, formatted_answer, sources, question_embedding,
+                             variant, generation)
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Query error: {e}"})
+            return
+        finally:
+            METRICS.record_stages("query_stream", timings)
+
+        save_query_history(upload_id, question, answer, formatted_answer['summary'])
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/query/batch")
+async def query_batch(request: Request):
+    """
+    Answer many questions about one PDF in a single request.
+    Body: {"upload_id": "...", "questions": ["...", ...]} plus any of the
+    retrieval settings /query accepts, applied to every question.
+    All questions are embedded in one batch and searched with one FAISS call;
+    LLM calls run QUERY_BATCH_CONCURRENCY at a time. Results keep the order of
+    "questions" and use the /query answer/sources payload; a question that
+    fails carries an "error" instead, without failing the rest of the batch.
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        data = None
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="JSON body required")
+    upload_id = data.get("upload_id")
+    questions = data.get("questions")
+    if not upload_id or not isinstance(questions, list) or not questions:
+        raise HTTPException(status_code=400, detail="upload_id and a non-empty questions list required")
+    if len(questions) > QUERY_BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {QUERY_BATCH_MAX_QUESTIONS} questions per batch")
+    try:
+        search_settings = resolve_retrieval_options(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cache_key = await asyncio.to_thread(_require_index, upload_id)
+
+    start = time.perf_counter()
+    results = [None] * len(questions)
+    valid = []
+    for i, question in enumerate(questions):
+        if isinstance(question, str) and question.strip():
+            valid.append(i)
+        else:
+            results[i] = {'question': question, 'error': "question must be a non-empty string"}
+
+    embeddings = await asyncio.to_thread(get_embedder().embed_queries, [questions[i] for i in valid]) if valid else []
+    embedded = time.perf_counter()
+
+    # Same cache rules as /query
+    variant = settings_key(search_settings)
+    generation = ANSWER_CACHE.generation(cache_key)
+    pending = []
+    for i, embedding in zip(valid, embeddings):
+        cached = ANSWER_CACHE.get(cache_key, questions[i], embedding, variant)
+        if cached:
+            results[i] = {
+                'question': questions[i],
+                'answer': cached['answer'],
+                'sources': cached['sources'],
+                'timings': {'cache': cached['match']},
+            }
+        else:
+            pending.append((i, embedding))
+
+    timings = {
+        'questions': len(questions),
+        'embed_ms': round((embedded - start) * 1000, 2),
+        'cache_hits': len(valid) - len(pending),
+    }
+    if pending:
+        entry = await asyncio.to_thread(INDEX_STORE.get, upload_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="unknown upload_id")
+        try:
+            retrieved, retrieval_timings = await asyncio.to_thread(
+                entry['retriever'].retrieve_batch,
+                [questions[i] for i, _ in pending],
+                [embedding for _, embedding in pending],
+                **search_settings,
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Query error: {e}")
+        timings.update(retrieval_timings)
+        if search_settings:
+            timings['search'] = search_settings
+
+        qa = get_qa_service()
+        semaphore = asyncio.Semaphore(QUERY_BATCH_CONCURRENCY)
+
+        async def answer_one(i, embedding, source_documents):
+            question = questions[i]
+            try:
+                async with semaphore:
+                    answer, answer_timings = await qa.aanswer_docs(source_documents, question)
+                formatted_answer = format_answer(answer)
+            except Exception as e:
+                results[i] = {'question': question, 'error': f"Query error: {e}"}
+                return
+            sources = source_payload(source_documents)
+            ANSWER_CACHE.put(cache_key, question, formatted_answer, sources, embedding, variant, generation)
+            results[i] = {
+                'question': question,
+                'answer': formatted_answer,
+                'sources': sources,
+                'timings': {'cache': 'miss', **answer_timings},
+            }
+
+        llm_start = time.perf_counter()
+        await asyncio.gather(*(
+            answer_one(i, embedding, source_documents)
+            for (i, embedding), source_documents in zip(pending, retrieved)
+        ))
+        timings['llm_ms'] = round((time.perf_counter() - llm_start) * 1000, 2)
+
+    timings['errors'] = sum(1 for result in results if 'error' in result)
+    timings['total_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    METRICS.record_stages("query_batch", timings)
+
+    for result in results:
+        if 'answer' in result:
+            save_query_history(upload_id, result['question'], result['answer']['text'], result['answer']['summary'])
+    return JSONResponse({'upload_id': upload_id, 'results': results, 'timings': timings})
+
+@app.post("/query/corpus")
+async def query_corpus(request: Request):
+    """
+    Answer a question across many PDFs using the sharded corpus index.
+    Body: {"question": "...", "upload_ids": ["...", ...] (optional, default all), "k": 5}
+    Sources carry the upload_id they came from and their distance score.
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        data = None
+    if not isinstance(data, dict) or not data.get("question"):
+        raise HTTPException(status_code=400, detail="question required")
+    question = data["question"]
+    upload_ids = data.get("upload_ids")
+    if upload_ids is not None and not isinstance(upload_ids, list):
+        raise HTTPException(status_code=400, detail="upload_ids must be a list")
+    try:
+        k = max(1, min(int(data.get("k", 5)), 50))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="k must be an integer")
+
+    owners = None
+    if upload_ids is not None:
+        # Aliased uploads share their owner's chunks in the corpus
+        owners = await asyncio.to_thread(lambda: {INDEX_STORE.resolve(uid): uid for uid in upload_ids})
+
+    search_start = time.perf_counter()
+    hits = await CORPUS.asearch(question, k=k, upload_ids=owners.keys() if owners is not None else None)
+    retrieval_ms = round((time.perf_counter() - search_start) * 1000, 2)
+    if not hits:
+        raise HTTPException(status_code=404, detail="No indexed content matches the requested uploads")
+
+    source_documents = [doc for doc, _ in hits]
+    answer, llm_timings = await get_qa_service().aanswer_docs(source_documents, question)
+
+    render_start = time.perf_counter()
+    formatted_answer = format_answer(answer)
+    sources = source_payload(source_documents)
+    for source, (doc, score) in zip(sources, hits):
+        owner = doc.metadata.get("upload_id")
+        source['upload_id'] = owners.get(owner, owner) if owners is not None else owner
+        source['score'] = float(score)
+    timings = {
+        'retrieval_ms': retrieval_ms,
+        **llm_timings,
+        'render_ms': round((time.perf_counter() - render_start) * 1000, 2),
+    }
+    return JSONResponse({'answer': formatted_answer, 'sources': sources, 'timings': timings})
+
+@app.post("/corpus/rebuild")
+async def rebuild_corpus():
+    """Add every index already on disk to the corpus (e.g. indexes created before it existed)"""
+    def rebuild():
+        count = 0
+        for upload_id in list_indexed_uploads():
+            vector = load_index(upload_id)
+            if vector is not None:
+                CORPUS.add(upload_id, vector)
+                count += 1
+        CORPUS.flush()
+        return count
+
+    count = await asyncio.to_thread(rebuild)
+    return JSONResponse({"uploads": count, **CORPUS.stats()})
 
 @app.post("/save_history")
 async def save_history(
@@ -313,7 +1150,6 @@ async def save_history(
     voice_type: str = Form("default"),
     audio_speed: int = Form(180),
     is_muted: bool = Form(False),
-    db: Session = Depends(get_db)
 ):
     """
     Save chat history entry with optional audio files and voice settings
@@ -335,108 +1171,120 @@ async def save_history(
         # Take first paragraph or first 400 chars
         summary = (answer or "").split("\n\n")[0][:400]
     
-    # Create DB record with voice modulation settings
-    record = ChatHistory(
-        upload_id=upload_id,
-        question=question or "",
-        answer=answer or "",
-        summary=summary or "",
+    # Queue the record with voice modulation settings; the id is assigned right away
+    history_id = HISTORY_WRITER.submit(
+        upload_id,
+        question or "",
+        answer or "",
+        summary or "",
         question_audio_path=q_audio_path,
         answer_audio_path=None,  # Can be populated by /tts endpoint
         voice_type=voice_type or "default",
         audio_speed=audio_speed or 180,
-        is_muted=is_muted or False
+        is_muted=is_muted or False,
     )
     
-    db.add(record)
-    db.commit()
-    db.refresh(record)
-    
-    return JSONResponse({"history_id": record.id, "message": "History saved"})
+    return JSONResponse({"history_id": history_id, "message": "History saved"})
 
 
 @app.get("/history")
 async def get_history(
     upload_id: Optional[str] = None,
     limit: int = 50,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    view: str = "full",
 ):
     """
     Retrieve chat history for a given upload_id
-    Returns list of history entries ordered by most recent first
+    Returns list of history entries ordered by most recent first.
+    Pages are keyset-based: pass the X-Next-Cursor header of one page as
+    `cursor` to get the next. `view=summary` leaves out the full answers.
     """
+    if view not in ("full", "summary"):
+        raise HTTPException(status_code=400, detail="view must be 'full' or 'summary'")
+
+    def load():
+        # Rows of this upload still queued by the history writer are committed first
+        HISTORY_WRITER.flush_pending(upload_id)
+        db = SessionLocal()
+        try:
+            return history_page(db, upload_id, limit, cursor, view)
+        finally:
+            db.close()
+
     try:
-        query = db.query(ChatHistory)
-        
-        if upload_id:
-            query = query.filter(ChatHistory.upload_id == upload_id)
-        
-        history_entries = query.order_by(ChatHistory.created_at.desc()).limit(limit).all()
-        
-        return JSONResponse([entry.to_dict() for entry in history_entries])
+        entries, next_cursor = await asyncio.to_thread(load)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         # Log the error and return empty list instead of failing
         print(f"Error loading history: {e}")
         return JSONResponse([])
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return JSONResponse(entries, headers=headers)
+
+@app.get("/history/{history_id}")
+async def get_history_entry(history_id: str):
+    """One full history entry (e.g. the answer of a row listed with view=summary)"""
+    def load():
+        HISTORY_WRITER.flush_pending(history_id=history_id)
+        db = SessionLocal()
+        try:
+            entry = db.query(ChatHistory).filter(ChatHistory.id == history_id).first()
+            return entry.to_dict() if entry else None
+        finally:
+            db.close()
+
+    entry = await asyncio.to_thread(load)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="History entry not found")
+    return JSONResponse(entry)
 
 @app.post("/tts")
-async def text_to_speech(request: Request, db: Session = Depends(get_db)):
+async def text_to_speech(request: Request):
     """
     Server-side TTS using pyttsx3 (offline)
     Supports voice modulation (type, rate, volume)
+    Audio is cached by (text, voice_type, rate, volume): repeated requests
+    return the same file without synthesizing again.
     """
-    try:
-        import pyttsx3
-        
-        body = await request.json()
-        text = body.get("text", "")
-        voice_type = body.get("voice_type", "default")
-        rate = body.get("rate", 180)
-        volume = body.get("volume", 1.0)
-        
-        if not text:
-            raise HTTPException(status_code=400, detail="Text is required")
-        
-        engine = pyttsx3.init()
-        voices = engine.getProperty("voices")
-        
-        # Set voice type
-        if voice_type == "female" and len(voices) > 1:
-            engine.setProperty("voice", voices[1].id)
-        elif voice_type == "male" and len(voices) > 0:
-            engine.setProperty("voice", voices[0].id)
-        else:
-            engine.setProperty("voice", voices[0].id)
-        
-        # Set speech rate and volume
-        engine.setProperty("rate", rate)
-        engine.setProperty("volume", volume)
-        
-        # Generate audio file
-        fname = f"{uuid.uuid4()}.mp3"
-        path = AUDIO_DIR / fname
-        
-        engine.save_to_file(text, str(path))
-        engine.runAndWait()
-        
-        audio_url = f"/uploads/audio/{fname}"
-        
-        return JSONResponse({
-            "audio_url": audio_url,
-            "message": "TTS audio generated with pyttsx3",
-            "settings": {
-                "voice_type": voice_type,
-                "rate": rate,
-                "volume": volume
-            }
-        })
-    except ImportError:
+    if not tts_available():
         raise HTTPException(
             status_code=501,
             detail="pyttsx3 not installed. Install with: pip install pyttsx3"
         )
+    try:
+        body = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="JSON body required")
+    text = body.get("text", "")
+    if not text:
+        raise HTTPException(status_code=400, detail="Text is required")
+    try:
+        voice_type, rate, volume = normalize_settings(
+            body.get("voice_type", "default"), body.get("rate", 180), body.get("volume", 1.0)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    start = time.perf_counter()
+    try:
+        # Synthesis runs in the TTS worker processes, off the event loop
+        fname, cached = await TTS_SERVICE.synthesize(text, voice_type, rate, volume)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"TTS error: {str(e)}")
+    METRICS.observe_stage("tts", "cache_hit" if cached else "synthesize", time.perf_counter() - start)
+
+    return JSONResponse({
+        "audio_url": f"/uploads/audio/{fname}",
+        "cached": cached,
+        "message": "TTS audio served from cache" if cached else "TTS audio generated with pyttsx3",
+        "settings": {
+            "voice_type": voice_type,
+            "rate": rate,
+            "volume": volume
+        }
+    })
 
 
 @app.post("/voice-input")
@@ -445,235 +1293,234 @@ async def voice_input(audio: UploadFile = File(...)):
     Speech-to-Text endpoint using SpeechRecognition
     Accepts audio file and returns transcribed text
     Supports multiple audio formats (webm, wav, ogg, mp3)
+    Audio is decoded and transcribed in memory on the voice worker pool;
+    the response carries per-stage timings (queue, decode, read, recognize).
     """
-    temp_input = None
-    temp_wav = None
-    
+    file_ext = audio.filename.split('.')[-1] if audio.filename and '.' in audio.filename else 'webm'
+    content = await audio.read()
+    if not content:
+        raise HTTPException(status_code=400, detail="Empty audio upload")
+
     try:
-        import speech_recognition as sr
-        from pydub import AudioSegment
-        import time
-        
-        # Save uploaded audio temporarily
-        file_ext = audio.filename.split('.')[-1] if audio.filename else 'webm'
-        temp_input = AUDIO_DIR / f"temp_input_{uuid.uuid4()}.{file_ext}"
-        temp_wav = AUDIO_DIR / f"temp_converted_{uuid.uuid4()}.wav"
-        
-        # Save the uploaded file
-        content = await audio.read()
-        with open(temp_input, "wb") as f:
-            f.write(content)
-        
-        # Ensure file is closed before proceeding
-        time.sleep(0.1)
-        
-        # Convert to WAV format if needed
-        audio_path = temp_input
-        if file_ext.lower() != 'wav':
-            try:
-                audio_segment = AudioSegment.from_file(str(temp_input))
-                audio_segment.export(str(temp_wav), format='wav')
-                audio_path = temp_wav
-                # Ensure export is complete
-                time.sleep(0.1)
-            except Exception as conv_error:
-                # If conversion fails, try using browser fallback
-                raise HTTPException(
-                    status_code=501,
-                    detail=f"Audio conversion failed. FFmpeg may not be installed. Error: {str(conv_error)}"
-                )
-        
-        # Initialize recognizer
-        recognizer = sr.Recognizer()
-        
-        # Adjust for ambient noise and transcribe
-        transcribed_text = None
-        with sr.AudioFile(str(audio_path)) as source:
-            recognizer.adjust_for_ambient_noise(source, duration=0.5)
-            audio_data = recognizer.record(source)
-            transcribed_text = recognizer.recognize_google(audio_data)
-        
-        # Return result before cleanup
-        result = JSONResponse({
-            "text": transcribed_text,
-            "message": "Audio transcribed successfully"
-        })
-        
-        # Clean up temp files with retry logic
-        time.sleep(0.2)  # Wait for files to be fully released
-        
-        for filepath in [temp_input, temp_wav]:
-            if filepath and filepath.exists():
-                try:
-                    os.remove(filepath)
-                except PermissionError:
-                    # File still locked, try again after a delay
-                    time.sleep(0.3)
-                    try:
-                        os.remove(filepath)
-                    except Exception:
-                        # If still can't delete, log and continue
-                        print(f"Warning: Could not delete temp file: {filepath}")
-        
-        return result
-                
-    except sr.UnknownValueError:
-        # Clean up before raising
-        cleanup_temp_files(temp_input, temp_wav)
+        transcribed_text, timings = await SPEECH_SERVICE.transcribe(content, file_ext)
+    except SpeechNotUnderstood:
         raise HTTPException(
             status_code=400,
             detail="Could not understand audio. Please speak clearly and try again."
         )
-    except sr.RequestError as e:
-        cleanup_temp_files(temp_input, temp_wav)
+    except RecognizerUnavailable as e:
         raise HTTPException(
             status_code=503,
             detail=f"Speech recognition service error: {str(e)}"
         )
+    except AudioDecodeError as e:
+        raise HTTPException(
+            status_code=501,
+            detail=f"Audio conversion failed. FFmpeg may not be installed. Error: {str(e)}"
+        )
     except ImportError as e:
-        cleanup_temp_files(temp_input, temp_wav)
         if 'speech_recognition' in str(e).lower():
             raise HTTPException(
                 status_code=501,
                 detail="SpeechRecognition not installed. Install with: pip install SpeechRecognition"
             )
-        elif 'pydub' in str(e).lower():
-            raise HTTPException(
-                status_code=501,
-                detail="pydub not installed. Install with: pip install pydub"
-            )
         else:
             raise HTTPException(status_code=501, detail=f"Missing dependency: {str(e)}")
-    except HTTPException:
-        # Re-raise HTTPException without wrapping
-        cleanup_temp_files(temp_input, temp_wav)
-        raise
     except Exception as e:
-        cleanup_temp_files(temp_input, temp_wav)
         raise HTTPException(status_code=500, detail=f"Voice input error: {str(e)}")
 
+    METRICS.record_stages("voice_input", timings)
+    return JSONResponse({
+        "text": transcribed_text,
+        "message": "Audio transcribed successfully",
+        "timings": timings,
+    })
 
-def cleanup_temp_files(temp_input, temp_wav):
-    """Helper function to clean up temporary audio files"""
-    import time
-    
-    time.sleep(0.2)  # Give system time to release file handles
-    
-    for filepath in [temp_input, temp_wav]:
-        if filepath and filepath.exists():
-            try:
-                os.remove(filepath)
-            except Exception as e:
-                print(f"Warning: Could not delete temp file {filepath}: {e}")
-                # Try once more after a longer delay
-                try:
-                    time.sleep(0.5)
-                    os.remove(filepath)
-                except Exception:
-                    pass  # Give up gracefully
 
+def _export_response(data: bytes, filename: str, format: str, cached: bool) -> StreamingResponse:
+    return StreamingResponse(
+        iter_bytes(data),
+        media_type=EXPORT_FORMATS[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.{format}"',
+            "Content-Length": str(len(data)),
+            "X-Export-Cache": "hit" if cached else "miss",
+        },
+    )
+
+def _export_error(e: Exception) -> HTTPException:
+    if isinstance(e, ExportTooLarge):
+        return HTTPException(status_code=413, detail=str(e))
+    if isinstance(e, ImportError):
+        return HTTPException(
+            status_code=501,
+            detail=f"Required library not installed: {str(e)}"
+        )
+    return HTTPException(status_code=500, detail=f"Download error: {str(e)}")
+
+@app.get("/download/{upload_id}/conversation/{format}")
+async def download_conversation(upload_id: str, format: str):
+    """
+    Download every answer for a PDF, oldest first, as one TXT, PDF or DOCX document.
+    TXT and PDF are streamed as they are written; DOCX is built in memory and
+    limited to EXPORT_DOCX_MAX_ENTRIES answers.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported format. Use txt, pdf, or docx")
+
+    def latest():
+        HISTORY_WRITER.flush_pending(upload_id)
+        db = SessionLocal()
+        try:
+            return db.query(ChatHistory.id).filter(
+                ChatHistory.upload_id == upload_id
+            ).order_by(ChatHistory.created_at.desc(), ChatHistory.id.desc()).first()
+        finally:
+            db.close()
+
+    newest = await asyncio.to_thread(latest)
+    if not newest:
+        raise HTTPException(status_code=404, detail="No answers found for this PDF")
+
+    filename = f"conversation_{upload_id[:8]}"
+    if format != "docx":
+        try:
+            chunks = await asyncio.to_thread(
+                stream_conversation, iter_conversation(SessionLocal, upload_id), upload_id, format
+            )
+        except Exception as e:
+            raise _export_error(e)
+        # A sync iterator: Starlette reads it (and the history pages) on a worker thread
+        return StreamingResponse(
+            chunks,
+            media_type=EXPORT_FORMATS[format],
+            headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'},
+        )
+
+    # A new answer changes the newest row id, so stale conversations are never served
+    key = ("conversation", upload_id, newest.id, format)
+    data = EXPORT_CACHE.get(key)
+    cached = data is not None
+    if not cached:
+        try:
+            data, _ = await asyncio.to_thread(
+                render_conversation, iter_conversation(SessionLocal, upload_id), upload_id, format,
+                EXPORT_DOCX_MAX_ENTRIES,
+            )
+        except Exception as e:
+            raise _export_error(e)
+        EXPORT_CACHE.put(key, data)
+    return _export_response(data, filename, format, cached)
 
 @app.get("/download/{upload_id}/{format}")
-async def download_answer(upload_id: str, format: str, db: Session = Depends(get_db)):
+async def download_answer(upload_id: str, format: str, history_id: Optional[str] = None):
     """
     Download the latest answer for a PDF in TXT, PDF, or DOCX format
+    (or the answer of `history_id`). Rendered in memory and cached per
+    history row and format.
     """
-    # Get the latest answer for this upload_id
-    history = db.query(ChatHistory).filter(
-        ChatHistory.upload_id == upload_id
-    ).order_by(ChatHistory.created_at.desc()).first()
-    
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported format. Use txt, pdf, or docx")
+
+    def load():
+        # Get the latest answer for this upload_id (committing its queued history first)
+        HISTORY_WRITER.flush_pending(upload_id, history_id)
+        db = SessionLocal()
+        try:
+            query = db.query(ChatHistory.id, ChatHistory.question, ChatHistory.answer).filter(
+                ChatHistory.upload_id == upload_id
+            )
+            if history_id:
+                return query.filter(ChatHistory.id == history_id).first()
+            return query.order_by(ChatHistory.created_at.desc(), ChatHistory.id.desc()).first()
+        finally:
+            db.close()
+
+    history = await asyncio.to_thread(load)
     if not history:
         raise HTTPException(status_code=404, detail="No answers found for this PDF")
-    
-    text = f"Question: {history.question}\n\nAnswer:\n{history.answer}"
-    
-    # Create downloads directory
-    downloads_dir = Path("downloads")
-    downloads_dir.mkdir(exist_ok=True)
-    
-    filename = f"answer_{upload_id[:8]}"
-    
-    try:
-        if format == "txt":
-            filepath = downloads_dir / f"{filename}.txt"
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(text)
-        
-        elif format == "docx":
-            from docx import Document
-            filepath = downloads_dir / f"{filename}.docx"
-            doc = Document()
-            doc.add_heading("AI Generated Answer", level=1)
-            doc.add_heading("Question:", level=2)
-            doc.add_paragraph(history.question)
-            doc.add_heading("Answer:", level=2)
-            doc.add_paragraph(history.answer)
-            doc.save(str(filepath))
-        
-        elif format == "pdf":
-            from reportlab.lib.pagesizes import letter
-            from reportlab.pdfgen import canvas
-            from reportlab.lib.utils import simpleSplit
-            
-            filepath = downloads_dir / f"{filename}.pdf"
-            c = canvas.Canvas(str(filepath), pagesize=letter)
-            width, height = letter
-            
-            # Title
-            c.setFont("Helvetica-Bold", 16)
-            c.drawString(50, height - 50, "AI Generated Answer")
-            
-            # Question
-            y = height - 100
-            c.setFont("Helvetica-Bold", 12)
-            c.drawString(50, y, "Question:")
-            y -= 20
-            
-            c.setFont("Helvetica", 10)
-            lines = simpleSplit(history.question, "Helvetica", 10, width - 100)
-            for line in lines:
-                if y < 50:
-                    c.showPage()
-                    y = height - 50
-                c.drawString(50, y, line)
-                y -= 15
-            
-            # Answer
-            y -= 20
-            c.setFont("Helvetica-Bold", 12)
-            c.drawString(50, y, "Answer:")
-            y -= 20
-            
-            c.setFont("Helvetica", 10)
-            lines = simpleSplit(history.answer, "Helvetica", 10, width - 100)
-            for line in lines:
-                if y < 50:
-                    c.showPage()
-                    y = height - 50
-                c.drawString(50, y, line)
-                y -= 15
-            
-            c.save()
-        
+
+    key = (history.id, format)
+    data = EXPORT_CACHE.get(key)
+    cached = data is not None
+    if not cached:
+        try:
+            data = await asyncio.to_thread(render_entry, history.question, history.answer, format)
+        except Exception as e:
+            raise _export_error(e)
+        EXPORT_CACHE.put(key, data)
+    return _export_response(data, f"answer_{upload_id[:8]}", format, cached)
+
+
+def _collect_pdfs(paths) -> List[Path]:
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(path.rglob("*.pdf")))
+        elif allowed_file(path.name):
+            files.append(path)
+    return files
+
+def ingest_cli(argv) -> int:
+    """
+    Bulk-ingest PDFs from the command line:
+        python main.py ingest docs/ more.pdf [--extractor pdfplumber]
+        python main.py ingest --checkpoint uploads/bulk/<batch_id>.json   # resume
+    Run it while the server is stopped; both write the same index registry.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog="python main.py ingest", description="Bulk-ingest PDF files and directories")
+    parser.add_argument("paths", nargs="*", help="PDF files or directories (searched recursively)")
+    parser.add_argument("--checkpoint", help="checkpoint file; an existing one is resumed")
+    parser.add_argument("--extractor", choices=list(EXTRACTORS), help="PDF text extractor")
+    args = parser.parse_args(argv)
+
+    path = Path(args.checkpoint) if args.checkpoint else checkpoint_path(str(uuid.uuid4()))
+    checkpoint = BulkCheckpoint.load(path)
+    if args.extractor:
+        checkpoint.extractor = args.extractor
+    known = {item["file_path"] for item in checkpoint.items}
+    for pdf in _collect_pdfs(args.paths):
+        file_path = str(pdf.resolve())
+        if file_path not in known:
+            checkpoint.add(file_path, pdf.name, file_sha256(file_path))
+    checkpoint.save()
+    pending = checkpoint.pending()
+    if not pending:
+        print(f"Nothing to ingest ({len(checkpoint.items)} PDFs in {path} are done)")
+        return 0
+    names = {item["upload_id"]: item["filename"] for item in pending}
+    print(f"🦙 Ingesting {len(pending)} PDFs (checkpoint: {path})")
+
+    def on_finish(upload_id: str, error: Optional[str]):
+        if error:
+            print(f"❌ {names[upload_id]}: {error}")
         else:
-            raise HTTPException(status_code=400, detail="Unsupported format. Use txt, pdf, or docx")
-        
-        return FileResponse(
-            path=str(filepath),
-            filename=f"{filename}.{format}",
-            media_type="application/octet-stream"
-        )
-    
-    except ImportError as e:
-        raise HTTPException(
-            status_code=501,
-            detail=f"Required library not installed: {str(e)}"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Download error: {str(e)}")
+            print(f"✅ {names[upload_id]} -> {upload_id}")
 
+    async def run():
+        try:
+            return await run_bulk(INGESTION_POOL, INDEX_STORE, checkpoint, on_finish=on_finish)
+        finally:
+            INGESTION_POOL.shutdown()
+
+    try:
+        summary = asyncio.run(run())
+    except KeyboardInterrupt:
+        print(f"Interrupted; resume with: python main.py ingest --checkpoint {path}")
+        return 130
+    finally:
+        CORPUS.flush()
+    print(f"Pages: {summary['pages']}  Chunks: {summary['chunks']}  Seconds: {summary['seconds']}")
+    print(f"Throughput: {summary['pages_per_second']} pages/s, {summary['chunks_per_second']} chunks/s")
+    if checkpoint.failed:
+        print(f"{len(checkpoint.failed)} PDFs failed; retry them with: python main.py ingest --checkpoint {path}")
+        return 1
+    return 0
 
 if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "ingest":
+        sys.exit(ingest_cli(sys.argv[2:]))
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,168 @@
+"""
+Latency metrics for LlamaDoc AI
+
+Histograms of per-stage latency (retrieval, prompt building, LLM call,
+rendering for /query; extraction, splitting, embedding, persisting for
+/upload; synthesis for /tts; decode and recognition for /voice-input) and
+of whole requests, plus gauges read at scrape time (index cache size and
+memory, history writer latency). GET /metrics serves them in the
+Prometheus text exposition format; no client library is needed.
+
+Recording is a dict lookup and a bisect under a lock, cheap enough for
+the hot path. With METRICS_TIMING_HEADERS=1 (or a request header
+"X-Debug-Timings: 1") responses also carry a Server-Timing header with the
+stages recorded for that request.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+METRICS_TIMING_HEADERS = os.environ.get("METRICS_TIMING_HEADERS", "0") == "1"
+METRICS_PREFIX = "llamadoc"
+# Seconds; spans cache hits (~1ms) to slow LLM calls and large uploads
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Stages recorded during the current request, for the Server-Timing header
+_request_stages: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_stages", default=None)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], list] = {}  # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count)
+                        for labels, (counts, total, count) in sorted(self._series.items())]
+        inf = 'le="+Inf"'
+        for labels, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_bucket{_labels(self.label_names, labels, inf)} {count}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {round(total, 6)}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {count}"
+
+
+class Metrics:
+    """
+    Stage and request histograms plus callback gauges. Stage names come
+    from the timings dicts the endpoints already build ("retrieval_ms" ->
+    stage "retrieval").
+    """
+
+    def __init__(self, prefix: str = METRICS_PREFIX):
+        self.prefix = prefix
+        self.stages = Histogram(f"{prefix}_stage_seconds", "Latency of one stage of an endpoint",
+                                ("endpoint", "stage"))
+        self.requests = Histogram(f"{prefix}_request_seconds", "Latency of whole HTTP requests",
+                                  ("method", "route", "status"))
+        self.db_writes = Histogram(f"{prefix}_db_write_seconds", "Latency of history write transactions",
+                                   ("table",))
+        self._gauges: List[Tuple[str, str, Callable[[], float]]] = []
+
+    def observe_stage(self, endpoint: str, stage: str, seconds: float) -> None:
+        self.stages.observe(seconds, endpoint, stage)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages.append((stage, seconds))
+
+    def record_stages(self, endpoint: str, timings: dict) -> None:
+        """Observe every "<stage>_ms" entry of an endpoint's timings dict"""
+        for key, value in timings.items():
+            if key.endswith("_ms") and isinstance(value, (int, float)):
+                self.observe_stage(endpoint, key[:-3], value / 1000)
+
+    @contextmanager
+    def timer(self, endpoint: str, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(endpoint, stage, time.perf_counter() - start)
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float) -> None:
+        self.requests.observe(seconds, method, route, str(status))
+
+    def observe_db_write(self, seconds: float, table: str = "chat_history") -> None:
+        self.db_writes.observe(seconds, table)
+
+    def gauge(self, name: str, help_text: str, fn: Callable[[], float]) -> None:
+        """Register a gauge whose value is read from `fn` at scrape time"""
+        self._gauges.append((f"{self.prefix}_{name}", help_text, fn))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        for histogram in (self.stages, self.requests, self.db_writes):
+            lines.extend(histogram.render())
+        for name, help_text, fn in self._gauges:
+            try:
+                value = fn()
+            except Exception as e:
+                print(f"Warning: Could not read metric {name}: {e}")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def start_request_timing() -> object:
+    """Collect this request's stages for the Server-Timing header; returns a reset token"""
+    return _request_stages.set([])
+
+
+def finish_request_timing(token) -> List[Tuple[str, float]]:
+    stages = _request_stages.get() or []
+    _request_stages.reset(token)
+    return stages
+
+
+def server_timing_header(stages: List[Tuple[str, float]], total_seconds: float) -> str:
+    entries = [f"{stage};dur={round(seconds * 1000, 2)}" for stage, seconds in stages]
+    entries.append(f"total;dur={round(total_seconds * 1000, 2)}")
+    return ", ".join(entries)
@@ -3,7 +3,7 @@ SQLAlchemy models for LlamaDoc AI
 """
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Text, DateTime, Integer, Boolean
+from sqlalchemy import Column, String, Text, DateTime, Integer, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -17,6 +17,8 @@ class ChatHistory(Base):
     Chat history model to store Q&A interactions with optional audio files
     """
     __tablename__ = "chat_history"
+    # Per-document listing, newest first (/history, /download)
+    __table_args__ = (Index("ix_chat_history_upload_created", "upload_id", "created_at"),)
     
     id = Column(String, primary_key=True, default=gen_uuid)
     upload_id = Column(String, nullable=True, index=True)  # Links to uploaded PDF
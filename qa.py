@@ -0,0 +1,133 @@
+"""
+Shared question-answering chain for LlamaDoc AI
+
+The ChatOpenAI client and its pooled keep-alive HTTP connections (sync and
+async) are built once per process; only the retriever (i.e. which PDF to
+search) changes from one request to the next. Retrieved chunks are packed
+into a token budget by context.assemble_context before prompting. The async
+path never blocks the event loop, so many questions can be in flight on a
+single uvicorn worker.
+"""
+import os
+import threading
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+
+import httpx
+from langchain.prompts import PromptTemplate
+from langchain_core.prompts import format_document
+from langchain_openai import ChatOpenAI
+from langchain_core.documents import Document
+
+from context import assemble_context, count_tokens
+
+OPENAI_API_BASE = os.environ.get("OPENAI_API_BASE", "http://localhost:1234/v1")
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "lm-studio")
+LLM_MODEL_NAME = os.environ.get("LLM_MODEL_NAME", "tinyllama-1.1b-chat-v1.0")
+LLM_REQUEST_TIMEOUT = float(os.environ.get("LLM_REQUEST_TIMEOUT", "60"))
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "20"))
+LLM_KEEPALIVE_SECONDS = float(os.environ.get("LLM_KEEPALIVE_SECONDS", "60"))
+
+prompt = """
+You are a domain expert assistant.
+Use the provided context to answer the question clearly and accurately.
+If the answer cannot be found in the context, say "The information is not available in the provided context."
+Provide a well-structured answer in 3–4 sentences and keep it factual.
+
+Context:
+{context}
+
+Question:
+{question}
+
+Answer:
+"""
+QA_CHAIN_PROMPT = PromptTemplate.from_template(prompt)
+
+DOCUMENT_PROMPT = PromptTemplate(
+    input_variables=["page_content", "source"],
+    template="Context:\ncontent:{page_content}\nsource:{source}",
+)
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+class QAService:
+    """
+    Holds the LLM client for the whole process and turns retrieved chunks
+    into a budgeted prompt.
+    """
+
+    def __init__(self):
+        limits = httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_SECONDS,
+        )
+        self.http_client = httpx.Client(timeout=LLM_REQUEST_TIMEOUT, limits=limits)
+        self.http_async_client = httpx.AsyncClient(timeout=LLM_REQUEST_TIMEOUT, limits=limits)
+        self.llm = ChatOpenAI(
+            model=LLM_MODEL_NAME,
+            temperature=0.0,
+            openai_api_base=OPENAI_API_BASE,
+            openai_api_key=OPENAI_API_KEY,
+            request_timeout=LLM_REQUEST_TIMEOUT,
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
+        )
+
+    async def aanswer_docs(self, docs: List[Document], question: str) -> Tuple[str, dict]:
+        """Answer from documents that were already retrieved"""
+        start = time.perf_counter()
+        prompt_text, context_stats = self.build_prompt(docs, question)
+        packed = time.perf_counter()
+        result = await self.llm.ainvoke(prompt_text)
+        timings = {"context_ms": _ms(packed - start), "llm_ms": _ms(time.perf_counter() - packed)}
+        return result.content, {**timings, **context_stats}
+
+    def build_prompt(self, docs: List[Document], question: str,
+                     budget: Optional[int] = None) -> Tuple[str, dict]:
+        """Pack `docs` into the context budget and render the QA prompt
+
+        Returns (prompt text, packing stats including prompt_tokens).
+        """
+        packed, context_stats = assemble_context(docs, budget)
+        context = "\n\n".join(format_document(doc, DOCUMENT_PROMPT) for doc in packed)
+        prompt_text = QA_CHAIN_PROMPT.format(context=context, question=question)
+        context_stats["prompt_tokens"] = count_tokens(prompt_text)
+        return prompt_text, context_stats
+
+    async def astream_answer(self, prompt_text: str) -> AsyncIterator[str]:
+        """Yield answer tokens for a prompt from build_prompt() as the backend produces them"""
+        async for chunk in self.llm.astream(prompt_text):
+            if chunk.content:
+                yield chunk.content
+
+    async def aclose(self) -> None:
+        self.http_client.close()
+        await self.http_async_client.aclose()
+
+
+_qa_service: Optional[QAService] = None
+_qa_lock = threading.Lock()
+
+
+def get_qa_service() -> QAService:
+    """Return the process-wide QA service, creating it on first use"""
+    global _qa_service
+    if _qa_service is None:
+        with _qa_lock:
+            if _qa_service is None:
+                start = time.perf_counter()
+                _qa_service = QAService()
+                print(f"✅ QA chain ready in {_ms(time.perf_counter() - start)}ms")
+    return _qa_service
+
+
+async def close_qa_service() -> None:
+    global _qa_service
+    service, _qa_service = _qa_service, None
+    if service is not None:
+        await service.aclose()
@@ -0,0 +1,156 @@
+"""
+CPU reranking stage for LlamaDoc AI
+
+Retrieval fetches a wider candidate set cheaply; the reranker then scores
+each (question, chunk) pair and keeps the best k. With RERANK_MODEL set, a
+small sentence-transformers cross-encoder does the scoring; otherwise a
+lexical-overlap scorer is used, which needs no model at all. Pair scores
+are computed in batches and cached (LRU) by question and chunk text.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from lexical import tokenize
+
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "")  # e.g. cross-encoder/ms-marco-MiniLM-L-6-v2; empty = lexical overlap
+RERANK_BATCH_SIZE = int(os.environ.get("RERANK_BATCH_SIZE", "32"))
+RERANK_CACHE_SIZE = int(os.environ.get("RERANK_CACHE_SIZE", "20000"))  # cached pair scores, 0 = off
+
+
+def overlap_score(question_terms: List[str], text: str) -> float:
+    """Share of question terms found in `text`, plus the share of question bigrams (phrases)"""
+    if not question_terms:
+        return 0.0
+    tokens = tokenize(text)
+    vocabulary = set(tokens)
+    terms = set(question_terms)
+    score = sum(1 for term in terms if term in vocabulary) / len(terms)
+    question_bigrams = set(zip(question_terms, question_terms[1:]))
+    if question_bigrams:
+        bigrams = set(zip(tokens, tokens[1:]))
+        score += len(question_bigrams & bigrams) / len(question_bigrams)
+    return score
+
+
+class Reranker:
+    """
+    Scores (question, chunk) pairs with a cross-encoder or the lexical
+    overlap scorer and keeps the top k. The model is loaded once per process.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL,
+                 batch_size: int = RERANK_BATCH_SIZE,
+                 cache_size: int = RERANK_CACHE_SIZE):
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.cache_size = cache_size
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._cache: "OrderedDict[str, float]" = OrderedDict()
+        self._stats_lock = threading.Lock()
+        self.load_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.batches = 0
+        self.score_seconds = 0.0
+
+    @property
+    def scorer(self) -> str:
+        return self.model_name or "lexical-overlap"
+
+    def load(self) -> "Reranker":
+        """Load the cross-encoder if one is configured (thread-safe)"""
+        if not self.model_name or self._model is not None:
+            return self
+        with self._load_lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                start = time.perf_counter()
+                self._model = CrossEncoder(self.model_name, device="cpu")
+                self.load_seconds = time.perf_counter() - start
+                print(f"✅ Reranker '{self.model_name}' loaded in {self.load_seconds:.2f}s")
+        return self
+
+    def _key(self, question: str, text: str) -> str:
+        return hashlib.sha1(f"{self.scorer}\0{question}\0{text}".encode("utf-8")).hexdigest()
+
+    def _score_batch(self, question: str, texts: List[str]) -> List[float]:
+        start = time.perf_counter()
+        if self.model_name:
+            scores = [float(s) for s in self._model.predict([(question, t) for t in texts],
+                                                            batch_size=self.batch_size)]
+        else:
+            question_terms = tokenize(question)
+            scores = [overlap_score(question_terms, t) for t in texts]
+        with self._stats_lock:
+            self.batches += 1
+            self.score_seconds += time.perf_counter() - start
+        return scores
+
+    def score(self, question: str, texts: List[str]) -> List[float]:
+        self.load()
+        keys = [self._key(question, t) for t in texts]
+        scores: List[Optional[float]] = [None] * len(texts)
+        missing: List[int] = []
+        with self._stats_lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key) if self.cache_size else None
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    scores[i] = cached
+                else:
+                    missing.append(i)
+            self.cache_hits += len(texts) - len(missing)
+            self.cache_misses += len(missing)
+
+        for start in range(0, len(missing), self.batch_size):
+            positions = missing[start:start + self.batch_size]
+            batch_scores = self._score_batch(question, [texts[i] for i in positions])
+            with self._stats_lock:
+                for i, value in zip(positions, batch_scores):
+                    scores[i] = value
+                    if self.cache_size:
+                        self._cache[keys[i]] = value
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, question: str, docs: List[Document], k: int) -> List[Tuple[Document, float]]:
+        """Best k of `docs` by pair score; ties keep the retrieval order"""
+        scores = self.score(question, [doc.page_content for doc in docs])
+        order = sorted(range(len(docs)), key=lambda i: (-scores[i], i))[:k]
+        return [(docs[i], scores[i]) for i in order]
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "scorer": self.scorer,
+                "loaded": self._model is not None or not self.model_name,
+                "load_seconds": round(self.load_seconds, 4),
+                "batch_size": self.batch_size,
+                "batches": self.batches,
+                "score_seconds": round(self.score_seconds, 4),
+                "cache_size": len(self._cache),
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+            }
+
+
+_reranker: Optional[Reranker] = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> Reranker:
+    """Return the process-wide reranker, creating it on first use"""
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = Reranker()
+    return _reranker
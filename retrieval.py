@@ -0,0 +1,196 @@
+"""
+Hybrid (BM25 + vector) retrieval for LlamaDoc AI
+
+Vector search finds chunks that mean the same thing as the question; the
+BM25 index finds chunks that contain its exact tokens (part numbers, error
+codes, clause IDs). Both rankings are merged with reciprocal rank fusion,
+which needs no score normalisation between the two. An optional second
+stage reranks a wider candidate set on CPU (see rerank.py).
+"""
+import json
+import os
+import time
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from ann import Tombstones, batch_search_ids, resolve_search_options
+from embeddings import get_embedder
+from lexical import BM25Index
+from rerank import get_reranker
+
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid").lower()  # 'hybrid' or 'vector'
+RETRIEVAL_K = int(os.environ.get("RETRIEVAL_K", "3"))  # chunks passed to the LLM
+HYBRID_FETCH_K = int(os.environ.get("HYBRID_FETCH_K", "20"))  # candidates taken from each ranking
+RRF_K = int(os.environ.get("RRF_K", "60"))  # rank damping constant of reciprocal rank fusion
+RERANK_ENABLED = os.environ.get("RERANK_ENABLED", "0") == "1"  # rerank by default
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", "20"))  # first-stage depth when reranking
+MAX_RETRIEVAL_K = 20
+MAX_RERANK_CANDIDATES = 200
+
+RETRIEVAL_MODES = ("hybrid", "vector")
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+def _bounded_int(options: dict, name: str, low: int, high: int) -> Optional[int]:
+    value = options.get(name)
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer")
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+
+def resolve_retrieval_options(options: Optional[dict]) -> dict:
+    """
+    Per-query retrieval settings from a request body: ANN breadth (see
+    resolve_search_options), "retrieval" mode, final "k", and "rerank" with
+    its "candidates" depth. Raises ValueError on invalid values.
+    """
+    if not options:
+        return {}
+    settings = resolve_search_options(options)
+    if options.get("retrieval") is not None:
+        if options["retrieval"] not in RETRIEVAL_MODES:
+            raise ValueError(f"retrieval must be one of {', '.join(RETRIEVAL_MODES)}")
+        settings["mode"] = options["retrieval"]
+    k = _bounded_int(options, "k", 1, MAX_RETRIEVAL_K)
+    if k is not None:
+        settings["k"] = k
+    candidates = _bounded_int(options, "candidates", 1, MAX_RERANK_CANDIDATES)
+    if candidates is not None:
+        settings["candidates"] = candidates
+    if options.get("rerank") is not None:
+        settings["rerank"] = bool(options["rerank"])
+    return settings
+
+
+def settings_key(settings: Optional[dict]) -> str:
+    """
+    Canonical form of resolved retrieval settings with defaults filled in,
+    so requests that retrieve the same way share cached answers ("rerank":
+    false and no "rerank" are the same when reranking is off by default).
+    """
+    effective = {"mode": RETRIEVAL_MODE, "k": RETRIEVAL_K, "rerank": RERANK_ENABLED, **(settings or {})}
+    if effective["rerank"]:
+        effective.setdefault("candidates", RERANK_CANDIDATES)
+    else:
+        effective.pop("candidates", None)
+    return json.dumps(effective, sort_keys=True, separators=(",", ":"))
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int,
+                           rrf_k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Merge ranked id lists: score(id) = sum of 1 / (rrf_k + rank)"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever over one upload. Works as a regular LangChain retriever
+    (defaults only) and through retrieve() with per-query settings.
+    Searches hold the read side of `lock` (an ann.ReadWriteLock), so they
+    run concurrently with each other but never with an in-place update;
+    tombstoned vectors are skipped.
+    """
+
+    vectorstore: FAISS
+    lexical: Optional[BM25Index] = None
+    tombstones: Optional[Tombstones] = None
+    lock: Any = None
+    k: int = RETRIEVAL_K
+    fetch_k: int = HYBRID_FETCH_K
+    mode: str = RETRIEVAL_MODE
+
+    def search(self, question: str, embedding: Optional[List[float]] = None,
+               k: Optional[int] = None, mode: Optional[str] = None,
+               ef_search: Optional[int] = None, nprobe: Optional[int] = None) -> List[Document]:
+        """First stage: top-k chunks for `question`; `embedding` skips re-embedding the question"""
+        if embedding is None:
+            embedding = get_embedder().embed_query(question)
+        return self.search_batch([question], [embedding], k, mode, ef_search, nprobe)[0]
+
+    def search_batch(self, questions: List[str], embeddings: List[List[float]],
+                     k: Optional[int] = None, mode: Optional[str] = None,
+                     ef_search: Optional[int] = None, nprobe: Optional[int] = None) -> List[List[Document]]:
+        """search() for many questions with a single FAISS call over all their embeddings"""
+        k = k or self.k
+        mode = mode or self.mode
+        hybrid = mode == "hybrid" and self.lexical is not None
+        if not questions:
+            return []
+        fetch_k = max(self.fetch_k, k) if hybrid else k
+
+        with self.lock.read() if self.lock is not None else nullcontext():
+            docstore = self.vectorstore.docstore
+            vector_hits = batch_search_ids(self.vectorstore, embeddings, fetch_k, ef_search, nprobe, self.tombstones)
+            results = []
+            for question, hits in zip(questions, vector_hits):
+                if hybrid:
+                    lexical_ids = [doc_id for doc_id, _ in self.lexical.search(question, fetch_k)]
+                    hits = reciprocal_rank_fusion([[doc_id for doc_id, _ in hits], lexical_ids], k)
+                results.append([docstore.search(doc_id) for doc_id, _ in hits])
+            return results
+
+    def retrieve(self, question: str, embedding: Optional[List[float]] = None,
+                 k: Optional[int] = None, rerank: Optional[bool] = None,
+                 candidates: Optional[int] = None, **search_settings) -> Tuple[List[Document], dict]:
+        """
+        Final chunks for `question` and per-stage timings. With reranking, the
+        first stage fetches `candidates` chunks and the reranker keeps k.
+        """
+        k = k or self.k
+        rerank = RERANK_ENABLED if rerank is None else rerank
+        start = time.perf_counter()
+        if not rerank:
+            docs = self.search(question, embedding, k, **search_settings)
+            return docs, {"retrieval_ms": _ms(time.perf_counter() - start)}
+
+        candidates = max(candidates or RERANK_CANDIDATES, k)
+        docs = self.search(question, embedding, candidates, **search_settings)
+        searched = time.perf_counter()
+        reranked = get_reranker().rerank(question, docs, k)
+        timings = {
+            "retrieval_ms": _ms(searched - start),
+            "rerank_ms": _ms(time.perf_counter() - searched),
+            "candidates": len(docs),
+            "reranker": get_reranker().scorer,
+        }
+        return [doc for doc, _ in reranked], timings
+
+    def retrieve_batch(self, questions: List[str], embeddings: List[List[float]],
+                       k: Optional[int] = None, rerank: Optional[bool] = None,
+                       candidates: Optional[int] = None, **search_settings) -> Tuple[List[List[Document]], dict]:
+        """retrieve() for many questions; the first stage is one batched search"""
+        k = k or self.k
+        rerank = RERANK_ENABLED if rerank is None else rerank
+        depth = max(candidates or RERANK_CANDIDATES, k) if rerank else k
+        start = time.perf_counter()
+        results = self.search_batch(questions, embeddings, depth, **search_settings)
+        searched = time.perf_counter()
+        timings = {"retrieval_ms": _ms(searched - start)}
+        if rerank:
+            reranker = get_reranker()
+            results = [[doc for doc, _ in reranker.rerank(question, docs, k)]
+                       for question, docs in zip(questions, results)]
+            timings.update(rerank_ms=_ms(time.perf_counter() - searched), reranker=reranker.scorer)
+        return results, timings
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.retrieve(query)[0]
@@ -0,0 +1,201 @@
+"""
+Speech-to-text for LlamaDoc AI
+
+Uploaded audio is decoded and transcribed entirely in memory (no temp
+files, no sleeps) on a small worker pool, so /voice-input never blocks the
+event loop. Browser recordings (webm/ogg/mp3) are piped through FFmpeg
+(stdin -> stdout) into a mono 16 kHz WAV buffer; WAV uploads are used as
+they are.
+
+The recognizer backend is pluggable (VOICE_RECOGNIZER):
+  - google  Google Web Speech API through SpeechRecognition (online, the default)
+  - sphinx  CMU PocketSphinx (offline, needs pocketsphinx)
+  - whisper local Whisper model through SpeechRecognition (offline)
+  - stub    returns VOICE_STUB_TEXT without looking at the audio (tests)
+"""
+import asyncio
+import io
+import os
+import subprocess
+import time
+import wave
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple, Type
+
+VOICE_RECOGNIZER = os.environ.get("VOICE_RECOGNIZER", "google").lower()
+VOICE_WORKERS = int(os.environ.get("VOICE_WORKERS", "2"))  # concurrent decode + transcription jobs
+VOICE_AMBIENT_SECONDS = float(os.environ.get("VOICE_AMBIENT_SECONDS", "0.5"))  # noise calibration, 0 = off
+VOICE_STUB_TEXT = os.environ.get("VOICE_STUB_TEXT", "test transcription")
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "base")
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+FFMPEG_TIMEOUT = float(os.environ.get("FFMPEG_TIMEOUT", "60"))  # seconds before a conversion is abandoned
+VOICE_SAMPLE_RATE = 16000
+
+
+class SpeechNotUnderstood(Exception):
+    """The audio was decoded but no speech could be recognised"""
+
+
+class RecognizerUnavailable(Exception):
+    """The recognition backend (service or local model) could not be used"""
+
+
+class AudioDecodeError(Exception):
+    """The upload could not be converted to WAV (usually FFmpeg is missing)"""
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+class SpeechRecognitionBackend(ABC):
+    """Base for SpeechRecognition-powered backends; subclasses call one recognize_* method"""
+
+    name = ""
+
+    def recognize(self, wav: io.BytesIO, timings: dict) -> str:
+        import speech_recognition as sr
+        recognizer = sr.Recognizer()
+        start = time.perf_counter()
+        with sr.AudioFile(wav) as source:
+            if VOICE_AMBIENT_SECONDS > 0:
+                recognizer.adjust_for_ambient_noise(source, duration=VOICE_AMBIENT_SECONDS)
+            audio_data = recognizer.record(source)
+        read = time.perf_counter()
+        timings["read_ms"] = _ms(read - start)
+        try:
+            return self.transcribe(recognizer, audio_data)
+        except sr.UnknownValueError:
+            raise SpeechNotUnderstood("Could not understand audio")
+        except sr.RequestError as e:
+            raise RecognizerUnavailable(str(e))
+        finally:
+            timings["recognize_ms"] = _ms(time.perf_counter() - read)
+
+    @abstractmethod
+    def transcribe(self, recognizer, audio_data) -> str:
+        """Run one recognize_* method of `recognizer` on `audio_data`"""
+
+
+class GoogleBackend(SpeechRecognitionBackend):
+    name = "google"
+
+    def transcribe(self, recognizer, audio_data) -> str:
+        return recognizer.recognize_google(audio_data)
+
+
+class SphinxBackend(SpeechRecognitionBackend):
+    name = "sphinx"
+
+    def transcribe(self, recognizer, audio_data) -> str:
+        return recognizer.recognize_sphinx(audio_data)
+
+
+class WhisperBackend(SpeechRecognitionBackend):
+    name = "whisper"
+
+    def transcribe(self, recognizer, audio_data) -> str:
+        return recognizer.recognize_whisper(audio_data, model=WHISPER_MODEL).strip()
+
+
+class StubBackend:
+    """Fixed transcription, for tests and for running without a recognizer"""
+
+    name = "stub"
+
+    def recognize(self, wav: io.BytesIO, timings: dict) -> str:
+        timings["recognize_ms"] = 0.0
+        return VOICE_STUB_TEXT
+
+
+RECOGNIZERS: Dict[str, Type] = {
+    GoogleBackend.name: GoogleBackend,
+    SphinxBackend.name: SphinxBackend,
+    WhisperBackend.name: WhisperBackend,
+    StubBackend.name: StubBackend,
+}
+
+
+def register_recognizer(backend: Type) -> None:
+    """Make a backend class (with `name` and recognize(wav, timings)) selectable"""
+    RECOGNIZERS[backend.name] = backend
+
+
+def decode_audio(content: bytes, ext: str) -> io.BytesIO:
+    """Return a WAV buffer for `content`; non-WAV input is piped through FFmpeg"""
+    if ext == "wav":
+        return io.BytesIO(content)
+    # Raw PCM out, WAV header added here: a WAV written to a pipe has no valid sizes
+    command = [
+        FFMPEG_BINARY, "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-ac", "1", "-ar", str(VOICE_SAMPLE_RATE), "-f", "s16le", "pipe:1",
+    ]
+    try:
+        result = subprocess.run(command, input=content, capture_output=True, timeout=FFMPEG_TIMEOUT)
+    except OSError as e:
+        raise AudioDecodeError(f"Could not run FFmpeg ({FFMPEG_BINARY}): {e}")
+    except subprocess.TimeoutExpired:
+        raise AudioDecodeError(f"FFmpeg took longer than {FFMPEG_TIMEOUT:g}s")
+    if result.returncode != 0 or not result.stdout:
+        message = result.stderr.decode("utf-8", "replace").strip().splitlines()
+        raise AudioDecodeError(message[-1] if message else f"FFmpeg exited with {result.returncode}")
+    wav = io.BytesIO()
+    with wave.open(wav, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(VOICE_SAMPLE_RATE)
+        out.writeframes(result.stdout)
+    wav.seek(0)
+    return wav
+
+
+class SpeechService:
+    """Runs decode + transcription on a thread pool with the configured backend"""
+
+    def __init__(self, backend: str = VOICE_RECOGNIZER, workers: int = VOICE_WORKERS):
+        if backend not in RECOGNIZERS:
+            raise ValueError(f"Unknown VOICE_RECOGNIZER: {backend!r} (choose from {', '.join(RECOGNIZERS)})")
+        self.backend_name = backend
+        self.workers = max(1, workers)
+        self._backend = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = RECOGNIZERS[self.backend_name]()
+        return self._backend
+
+    def start(self) -> None:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="voice")
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _transcribe(self, content: bytes, ext: str, queued_at: float) -> Tuple[str, dict]:
+        start = time.perf_counter()
+        timings = {"queue_ms": _ms(start - queued_at)}
+        wav = decode_audio(content, ext)
+        timings["decode_ms"] = _ms(time.perf_counter() - start)
+        text = self.backend.recognize(wav, timings)
+        if not text:
+            raise SpeechNotUnderstood("No speech recognised")
+        return text, timings
+
+    async def transcribe(self, content: bytes, ext: str) -> Tuple[str, dict]:
+        """Return (text, per-stage timings in ms)
+
+        Raises AudioDecodeError, SpeechNotUnderstood or RecognizerUnavailable.
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        queued_at = time.perf_counter()
+        text, timings = await loop.run_in_executor(self._pool, self._transcribe, content, ext.lower(), queued_at)
+        timings["total_ms"] = _ms(time.perf_counter() - queued_at)
+        timings["recognizer"] = self.backend_name
+        return text, timings
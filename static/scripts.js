@@ -52,28 +52,11 @@ uploadForm.addEventListener('submit', async (e) => {
         const data = await response.json();
         
         if (response.ok) {
-            uploadId = data.upload_id;
-            uploadStatus.textContent = `✅ File uploaded successfully! You can now ask questions.`;
-            uploadStatus.className = 'status-message success';
-            
-            // Initialize voice features with upload ID
-            if (window.initVoice) {
-                initVoice(uploadId);
-            }
-            
-            // Load chat history for this upload
-            if (window.loadHistory) {
-                loadHistory(uploadId);
+            // Indexing runs in the background; follow its progress until it is ready
+            if (data.job_id) {
+                await waitForIngestion(data.job_id);
             }
-            
-            // Show query section with smooth reveal
-            querySection.classList.remove('hidden');
-            querySection.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
-            
-            // Focus on question input
-            setTimeout(() => {
-                document.getElementById('question').focus();
-            }, 500);
+            onIndexReady(data.upload_id);
         } else {
             uploadStatus.textContent = `❌ Error: ${data.detail}`;
             uploadStatus.className = 'status-message error';
@@ -89,6 +72,72 @@ uploadForm.addEventListener('submit', async (e) => {
     }
 });
 
+/**
+ * Follow ingestion progress over Server-Sent Events until the job finishes.
+ * Resolves when the index is ready, rejects if ingestion failed.
+ */
+function waitForIngestion(jobId) {
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(`/jobs/${jobId}/events`);
+        
+        const showProgress = (job) => {
+            let text = `⏳ ${job.status.charAt(0).toUpperCase() + job.status.slice(1)}...`;
+            if (job.pages_total) {
+                text += ` ${job.pages_parsed}/${job.pages_total} pages`;
+            }
+            if (job.chunks_total) {
+                text += `, ${job.chunks_embedded}/${job.chunks_total} chunks`;
+            }
+            if (job.eta_seconds) {
+                text += ` (~${Math.ceil(job.eta_seconds)}s left)`;
+            }
+            uploadStatus.textContent = text;
+        };
+        
+        source.addEventListener('progress', (e) => showProgress(JSON.parse(e.data)));
+        source.addEventListener('done', () => {
+            source.close();
+            resolve();
+        });
+        source.addEventListener('failed', (e) => {
+            source.close();
+            reject(new Error(JSON.parse(e.data).error || 'Indexing failed'));
+        });
+        source.onerror = () => {
+            source.close();
+            reject(new Error('Lost connection while indexing'));
+        };
+    });
+}
+
+/**
+ * Reveal the question UI once the PDF index is ready
+ */
+function onIndexReady(readyUploadId) {
+    uploadId = readyUploadId;
+    uploadStatus.textContent = `✅ File uploaded successfully! You can now ask questions.`;
+    uploadStatus.className = 'status-message success';
+    
+    // Initialize voice features with upload ID
+    if (window.initVoice) {
+        initVoice(uploadId);
+    }
+    
+    // Load chat history for this upload
+    if (window.loadHistory) {
+        loadHistory(uploadId);
+    }
+    
+    // Show query section with smooth reveal
+    querySection.classList.remove('hidden');
+    querySection.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
+    
+    // Focus on question input
+    setTimeout(() => {
+        document.getElementById('question').focus();
+    }, 500);
+}
+
 // Handle query submission
 queryForm.addEventListener('submit', async (e) => {
     e.preventDefault();
@@ -120,7 +169,9 @@ queryForm.addEventListener('submit', async (e) => {
     answerSection.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
     
     try {
-        const response = await fetch('/query', {
+        // Stream tokens as the model produces them; the final event carries the
+        // rendered answer and sources
+        const response = await fetch('/query/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -131,93 +182,33 @@ queryForm.addEventListener('submit', async (e) => {
             })
         });
         
-        const data = await response.json();
+        if (!response.ok) {
+            const data = await response.json();
+            answerSummary.innerHTML = `
+                <p style="color: #dc3545;">❌ <strong>Error:</strong> ${escapeHtml(data.detail || 'Unknown error occurred')}</p>
+            `;
+            return;
+        }
         
-        if (response.ok) {
-            // Handle different response formats
-            let answerHtml = '';
-            let answerText = '';
-            
-            if (data.answer) {
-                // Check if answer is an object with html/text/summary/paragraphs
-                if (typeof data.answer === 'object' && data.answer !== null) {
-                    // Prefer HTML rendering if available (from markdown conversion)
-                    answerHtml = data.answer.html || '';
-                    answerText = data.answer.text || data.answer.summary || JSON.stringify(data.answer);
-                } else {
-                    answerText = data.answer;
-                }
-            } else {
-                answerText = 'No answer received.';
-            }
-            
-            // Display answer with rich HTML formatting or fallback to text
-            if (answerHtml) {
+        let streamedText = '';
+        await readEventStream(response, (event, data) => {
+            if (event === 'token') {
+                streamedText += data.text;
                 answerSummary.innerHTML = `
                     <div class="question-header">
                         <strong>Question:</strong> ${escapeHtml(question)}
                     </div>
                     <hr>
-                    <div class="markdown-content">${answerHtml}</div>
+                    <p style="white-space: pre-wrap;">${escapeHtml(streamedText)}</p>
                 `;
-                
-                // Apply syntax highlighting to code blocks
-                answerSummary.querySelectorAll('pre code').forEach((block) => {
-                    hljs.highlightElement(block);
-                });
-            } else {
+            } else if (event === 'final') {
+                renderAnswer(question, data);
+            } else if (event === 'error') {
                 answerSummary.innerHTML = `
-                    <p><strong>Question:</strong> ${escapeHtml(question)}</p>
-                    <hr>
-                    <p>${escapeHtml(answerText)}</p>
-                `;
-            }
-            
-            // Optional: Show source info if available
-            if (data.sources && data.sources.length > 0) {
-                const sourcesText = data.sources.map((s, i) => 
-                    `Source ${i + 1}: ${s.page_content ? s.page_content.substring(0, 150) + '...' : 'N/A'}`
-                ).join('\n');
-                
-                answerSummary.innerHTML += `
-                    <hr>
-                    <p style="font-size: 0.9rem; color: #666;"><strong>Sources:</strong></p>
-                    <p style="font-size: 0.85rem; color: #888; white-space: pre-wrap;">${escapeHtml(sourcesText)}</p>
+                    <p style="color: #dc3545;">❌ <strong>Error:</strong> ${escapeHtml(data.detail || 'Unknown error occurred')}</p>
                 `;
             }
-            
-            // Auto-play TTS using Web Speech API (browser-based)
-            if (window.speechSynthesis && answerText) {
-                const muteBtn = document.getElementById('mute-btn');
-                const isMuted = muteBtn && muteBtn.classList.contains('muted');
-                
-                if (!isMuted) {
-                    // Cancel any ongoing speech
-                    window.speechSynthesis.cancel();
-                    
-                    // Create speech utterance
-                    const utterance = new SpeechSynthesisUtterance(answerText);
-                    
-                    // Get voice settings if available
-                    const voiceSpeedInput = document.getElementById('voice-speed');
-                    const voiceVolumeInput = document.getElementById('voice-volume');
-                    
-                    if (voiceSpeedInput) {
-                        utterance.rate = parseInt(voiceSpeedInput.value) / 100; // Convert WPM to rate (0.1 to 10)
-                    }
-                    if (voiceVolumeInput) {
-                        utterance.volume = parseFloat(voiceVolumeInput.value);
-                    }
-                    
-                    // Speak the text
-                    window.speechSynthesis.speak(utterance);
-                }
-            }
-        } else {
-            answerSummary.innerHTML = `
-                <p style="color: #dc3545;">❌ <strong>Error:</strong> ${escapeHtml(data.detail || 'Unknown error occurred')}</p>
-            `;
-        }
+        });
     } catch (error) {
         answerSummary.innerHTML = `
             <p style="color: #dc3545;">❌ <strong>Error:</strong> ${escapeHtml(error.message)}</p>
@@ -230,6 +221,120 @@ queryForm.addEventListener('submit', async (e) => {
     }
 });
 
+/**
+ * Read a Server-Sent Events response body and call onEvent(event, data) per event
+ */
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let data = '';
+            block.split('\n').forEach((line) => {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            });
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
+/**
+ * Render a complete answer payload ({answer, sources}) and read it aloud
+ */
+function renderAnswer(question, data) {
+    // Handle different response formats
+    let answerHtml = '';
+    let answerText = '';
+    
+    if (data.answer) {
+        // Check if answer is an object with html/text/summary/paragraphs
+        if (typeof data.answer === 'object' && data.answer !== null) {
+            // Prefer HTML rendering if available (from markdown conversion)
+            answerHtml = data.answer.html || '';
+            answerText = data.answer.text || data.answer.summary || JSON.stringify(data.answer);
+        } else {
+            answerText = data.answer;
+        }
+    } else {
+        answerText = 'No answer received.';
+    }
+    
+    // Display answer with rich HTML formatting or fallback to text
+    if (answerHtml) {
+        answerSummary.innerHTML = `
+            <div class="question-header">
+                <strong>Question:</strong> ${escapeHtml(question)}
+            </div>
+            <hr>
+            <div class="markdown-content">${answerHtml}</div>
+        `;
+        
+        // Apply syntax highlighting to code blocks
+        answerSummary.querySelectorAll('pre code').forEach((block) => {
+            hljs.highlightElement(block);
+        });
+    } else {
+        answerSummary.innerHTML = `
+            <p><strong>Question:</strong> ${escapeHtml(question)}</p>
+            <hr>
+            <p>${escapeHtml(answerText)}</p>
+        `;
+    }
+    
+    // Optional: Show source info if available
+    if (data.sources && data.sources.length > 0) {
+        const sourcesText = data.sources.map((s, i) => 
+            `Source ${i + 1}: ${s.page_content ? s.page_content.substring(0, 150) + '...' : 'N/A'}`
+        ).join('\n');
+        
+        answerSummary.innerHTML += `
+            <hr>
+            <p style="font-size: 0.9rem; color: #666;"><strong>Sources:</strong></p>
+            <p style="font-size: 0.85rem; color: #888; white-space: pre-wrap;">${escapeHtml(sourcesText)}</p>
+        `;
+    }
+    
+    // Auto-play TTS using Web Speech API (browser-based)
+    if (window.speechSynthesis && answerText) {
+        const muteBtn = document.getElementById('mute-btn');
+        const isMuted = muteBtn && muteBtn.classList.contains('muted');
+        
+        if (!isMuted) {
+            // Cancel any ongoing speech
+            window.speechSynthesis.cancel();
+            
+            // Create speech utterance
+            const utterance = new SpeechSynthesisUtterance(answerText);
+            
+            // Get voice settings if available
+            const voiceSpeedInput = document.getElementById('voice-speed');
+            const voiceVolumeInput = document.getElementById('voice-volume');
+            
+            if (voiceSpeedInput) {
+                utterance.rate = parseInt(voiceSpeedInput.value) / 100; // Convert WPM to rate (0.1 to 10)
+            }
+            if (voiceVolumeInput) {
+                utterance.volume = parseFloat(voiceVolumeInput.value);
+            }
+            
+            // Speak the text
+            window.speechSynthesis.speak(utterance);
+        }
+    }
+}
+
 // Helper function to escape HTML and prevent XSS
 function escapeHtml(text) {
     const div = document.createElement('div');
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DIM = 16
+
+
+def make_vector(texts, document_id="doc-1", seed=0, description=None):
+    """A LangChain FAISS store over random embeddings (no model is loaded)"""
+    from langchain_community.vectorstores import FAISS
+
+    from ann import build_faiss_index, index_vectors
+    from embeddings import get_embedder
+
+    rng = np.random.default_rng(seed)
+    embeddings = rng.random((len(texts), DIM), dtype=np.float32)
+    vector = FAISS.from_embeddings(
+        list(zip(texts, embeddings.tolist())),
+        get_embedder(),
+        metadatas=[{"document_id": document_id, "page": i % 3} for i in range(len(texts))],
+    )
+    if description:
+        vector.index = build_faiss_index(index_vectors(vector.index), description)
+    return vector
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    import index_store
+    monkeypatch.setattr(index_store, "INDEX_DIR", tmp_path / "indexes")
+    return tmp_path / "indexes"
@@ -0,0 +1,103 @@
+import threading
+
+import numpy as np
+import pytest
+
+from ann import (MAX_EF_SEARCH, RECALL_PRESETS, ReadWriteLock, Tombstones, batch_search_ids,
+                 build_faiss_index, is_lossy, rebuild_without, resolve_search_options)
+from retrieval import resolve_retrieval_options
+
+from conftest import DIM, make_vector
+
+
+def test_presets_and_explicit_values():
+    assert resolve_search_options({"recall": "high"}) == RECALL_PRESETS["high"]
+    assert resolve_search_options({"recall": "fast", "nprobe": "8"}) == {**RECALL_PRESETS["fast"], "nprobe": 8}
+    assert resolve_search_options({}) == {}
+
+
+@pytest.mark.parametrize("options", [
+    {"recall": "maximum"},
+    {"ef_search": "lots"},
+    {"ef_search": [64]},
+    {"nprobe": True},
+    {"nprobe": 0},
+    {"nprobe": -4},
+    {"ef_search": MAX_EF_SEARCH + 1},
+])
+def test_invalid_values_are_rejected(options):
+    with pytest.raises(ValueError):
+        resolve_search_options(options)
+    with pytest.raises(ValueError):
+        resolve_retrieval_options(options)
+
+
+def test_batch_search_skips_tombstones():
+    vector = make_vector([f"chunk {i}" for i in range(20)])
+    queries = np.random.default_rng(5).random((3, DIM), dtype=np.float32).tolist()
+    dead = Tombstones(range(0, 20, 2))
+
+    results = batch_search_ids(vector, queries, 5, tombstones=dead)
+    assert len(results) == 3
+    dead_ids = {vector.index_to_docstore_id[p] for p in dead.positions}
+    for hits in results:
+        assert len(hits) == 5
+        assert not dead_ids & {doc_id for doc_id, _ in hits}
+
+
+def test_rebuild_without_drops_dead_positions():
+    vector = make_vector([f"chunk {i}" for i in range(10)])
+    vectors = vector.index.reconstruct_n(0, 10)
+    index, new_map, dropped = rebuild_without(vectors, dict(vector.index_to_docstore_id), {1, 4})
+
+    assert index.ntotal == 8
+    assert dropped == [vector.index_to_docstore_id[1], vector.index_to_docstore_id[4]]
+    assert new_map[1] == vector.index_to_docstore_id[2]
+    np.testing.assert_allclose(index.reconstruct(1), vectors[2])
+
+
+def test_read_write_lock_shares_reads_and_excludes_writes():
+    lock = ReadWriteLock()
+    inside = threading.Barrier(2, timeout=5)
+    order = []
+
+    def reader():
+        with lock.read():
+            inside.wait()  # both readers are inside at the same time
+            order.append("read")
+
+    readers = [threading.Thread(target=reader) for _ in range(2)]
+    for thread in readers:
+        thread.start()
+    for thread in readers:
+        thread.join()
+    assert order == ["read", "read"]
+
+    def reader_after_write():
+        with lock.read():
+            order.append("late read")
+
+    with lock:
+        assert lock.is_write_locked()
+        with lock, lock.read():  # re-entrant for the writer
+            pass
+        blocked = threading.Thread(target=reader_after_write)
+        blocked.start()
+        blocked.join(0.2)
+        assert blocked.is_alive()
+        order.append("write")
+    blocked.join(5)
+    assert order[-2:] == ["write", "late read"]
+
+
+@pytest.mark.parametrize("description, lossy", [
+    ("Flat", False),
+    ("HNSW8", False),
+    ("IVF4,Flat", False),
+    ("HNSW8,SQ8", True),
+    ("IVF4,SQ8", True),
+    ("IVF4,PQ4x4", True),
+])
+def test_is_lossy(description, lossy):
+    vectors = np.random.default_rng(0).random((300, DIM), dtype=np.float32)
+    assert is_lossy(build_faiss_index(vectors, description)) is lossy
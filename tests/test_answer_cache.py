@@ -0,0 +1,72 @@
+from answer_cache import AnswerCache
+from index_store import IndexStore
+from retrieval import resolve_retrieval_options, settings_key
+
+from conftest import make_vector
+
+ANSWER = {"text": "42", "summary": "42"}
+
+
+def test_exact_and_semantic_hits():
+    cache = AnswerCache()
+    cache.put("up1", "What is the answer?", ANSWER, [], embedding=[1.0, 0.0])
+
+    assert cache.get("up1", "what is the ANSWER")["match"] == "exact"
+    assert cache.get("up1", "Something else", embedding=[0.99, 0.01])["match"] == "semantic"
+    assert cache.get("up1", "Something else", embedding=[0.0, 1.0]) is None
+    assert cache.get("up2", "What is the answer?") is None
+
+
+def test_settings_are_part_of_the_key():
+    cache = AnswerCache()
+    plain = settings_key(resolve_retrieval_options({}))
+    reranked = settings_key(resolve_retrieval_options({"rerank": True, "candidates": 50}))
+    cache.put("up1", "question", ANSWER, [], embedding=[1.0, 0.0], settings=plain)
+
+    assert cache.get("up1", "question", settings=reranked) is None
+    assert cache.get("up1", "question", embedding=[1.0, 0.0], settings=reranked) is None
+    # An explicit "rerank": false retrieves exactly like the default
+    assert settings_key(resolve_retrieval_options({"rerank": False})) == plain
+    assert cache.get("up1", "question", settings=settings_key(resolve_retrieval_options({"rerank": False})))
+
+
+def test_put_after_invalidation_is_dropped():
+    cache = AnswerCache()
+    generation = cache.generation("up1")
+    cache.invalidate("up1")
+
+    assert not cache.put("up1", "question", ANSWER, [], generation=generation)
+    assert cache.get("up1", "question") is None
+    assert cache.put("up1", "question", ANSWER, [], generation=cache.generation("up1"))
+
+
+def test_index_changes_invalidate_under_the_entry_lock(index_dir):
+    store = IndexStore()
+    cache = AnswerCache()
+    seen = []
+
+    def invalidate(upload_id):
+        # Runs while the mutation still holds the entry lock
+        seen.append(store._entries["up1"]["lock"].is_write_locked())
+        cache.invalidate(upload_id)
+
+    store.add_listener(invalidate, locked=True)
+    store.put("up1", make_vector(["alpha", "beta"], document_id="a"))
+    cache.put("up1", "question", ANSWER, [])
+
+    store.add_documents("up1", make_vector(["gamma"], document_id="b", seed=3))
+    assert cache.get("up1", "question") is None
+    assert seen[-1]
+
+    cache.put("up1", "question", ANSWER, [])
+    assert store.remove_document("up1", "b") == 1
+    assert cache.get("up1", "question") is None
+    assert seen[-1]
+
+
+def test_lru_bound():
+    cache = AnswerCache(max_entries=2)
+    for question in ("one", "two", "three"):
+        cache.put("up1", question, ANSWER, [])
+    assert cache.get("up1", "one") is None
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import bulk
+from bulk import BulkCheckpoint, checkpoint_path, file_sha256, run_bulk
+from index_store import IndexStore
+from ingestion import count_pages, extract_chunks
+
+from conftest import DIM
+
+
+class Interrupted(BaseException):
+    """Stands in for a crash or Ctrl-C in the middle of a run"""
+
+
+class FakeEmbedder(DeterministicFakeEmbedding):
+    def embed_documents(self, texts, batch_size=None):
+        return super().embed_documents(texts)
+
+
+class InlinePool:
+    """IngestionPool stand-in: PDFs are described by `pages` instead of parsed"""
+
+    parse_workers = 1
+
+    def __init__(self, pages, broken=()):
+        self.pages = pages  # file path -> page count
+        self.broken = set(broken)  # files whose page count cannot be read
+        self.extracted = []
+
+    async def run_in_thread(self, fn, *args):
+        return await asyncio.to_thread(fn, *args)
+
+    async def run_in_process(self, fn, *args):
+        if fn is count_pages:
+            if args[0] in self.broken:
+                raise ValueError("damaged file")
+            return self.pages[args[0]], "fake"
+        assert fn is extract_chunks
+        file_path, start, stop, _, metadata = args
+        self.extracted.append(file_path)
+        return [Document(page_content=f"{file_path} page {page}", metadata={**metadata, "page": page})
+                for page in range(start, stop)]
+
+
+@pytest.fixture
+def bulk_dir(tmp_path, index_dir, monkeypatch):
+    monkeypatch.setattr(bulk, "BULK_DIR", tmp_path / "bulk")
+    monkeypatch.setattr(bulk, "get_embedder", lambda: FakeEmbedder(size=DIM))
+    return tmp_path / "bulk"
+
+
+def _checkpoint(tmp_path, names):
+    checkpoint = BulkCheckpoint(checkpoint_path("batch1"))
+    for name in names:
+        path = tmp_path / name
+        path.write_bytes(name.encode())
+        checkpoint.add(str(path), name, file_sha256(str(path)))
+    checkpoint.save()
+    return checkpoint
+
+
+def test_interrupted_run_resumes_skipping_done_and_retrying_failed(tmp_path, bulk_dir):
+    checkpoint = _checkpoint(tmp_path, ["a.pdf", "b.pdf", "c.pdf"])
+    paths = [item["file_path"] for item in checkpoint.items]
+    upload_ids = [item["upload_id"] for item in checkpoint.items]
+    store = IndexStore()
+
+    def crash_after_first(upload_id, error):
+        if error is None:
+            raise Interrupted()
+
+    first = InlinePool({path: 2 for path in paths}, broken=[paths[1]])
+    with pytest.raises(Interrupted):
+        asyncio.run(run_bulk(first, store, checkpoint, on_finish=crash_after_first, embed_batch=1))
+
+    saved = BulkCheckpoint.load(checkpoint_path("batch1"))
+    assert [item["upload_id"] for item in saved.items] == upload_ids
+    assert len(saved.done) == 1
+    assert upload_ids[1] in saved.failed
+    done_path = next(item["file_path"] for item in saved.items if item["upload_id"] in saved.done)
+
+    second = InlinePool({path: 2 for path in paths})
+    result = asyncio.run(run_bulk(second, store, saved, embed_batch=1))
+
+    assert done_path not in second.extracted
+    assert paths[1] in second.extracted
+    assert result["documents"] == 2
+    summary = BulkCheckpoint.load(checkpoint_path("batch1")).summary()
+    assert summary["done"] == 3 and summary["failed"] == 0 and summary["pending"] == 0
+    assert all(store.get(upload_id) is not None for upload_id in upload_ids)
+
+
+def test_identical_files_share_one_index(tmp_path, bulk_dir):
+    checkpoint = _checkpoint(tmp_path, ["a.pdf"])
+    copy = tmp_path / "copy.pdf"
+    copy.write_bytes(b"a.pdf")
+    duplicate = checkpoint.add(str(copy), "copy.pdf", file_sha256(str(copy)))
+    store = IndexStore()
+
+    pool = InlinePool({item["file_path"]: 1 for item in checkpoint.items})
+    asyncio.run(run_bulk(pool, store, checkpoint))
+
+    assert pool.extracted == [checkpoint.items[0]["file_path"]]
+    assert checkpoint.done[duplicate["upload_id"]] == {"deduplicated": checkpoint.items[0]["upload_id"]}
+    assert store.resolve(duplicate["upload_id"]) == checkpoint.items[0]["upload_id"]
@@ -0,0 +1,65 @@
+import pytest
+from langchain_core.documents import Document
+
+import context
+from context import assemble_context, count_tokens, overlap_length
+
+
+def _doc(text, page=1, start=None, source="manual.pdf"):
+    metadata = {"source": source, "page": page}
+    if start is not None:
+        metadata["start_index"] = start
+    return Document(page_content=text, metadata=metadata)
+
+
+def _words(prefix, count):
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+@pytest.fixture
+def estimated_tokens(monkeypatch):
+    """Count with the len/4 fallback used when tiktoken is unavailable"""
+    monkeypatch.setattr(context, "_encoding", None)
+
+
+def test_fallback_token_count_is_a_quarter_of_the_characters(estimated_tokens):
+    assert count_tokens("") == 0
+    assert count_tokens("abcd") == 1
+    assert count_tokens("abcde") == 2
+    text = "The quick brown fox jumps over the lazy dog. " * 20
+    assert len(text) / 5 < count_tokens(text) <= len(text) / 4 + 1
+
+
+@pytest.mark.parametrize("budget", [10, 50, 120, 400])
+def test_budget_is_never_exceeded(budget):
+    docs = [_doc(_words(f"p{page}w", 60), page=page) for page in range(8)]
+    packed, stats = assemble_context(docs, budget=budget)
+
+    assert packed
+    assert stats["context_tokens"] <= budget
+    assert sum(count_tokens(doc.page_content) for doc in packed) <= budget
+    assert stats["context_blocks"] + stats["blocks_dropped"] == 8
+
+
+def test_same_page_chunks_come_back_in_reading_order(estimated_tokens):
+    page = _words("w", 200)
+    first, second, third = page[:300], page[250:550], page[500:]
+    # Retrieved most relevant first, i.e. out of reading order
+    docs = [_doc(third, start=500), _doc(first, start=0), _doc(second, start=250)]
+    packed, stats = assemble_context(docs, budget=10_000)
+
+    assert [doc.page_content for doc in packed] == [page]
+    assert stats["overlap_chars_removed"] == 100
+
+
+def test_pages_keep_relevance_order_and_duplicates_are_dropped(estimated_tokens):
+    docs = [_doc(_words("b", 30), page=2), _doc(_words("a", 30), page=1), _doc(_words("b", 30), page=2)]
+    packed, stats = assemble_context(docs, budget=10_000)
+
+    assert [doc.metadata["page"] for doc in packed] == [2, 1]
+    assert stats["duplicates_removed"] == 1
+
+
+def test_overlap_needs_a_minimum_length():
+    assert overlap_length("x" * 10 + "shared tail of twenty+", "shared tail of twenty+ next") == 22
+    assert overlap_length("ends with abc", "abc starts") == 0
@@ -0,0 +1,80 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import corpus
+from corpus import CorpusIndex
+
+from conftest import DIM, make_vector
+
+
+@pytest.fixture
+def corpus_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(corpus, "CORPUS_DIR", tmp_path / "corpus")
+    return tmp_path / "corpus"
+
+
+def _search(index, upload_ids=None, k=50):
+    embedding = np.random.default_rng(9).random(DIM, dtype=np.float32).tolist()
+    return asyncio.run(index.asearch("question", k=k, upload_ids=upload_ids, embedding=embedding))
+
+
+def _owners(hits):
+    return {doc.metadata["upload_id"] for doc, _ in hits}
+
+
+def test_uploads_fill_shards_and_filter_by_upload(corpus_dir):
+    index = CorpusIndex(shard_size=15)
+    index.add("up1", make_vector([f"one {i}" for i in range(10)], seed=1))
+    index.add("up2", make_vector([f"two {i}" for i in range(10)], seed=2))
+
+    assert index.stats()["shards"] == 2
+    assert _owners(_search(index)) == {"up1", "up2"}
+    assert _owners(_search(index, ["up2"])) == {"up2"}
+    assert len(_search(index, k=3)) == 3
+
+
+def test_tombstoned_positions_are_skipped_and_refresh_replaces(corpus_dir):
+    index = CorpusIndex()
+    texts = [f"chunk {i}" for i in range(6)]
+    index.add("up1", make_vector(texts), skip=[0, 1])
+    assert {doc.page_content for doc, _ in _search(index)} == set(texts[2:])
+
+    index.refresh("up1", make_vector(["replacement"]))
+    assert [doc.page_content for doc, _ in _search(index)] == ["replacement"]
+
+    index.refresh("up1", None)
+    assert _search(index) == []
+    assert index.stats()["uploads"] == 0
+
+
+def test_flush_and_reload(corpus_dir):
+    index = CorpusIndex(shard_size=15)
+    index.add("up1", make_vector([f"one {i}" for i in range(10)], seed=1))
+    index.add("up2", make_vector([f"two {i}" for i in range(10)], seed=2))
+    assert index.flush() == 2
+    assert index.stats()["dirty_shards"] == 0
+
+    reloaded = CorpusIndex(shard_size=15)
+    assert reloaded.stats()["vectors"] == 20
+    assert _owners(_search(reloaded, ["up1"])) == {"up1"}
+    reloaded.remove("up1")
+    assert _owners(_search(reloaded)) == {"up2"}
+
+
+def test_small_upload_in_a_shard_dominated_by_a_large_one(corpus_dir):
+    index = CorpusIndex()
+    index.add("big", make_vector([f"big {i}" for i in range(3000)], seed=1))
+    index.add("small", make_vector([f"small {i}" for i in range(10)], seed=2))
+    assert index.stats()["shards"] == 1
+
+    hits = _search(index, ["small"], k=5)
+    assert len(hits) == 5
+    assert _owners(hits) == {"small"}
+    assert len(_search(index, ["small"], k=50)) == 10
+
+    # Positions are renumbered after a delete; the filter must follow
+    index.remove("big")
+    index.add("other", make_vector([f"other {i}" for i in range(20)], seed=3))
+    assert _owners(_search(index, ["small"])) == {"small"}
@@ -0,0 +1,59 @@
+import io
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from exports import ExportCache, ExportTooLarge, render_conversation, render_entry, stream_conversation
+
+
+def _rows(count, answer="An answer. " * 40):
+    return (
+        SimpleNamespace(question=f"Question {i} (with parens)", answer=answer, created_at=datetime(2024, 1, 1))
+        for i in range(count)
+    )
+
+
+def test_txt_conversation_streams_one_chunk_per_entry():
+    chunks = list(stream_conversation(_rows(3), "up1", "txt"))
+
+    assert len(chunks) == 4  # title + first entry, two more entries, empty tail
+    text = b"".join(chunks).decode("utf-8")
+    assert text.startswith("Conversation up1\n")
+    assert text.index("1. 2024") < text.index("2. 2024") < text.index("3. 2024")
+    assert render_entry("q", "a", "txt") == b"Question: q\n\nAnswer:\na"
+
+
+def test_pdf_conversation_streams_page_by_page():
+    pytest.importorskip("reportlab")
+    pdfplumber = pytest.importorskip("pdfplumber")
+    chunks = list(stream_conversation(_rows(30), "up1", "pdf"))
+    data = b"".join(chunks)
+
+    assert len(chunks) > 5
+    assert max(len(chunk) for chunk in chunks) < len(data) / 3
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        assert len(pdf.pages) > 5
+        first = pdf.pages[0].extract_text()
+        assert "Conversation up1" in first and "Question 0 (with parens)" in first
+        assert "Question 29" in "".join(page.extract_text() for page in pdf.pages[-2:])
+
+
+def test_docx_conversation_is_capped():
+    pytest.importorskip("docx")
+    data, entries = render_conversation(_rows(3), "up1", "docx", max_entries=3)
+    assert entries == 3 and data[:2] == b"PK"
+    with pytest.raises(ExportTooLarge):
+        render_conversation(_rows(4), "up1", "docx", max_entries=3)
+
+
+def test_cache_skips_large_items_and_evicts_lru():
+    cache = ExportCache(max_bytes=10, max_item_bytes=4)
+    cache.put(("big",), b"12345")
+    assert cache.get(("big",)) is None
+
+    for key in ("a", "b", "c"):
+        cache.put((key,), b"1234")
+    assert cache.get(("a",)) is None
+    assert cache.get(("c",)) == b"1234"
+    assert cache.stats()["bytes"] == 8
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from history import HistoryWriter, decode_cursor, history_page
+from models import Base, ChatHistory
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def _insert(session_factory, upload_id, count, start=datetime(2024, 1, 1)):
+    db = session_factory()
+    for i in range(count):
+        db.add(ChatHistory(upload_id=upload_id, question=f"q{i}", answer=f"a{i}",
+                           created_at=start + timedelta(seconds=i // 2)))
+    db.commit()
+    db.close()
+
+
+def test_keyset_pages_cover_every_row_once(session_factory):
+    _insert(session_factory, "up1", 25)
+    _insert(session_factory, "up2", 3)
+    db = session_factory()
+    seen, cursor, pages = [], None, 0
+    while True:
+        rows, cursor = history_page(db, "up1", limit=10, cursor=cursor)
+        seen.extend(rows)
+        pages += 1
+        if cursor is None:
+            break
+    db.close()
+
+    assert pages == 3
+    assert len({row["id"] for row in seen}) == 25
+    assert all(row["upload_id"] == "up1" for row in seen)
+    keys = [(row["created_at"], row["id"]) for row in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_summary_view_leaves_out_answers(session_factory):
+    _insert(session_factory, "up1", 3)
+    db = session_factory()
+    rows, cursor = history_page(db, "up1", limit=5, view="summary")
+    db.close()
+    assert cursor is None
+    assert len(rows) == 3
+    assert "answer" not in rows[0] and rows[0]["question"]
+
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_writer_flushes_only_for_queued_rows(session_factory):
+    # A long flush interval keeps rows queued until something asks for them
+    writer = HistoryWriter(session_factory, batch_size=100, flush_ms=60_000)
+    try:
+        history_id = writer.submit("up1", "question", "answer")
+        assert writer.pending("up1") and writer.pending(history_id=history_id)
+        assert not writer.pending("up2")
+
+        assert writer.flush_pending("up2")
+        assert writer.stats()["queued"] == 1
+
+        assert writer.flush_pending(history_id=history_id)
+        assert not writer.pending()
+        db = session_factory()
+        rows, _ = history_page(db, "up1")
+        db.close()
+        assert [row["id"] for row in rows] == [history_id]
+    finally:
+        writer.stop()
+
+
+def test_stop_writes_queued_rows(session_factory):
+    writer = HistoryWriter(session_factory, batch_size=100, flush_ms=60_000)
+    for i in range(5):
+        writer.submit("up1", f"q{i}", f"a{i}")
+    writer.stop()
+
+    assert writer.stats()["rows_written"] == 5
+    db = session_factory()
+    assert db.query(ChatHistory).count() == 5
+    db.close()
@@ -0,0 +1,224 @@
+import threading
+import time
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import index_store
+from ann import build_faiss_index, index_vectors
+from index_store import IndexStore, is_mapped
+
+from conftest import DIM, make_vector
+
+TEXTS = [f"chunk {i} about topic {i % 7}" for i in range(200)]
+
+
+def _query(seed=1):
+    return np.random.default_rng(seed).random(DIM, dtype=np.float32).tolist()
+
+
+def test_flat_index_is_memory_mapped_after_reload(index_dir):
+    store = IndexStore()
+    store.put("up1", make_vector(TEXTS))
+    assert not is_mapped(store.get("up1")["vector"].index)
+
+    reloaded = IndexStore()
+    entry = reloaded.get("up1")
+    assert entry["vector"].index.ntotal == len(TEXTS)
+    assert entry["mapped"]
+    assert is_mapped(entry["vector"].index)
+    assert len(entry["retriever"].search("topic 3", _query(), k=5)) == 5
+
+
+def test_mapped_flat_index_is_copied_before_writes(index_dir):
+    IndexStore().put("up1", make_vector(TEXTS, document_id="a"))
+    store = IndexStore()
+    assert store.get("up1")["mapped"]
+
+    store.add_documents("up1", make_vector(TEXTS[:5], document_id="b", seed=2))
+    entry = store.get("up1")
+    assert not entry["mapped"]
+    assert entry["vector"].index.ntotal == len(TEXTS) + 5
+    assert IndexStore().get("up1")["vector"].index.ntotal == len(TEXTS) + 5
+
+
+
+def test_ivf_index_is_memory_mapped_after_reload(index_dir):
+    store = IndexStore()
+    store.put("up1", make_vector(TEXTS, description="IVF4,Flat"))
+
+    reloaded = IndexStore()
+    entry = reloaded.get("up1")
+    assert entry["mapped"]
+    assert is_mapped(entry["vector"].index)
+    assert len(entry["retriever"].search("topic 3", _query(), k=5)) == 5
+
+
+def test_concurrent_cold_gets_load_once(index_dir):
+    IndexStore().put("up1", make_vector(TEXTS))
+    store = IndexStore()
+    barrier = threading.Barrier(4)
+    entries = []
+
+    def worker():
+        barrier.wait()
+        entries.append(store.get("up1"))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert store.misses == 1
+    assert all(entry is entries[0] for entry in entries)
+
+
+def test_get_from_two_threads_during_a_slow_load(index_dir, monkeypatch):
+    IndexStore().put("up1", make_vector(TEXTS))
+    store = IndexStore()
+    load = store._load_entry
+    loads, results, threads = [], {}, []
+
+    def slow_load(upload_id):
+        loads.append(upload_id)
+        # The second caller arrives while the first is still reading
+        second = threading.Thread(target=lambda: results.setdefault("second", store.get("up1")))
+        threads.append(second)
+        second.start()
+        time.sleep(0.05)
+        return load(upload_id)
+
+    monkeypatch.setattr(store, "_load_entry", slow_load)
+    results["first"] = store.get("up1")
+    threads[0].join()
+
+    assert loads == ["up1"]
+    assert results["second"] is results["first"]
+    assert store.get("up1") is results["first"]
+
+
+def test_put_during_load_wins(index_dir, monkeypatch):
+    IndexStore().put("up1", make_vector(TEXTS, seed=1))
+    store = IndexStore()
+    load = store._load_entry
+    fresh = {}
+
+    def load_then_put(upload_id):
+        entry = load(upload_id)
+        fresh["entry"] = store.put("up1", make_vector(TEXTS[:10], seed=2))
+        return entry
+
+    monkeypatch.setattr(store, "_load_entry", load_then_put)
+    assert store.get("up1") is fresh["entry"]
+    assert store.get("up1")["vector"].index.ntotal == 10
+
+
+def test_unknown_upload_is_none(index_dir):
+    store = IndexStore()
+    assert store.get("missing") is None
+    assert store.get("../etc") is None
+    assert "missing" not in store
+
+
+def test_lru_eviction_keeps_budget_and_reloads_from_disk(index_dir):
+    store = IndexStore(max_bytes=1)
+    store.put("up1", make_vector(TEXTS, seed=1))
+    store.put("up2", make_vector(TEXTS, seed=2))
+
+    assert len(store) == 1
+    assert store.evictions == 1
+    entry = store.get("up1")
+    assert entry["vector"].index.ntotal == len(TEXTS)
+    assert store.misses == 1
+    assert len(store) == 1
+
+
+def test_lfu_evicts_least_used(index_dir):
+    vector = make_vector(TEXTS)
+    budget = index_store.entry_bytes(index_store.make_entry(vector)) * 2 + 10
+    store = IndexStore(max_bytes=budget, policy="lfu")
+    store.put("up1", make_vector(TEXTS, seed=1))
+    store.put("up2", make_vector(TEXTS, seed=2))
+    for _ in range(3):
+        store.get("up1")
+    store.put("up3", make_vector(TEXTS, seed=3))
+
+    resident = store.stats()["indexes"]
+    assert "up1" in resident and "up3" in resident
+    assert "up2" not in resident
+
+
+def test_ivf_reload_delete_append_reload_search(index_dir):
+    store = IndexStore()
+    store.put("up1", make_vector(TEXTS, document_id="a", description="IVF4,Flat"))
+    store.add_documents("up1", make_vector(TEXTS[:20], document_id="b", seed=2))
+
+    # After a restart the index comes back memory-mapped
+    store = IndexStore()
+    assert store.get("up1")["mapped"]
+    assert store.remove_document("up1", "b") == 20
+    store.add_documents("up1", make_vector(TEXTS[:10], document_id="c", seed=3))
+
+    store = IndexStore()
+    entry = store.get("up1")
+    assert entry["vector"].index.ntotal == len(TEXTS) + 30
+    assert len(entry["tombstones"]) == 20
+    docs = entry["retriever"].search("topic 1", _query(), k=50, mode="vector")
+    assert len(docs) == 50
+    assert {doc.metadata["document_id"] for doc in docs} <= {"a", "c"}
+    assert sorted(d["document_id"] for d in store.documents("up1")) == ["a", "c"]
+
+
+def test_delete_writes_only_meta_and_survives_restart(index_dir):
+    store = IndexStore()
+    store.put("up1", make_vector(TEXTS, document_id="a"))
+    store.add_documents("up1", make_vector(["unique-token-b"] * 5, document_id="b", seed=2))
+    index_file = index_dir / "up1" / index_store.INDEX_FILE
+    written = index_file.stat().st_mtime_ns
+
+    assert store.remove_document("up1", "b") == 5
+    assert index_file.stat().st_mtime_ns == written
+    assert len(index_store.read_meta("up1")["deleted_positions"]) == 5
+
+    entry = IndexStore().get("up1")
+    assert len(entry["tombstones"]) == 5
+    assert entry["lexical"].search("unique-token-b") == []
+
+
+def test_compaction_after_reload(index_dir):
+    store = IndexStore()
+    store.put("up1", make_vector(TEXTS, document_id="a", description="IVF4,Flat"))
+    store.add_documents("up1", make_vector(TEXTS[:30], document_id="b", seed=2))
+
+    store = IndexStore()
+    store.remove_document("up1", "b")
+    assert index_store.needs_compaction(store.get("up1"))
+    result = store.compact("up1")
+    assert result["removed"] == 30
+    assert result["chunks"] == len(TEXTS)
+
+    entry = IndexStore().get("up1")
+    assert entry["vector"].index.ntotal == len(TEXTS)
+    assert len(entry["tombstones"]) == 0
+    assert len(entry["retriever"].search("topic 2", _query(), k=10)) == 10
+
+
+def test_quantized_compaction_re_embeds_instead_of_decoding(index_dir):
+    embedder = DeterministicFakeEmbedding(size=DIM)
+    exact = np.asarray(embedder.embed_documents(TEXTS), dtype=np.float32)
+    vector = FAISS.from_embeddings(
+        list(zip(TEXTS, exact.tolist())), embedder,
+        metadatas=[{"document_id": "a" if i < 170 else "b"} for i in range(len(TEXTS))],
+    )
+    vector.index = build_faiss_index(exact, "IVF4,SQ8")
+    store = IndexStore()
+    store.put("up1", vector)
+    assert store.remove_document("up1", "b") == 30
+    # SQ8 codes only decode to approximations of the embeddings
+    assert not np.array_equal(index_vectors(store.get("up1")["vector"].index), exact)
+
+    assert store.compact("up1")["chunks"] == 170
+    rebuilt = index_vectors(store.get("up1")["vector"].index)
+    np.testing.assert_allclose(rebuilt, exact[:170], rtol=1e-6)
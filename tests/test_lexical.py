@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from lexical import BM25Index, tokenize
+from retrieval import HybridRetriever, reciprocal_rank_fusion, resolve_retrieval_options
+
+from conftest import DIM, make_vector
+
+TEXTS = [f"general notes about section {i} of the manual" for i in range(30)]
+TEXTS[17] = "the controller reports ERR-404 when the sensor is unplugged"
+
+
+def _query(seed=5):
+    return np.random.default_rng(seed).random(DIM, dtype=np.float32).tolist()
+
+
+def test_identifiers_are_kept_whole_and_split():
+    assert tokenize("Clause 3.2.1 raised ERR-404") == ["clause", "3.2.1", "3", "2", "1", "raised", "err-404", "err", "404"]
+
+
+def test_exact_term_ranks_first():
+    index = BM25Index()
+    index.add([f"d{i}" for i in range(len(TEXTS))], TEXTS)
+
+    assert index.search("ERR-404")[0][0] == "d17"
+    assert index.search("what does 404 mean")[0][0] == "d17"
+    assert index.search("unknown-term") == []
+
+
+def test_delete_compact_and_reload(tmp_path):
+    index = BM25Index()
+    index.add([f"d{i}" for i in range(len(TEXTS))], TEXTS)
+    index.delete(["d17"])
+    assert index.search("ERR-404") == []
+    assert len(index) == len(TEXTS) - 1
+
+    index.save(tmp_path / "lexical.json.gz")
+    loaded = BM25Index.load(tmp_path / "lexical.json.gz")
+    assert len(loaded) == len(TEXTS) - 1
+    assert loaded.search("section 3")[0][0] == "d3"
+
+
+def test_reciprocal_rank_fusion_order():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a", "d"]], k=4, rrf_k=60)
+
+    assert [doc_id for doc_id, _ in fused] == ["a", "c", "b", "d"]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+    assert len(reciprocal_rank_fusion([["a", "b"], ["b"]], k=1)) == 1
+
+
+def test_hybrid_search_brings_in_the_lexical_match():
+    vector = make_vector(TEXTS)
+    retriever = HybridRetriever(vectorstore=vector, lexical=BM25Index.from_vector(vector), k=3)
+
+    hybrid = retriever.search("ERR-404", _query(), mode="hybrid")
+    assert "ERR-404" in " ".join(doc.page_content for doc in hybrid)
+
+    plain = retriever.search("ERR-404", _query(), mode="vector")
+    nearest = vector.similarity_search_by_vector(_query(), k=3)
+    assert [doc.page_content for doc in plain] == [doc.page_content for doc in nearest]
+
+
+@pytest.mark.parametrize("options", [
+    {"retrieval": "bm25"},
+    {"retrieval": ""},
+    {"k": 0},
+    {"k": "many"},
+    {"candidates": 10_000},
+])
+def test_invalid_retrieval_options_are_rejected(options):
+    with pytest.raises(ValueError):
+        resolve_retrieval_options(options)
+
+
+def test_retrieval_options_resolve():
+    assert resolve_retrieval_options(None) == {}
+    assert resolve_retrieval_options({"retrieval": "vector", "k": "5", "rerank": 1}) == {
+        "mode": "vector", "k": 5, "rerank": True,
+    }
@@ -0,0 +1,86 @@
+import re
+
+from metrics import (LATENCY_BUCKETS, Histogram, Metrics, finish_request_timing, server_timing_header,
+                     start_request_timing)
+
+
+def _samples(text):
+    """Sample lines of an exposition as {"name{labels}": value}"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            key, value = line.rsplit(" ", 1)
+            samples[key] = float(value)
+    return samples
+
+
+def test_buckets_are_cumulative_with_inclusive_upper_bounds():
+    histogram = Histogram("t_seconds", "Test", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, "x")
+    samples = _samples("\n".join(histogram.render()))
+
+    assert samples['t_seconds_bucket{stage="x",le="0.1"}'] == 2
+    assert samples['t_seconds_bucket{stage="x",le="1"}'] == 3
+    assert samples['t_seconds_bucket{stage="x",le="+Inf"}'] == 4
+    assert samples['t_seconds_count{stage="x"}'] == 4
+    assert samples['t_seconds_sum{stage="x"}'] == 2.65
+
+
+def test_render_is_valid_exposition_text():
+    metrics = Metrics(prefix="t")
+    metrics.observe_stage("query", "retrieval", 0.02)
+    metrics.observe_request("GET", "/metrics", 200, 0.003)
+    metrics.gauge("cached_indexes", "Indexes in memory", lambda: 3)
+    metrics.gauge("broken", "Raises at scrape time", lambda: 1 / 0)
+    text = metrics.render()
+
+    assert text.endswith("\n")
+    assert "# TYPE t_stage_seconds histogram" in text
+    assert "# TYPE t_cached_indexes gauge" in text
+    assert "t_broken" not in text
+    # Histograms without observations still get their HELP/TYPE lines
+    assert "# HELP t_db_write_seconds" in text
+
+    sample = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]\w*="(\\.|[^"\\])*",?)*\})? \S+$')
+    for line in text.splitlines():
+        assert line.startswith("# HELP ") or line.startswith("# TYPE ") or sample.match(line), line
+
+    samples = _samples(text)
+    assert samples["t_cached_indexes"] == 3
+    assert samples['t_request_seconds_count{method="GET",route="/metrics",status="200"}'] == 1
+    buckets = [key for key in samples if key.startswith('t_stage_seconds_bucket{endpoint="query"')]
+    assert len(buckets) == len(LATENCY_BUCKETS) + 1
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics(prefix="t")
+    metrics.observe_stage('say "hi"', "a\\b\nc", 0.01)
+    assert 'endpoint="say \\"hi\\"",stage="a\\\\b\\nc"' in metrics.render()
+
+
+def test_timings_dicts_are_recorded_as_stages():
+    metrics = Metrics(prefix="t")
+    metrics.record_stages("query", {"retrieval_ms": 250, "llm_ms": 1500.0, "cache": "hit", "k": 4})
+    samples = _samples(metrics.render())
+
+    assert samples['t_stage_seconds_sum{endpoint="query",stage="retrieval"}'] == 0.25
+    assert samples['t_stage_seconds_bucket{endpoint="query",stage="llm",le="1"}'] == 0
+    assert samples['t_stage_seconds_bucket{endpoint="query",stage="llm",le="2.5"}'] == 1
+    assert not any('stage="cache"' in key or 'stage="k"' in key for key in samples)
+
+
+def test_server_timing_lists_this_requests_stages():
+    metrics = Metrics(prefix="t")
+    metrics.observe_stage("query", "before", 0.5)  # outside any request
+
+    token = start_request_timing()
+    metrics.observe_stage("query", "retrieval", 0.0125)
+    with metrics.timer("query", "llm"):
+        pass
+    stages = finish_request_timing(token)
+
+    assert [stage for stage, _ in stages] == ["retrieval", "llm"]
+    header = server_timing_header(stages[:1], 0.1)
+    assert header == "retrieval;dur=12.5, total;dur=100.0"
+    assert finish_request_timing(start_request_timing()) == []
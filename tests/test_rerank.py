@@ -0,0 +1,49 @@
+from langchain_core.documents import Document
+
+from lexical import tokenize
+from rerank import Reranker, overlap_score
+
+
+def _docs(*texts):
+    return [Document(page_content=text) for text in texts]
+
+
+def test_overlap_scores_terms_and_phrases():
+    terms = tokenize("reset the main valve")
+    assert overlap_score(terms, "how to reset the main valve") == 2.0
+    assert overlap_score(terms, "valve main the reset") == 1.0
+    assert overlap_score(terms, "unrelated text") == 0.0
+    assert overlap_score([], "anything") == 0.0
+
+
+def test_rerank_keeps_the_best_k_and_breaks_ties_by_retrieval_order():
+    reranker = Reranker(model_name="")
+    docs = _docs("nothing relevant", "valve maintenance", "reset the main valve", "valve cleaning")
+    ranked = reranker.rerank("reset the main valve", docs, k=3)
+
+    assert [doc.page_content for doc, _ in ranked] == ["reset the main valve", "valve maintenance", "valve cleaning"]
+    assert ranked[0][1] > ranked[1][1] == ranked[2][1]
+
+
+def test_scores_are_batched_and_cached():
+    reranker = Reranker(model_name="", batch_size=2, cache_size=10)
+    texts = ["a valve", "b valve", "c valve", "d valve", "e valve"]
+    first = reranker.score("valve", texts)
+    assert reranker.stats()["batches"] == 3
+    assert reranker.score("valve", texts) == first
+
+    stats = reranker.stats()
+    assert stats["batches"] == 3
+    assert stats["cache_hits"] == 5 and stats["cache_misses"] == 5
+    assert stats["scorer"] == "lexical-overlap"
+
+
+def test_cache_is_bounded():
+    reranker = Reranker(model_name="", cache_size=3)
+    reranker.score("valve", [f"text {i}" for i in range(5)])
+    assert reranker.stats()["cache_size"] == 3
+
+    off = Reranker(model_name="", cache_size=0)
+    off.score("valve", ["text"])
+    off.score("valve", ["text"])
+    assert off.stats()["cache_hits"] == 0
@@ -0,0 +1,95 @@
+import asyncio
+import io
+import os
+import wave
+
+import pytest
+
+import speech
+from speech import (AudioDecodeError, SpeechNotUnderstood, SpeechRecognitionBackend, SpeechService,
+                    decode_audio, register_recognizer)
+
+
+def _wav_bytes(frames=1600):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(16000)
+        out.writeframes(b"\0\0" * frames)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    """Write a script standing in for FFmpeg and point FFMPEG_BINARY at it"""
+    if os.name == "nt":
+        pytest.skip("the FFmpeg stand-in is a shell script")
+
+    def install(body):
+        script = tmp_path / "ffmpeg"
+        script.write_text("#!/bin/sh\ncat > /dev/null\n" + body + "\n")
+        script.chmod(0o755)
+        monkeypatch.setattr(speech, "FFMPEG_BINARY", str(script))
+    return install
+
+
+def test_wav_is_used_as_is():
+    content = _wav_bytes()
+    assert decode_audio(content, "wav").getvalue() == content
+
+
+def test_other_formats_are_piped_through_ffmpeg(fake_ffmpeg):
+    # 0.5 s of 16 kHz 16-bit mono PCM on stdout
+    fake_ffmpeg("head -c 16000 /dev/zero")
+    with wave.open(decode_audio(b"webm bytes", "webm")) as audio:
+        assert audio.getnchannels() == 1
+        assert audio.getframerate() == speech.VOICE_SAMPLE_RATE
+        assert audio.getnframes() == 8000
+
+
+def test_ffmpeg_errors_become_decode_errors(fake_ffmpeg, monkeypatch):
+    fake_ffmpeg("echo 'Invalid data found when processing input' >&2; exit 1")
+    with pytest.raises(AudioDecodeError, match="Invalid data"):
+        decode_audio(b"not audio", "ogg")
+
+    monkeypatch.setattr(speech, "FFMPEG_BINARY", "/nonexistent/ffmpeg")
+    with pytest.raises(AudioDecodeError, match="Could not run FFmpeg"):
+        decode_audio(b"audio", "mp3")
+
+
+def test_stub_backend_transcribes_with_timings():
+    service = SpeechService(backend="stub", workers=1)
+    try:
+        text, timings = asyncio.run(service.transcribe(_wav_bytes(), "WAV"))
+    finally:
+        service.shutdown()
+
+    assert text == speech.VOICE_STUB_TEXT
+    assert timings["recognizer"] == "stub"
+    assert {"queue_ms", "decode_ms", "recognize_ms", "total_ms"} <= set(timings)
+
+
+def test_registered_backend_is_selectable(monkeypatch):
+    monkeypatch.setattr(speech, "RECOGNIZERS", dict(speech.RECOGNIZERS))
+
+    class SilentBackend:
+        name = "silent"
+
+        def recognize(self, wav, timings):
+            return ""
+
+    register_recognizer(SilentBackend)
+    service = SpeechService(backend="silent", workers=1)
+    try:
+        with pytest.raises(SpeechNotUnderstood):
+            asyncio.run(service.transcribe(_wav_bytes(), "wav"))
+    finally:
+        service.shutdown()
+
+
+def test_unknown_backend_and_abstract_base():
+    with pytest.raises(ValueError, match="Unknown VOICE_RECOGNIZER"):
+        SpeechService(backend="nope")
+    with pytest.raises(TypeError):
+        SpeechRecognitionBackend()
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import tts
+from tts import TTSService, cache_key, normalize_settings
+
+
+class FakeEngine:
+    """pyttsx3 stand-in that writes the text as the "audio" file"""
+
+    def __init__(self):
+        self.renders = 0
+        self._pending = None
+
+    def getProperty(self, name):
+        return []
+
+    def setProperty(self, name, value):
+        pass
+
+    def save_to_file(self, text, path):
+        self._pending = (text, path)
+
+    def runAndWait(self):
+        text, path = self._pending
+        time.sleep(0.05)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        self.renders += 1
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(tts, "_engine", engine)
+    return engine
+
+
+def _service(audio_dir, **kwargs):
+    service = TTSService(audio_dir, **kwargs)
+    # Threads instead of processes, so the workers share the fake engine
+    service._pool = ThreadPoolExecutor(max_workers=2)
+    return service
+
+
+def test_equal_settings_share_a_key():
+    assert normalize_settings(None, "180", "0.9") == ("default", 180, 0.9)
+    assert cache_key("hi", *normalize_settings("female", 180, 1)) == cache_key("hi", *normalize_settings("female", "180", "1.0"))
+    assert cache_key("hi", "default", 180, 1.0) != cache_key("hi", "female", 180, 1.0)
+    for rate, volume in ((0, 1.0), (501, 1.0), (180, 1.5), ("fast", 1.0)):
+        with pytest.raises(ValueError):
+            normalize_settings("default", rate, volume)
+
+
+def test_second_request_is_served_from_cache(tmp_path, engine):
+    service = _service(tmp_path)
+    name, cached = asyncio.run(service.synthesize("hello", "default", 180, 1.0))
+    assert not cached
+    assert name == f"tts_{cache_key('hello', 'default', 180, 1.0)}.mp3"
+    assert (tmp_path / name).read_text() == "hello"
+
+    assert asyncio.run(service.synthesize("hello", "default", 180, 1.0)) == (name, True)
+    assert engine.renders == 1
+    assert service.stats()["hits"] == 1 and service.stats()["misses"] == 1
+
+
+def test_concurrent_identical_requests_render_once(tmp_path, engine):
+    service = _service(tmp_path)
+
+    async def both():
+        return await asyncio.gather(*(service.synthesize("same", "default", 180, 1.0) for _ in range(2)))
+
+    first, second = asyncio.run(both())
+    assert first[0] == second[0]
+    assert engine.renders == 1
+
+
+def test_least_recently_used_audio_is_deleted(tmp_path, engine):
+    service = _service(tmp_path, max_bytes=20)  # two 8-byte files fit
+    names = [asyncio.run(service.synthesize(f"text {i:03d}", "default", 180, 1.0))[0] for i in range(3)]
+
+    assert not (tmp_path / names[0]).exists()
+    assert (tmp_path / names[2]).exists()
+    assert service.stats()["evictions"] == 1
+
+    # A restart picks up the files that are still cached
+    assert TTSService(tmp_path).stats()["files"] == 2
+
+
+def test_missing_file_is_rendered_again(tmp_path, engine):
+    service = _service(tmp_path)
+    name, _ = asyncio.run(service.synthesize("gone", "default", 180, 1.0))
+    (tmp_path / name).unlink()
+
+    assert asyncio.run(service.synthesize("gone", "default", 180, 1.0)) == (name, False)
+    assert engine.renders == 2
@@ -0,0 +1,194 @@
+"""
+Text-to-speech synthesis and audio cache for LlamaDoc AI
+
+pyttsx3 engines are slow to initialise and runAndWait() blocks for the
+whole synthesis, so speech is rendered in a small process pool whose
+workers each create their engine once and keep it. Rendered audio is
+content-addressed: the file name is a hash of (text, voice_type, rate,
+volume), so reading the same answer aloud again is served straight from
+uploads/audio. Cached files are capped at TTS_CACHE_MAX_BYTES and the least
+recently used ones are deleted first. Only tts_* files are managed; other
+audio (recorded questions) is left alone.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+TTS_WORKERS = int(os.environ.get("TTS_WORKERS", "2"))  # synthesis processes, each with its own engine
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+TTS_FILE_PREFIX = "tts_"
+TTS_MAX_RATE = 500
+
+_engine = None
+
+
+def _init_engine() -> None:
+    """Pool initializer: one engine per worker process, reused for every request"""
+    global _engine
+    import pyttsx3
+    _engine = pyttsx3.init()
+
+
+def _synthesize(text: str, voice_type: str, rate: int, volume: float, path: str) -> int:
+    """Render `text` to `path` in a worker process; returns the file size"""
+    voices = _engine.getProperty("voices")
+    # Set voice type
+    if voice_type == "female" and len(voices) > 1:
+        _engine.setProperty("voice", voices[1].id)
+    elif voices:
+        _engine.setProperty("voice", voices[0].id)
+    _engine.setProperty("rate", rate)
+    _engine.setProperty("volume", volume)
+
+    # Render to a temporary name so a half-written file is never served
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    _engine.save_to_file(text, tmp_path)
+    _engine.runAndWait()
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def tts_available() -> bool:
+    try:
+        import pyttsx3  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def normalize_settings(voice_type, rate, volume) -> Tuple[str, int, float]:
+    """Validate request settings; raises ValueError. Equal settings hash equally (180 == "180")"""
+    voice_type = str(voice_type or "default")
+    try:
+        rate = int(rate)
+        volume = round(float(volume), 2)
+    except (TypeError, ValueError):
+        raise ValueError("rate must be an integer and volume a number")
+    if not 1 <= rate <= TTS_MAX_RATE:
+        raise ValueError(f"rate must be between 1 and {TTS_MAX_RATE}")
+    if not 0.0 <= volume <= 1.0:
+        raise ValueError("volume must be between 0 and 1")
+    return voice_type, rate, volume
+
+
+def cache_key(text: str, voice_type: str, rate: int, volume: float) -> str:
+    payload = json.dumps([text, voice_type, rate, volume], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSService:
+    """
+    Content-addressed TTS cache in front of a pool of synthesis processes.
+    Identical requests that arrive while the audio is being rendered wait
+    for the same synthesis instead of starting another.
+    """
+
+    def __init__(self, audio_dir: Path, max_bytes: int = TTS_CACHE_MAX_BYTES,
+                 workers: int = TTS_WORKERS):
+        self.audio_dir = Path(audio_dir)
+        self.max_bytes = max_bytes
+        self.workers = max(1, workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._files: "OrderedDict[str, int]" = OrderedDict()  # cache key -> bytes, least recent first
+        self._bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._scan()
+
+    def _path(self, key: str) -> Path:
+        return self.audio_dir / f"{TTS_FILE_PREFIX}{key}.mp3"
+
+    def _scan(self) -> None:
+        """Index audio cached by earlier runs, oldest access first"""
+        self.audio_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        for path in self.audio_dir.glob(f"{TTS_FILE_PREFIX}*.mp3"):
+            stat = path.stat()
+            files.append((stat.st_mtime, path.stem[len(TTS_FILE_PREFIX):], stat.st_size))
+        for _, key, size in sorted(files):
+            self._files[key] = size
+            self._bytes += size
+
+    def start(self) -> None:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_engine)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def synthesize(self, text: str, voice_type: str, rate: int, volume: float) -> Tuple[str, bool]:
+        """Return (audio file name in audio_dir, served from cache)"""
+        key = cache_key(text, voice_type, rate, volume)
+        path = self._path(key)
+        with self._lock:
+            if key in self._files and path.exists():
+                self._files.move_to_end(key)
+                self.hits += 1
+                hit = True
+            else:
+                # Listed but deleted from disk: forget it and render again
+                self._bytes -= self._files.pop(key, 0)
+                hit = False
+        if hit:
+            # mtime records the last use, so LRU order survives a restart
+            os.utime(path)
+            return path.name, True
+
+        pending = self._inflight.get(key)
+        if pending is None:
+            self.start()
+            self.misses += 1
+            loop = asyncio.get_running_loop()
+            pending = loop.run_in_executor(self._pool, _synthesize, text, voice_type, rate, volume, str(path))
+            self._inflight[key] = pending
+            try:
+                size = await pending
+            except BrokenProcessPool:
+                # A worker died (or its engine failed to initialise): start a fresh pool next time
+                self.shutdown()
+                raise RuntimeError("TTS worker failed; check that a speech engine is installed")
+            finally:
+                self._inflight.pop(key, None)
+            self._add(key, size)
+        else:
+            await pending
+        return path.name, False
+
+    def _add(self, key: str, size: int) -> None:
+        with self._lock:
+            self._bytes += size - self._files.get(key, 0)
+            self._files[key] = size
+            self._files.move_to_end(key)
+            while self._bytes > self.max_bytes and len(self._files) > 1:
+                old_key, old_size = self._files.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+                try:
+                    self._path(old_key).unlink()
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "files": len(self._files),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "in_flight": len(self._inflight),
+            }